@@ -1,17 +1,25 @@
 import json
 from collections import OrderedDict
 from datetime import date, datetime, timedelta
+from hashlib import sha1
 
-from flask import abort, Blueprint, render_template, request
+import numpy
+
+from django.db.models import Count, F, Max, Min
+from django.db.models.functions import TruncDate
+from flask import abort, Blueprint, render_template, request, Response
 
 from config.constants import (ALL_DATA_STREAMS, complete_data_stream_dict,
     processed_data_stream_dict, REDUCED_API_TIME_FORMAT)
-from database.data_access_models import ChunkRegistry, PipelineRegistry
+from database.data_access_models import (ChunkStats, DailyDataVolume, display_pipeline_value,
+    PipelineSummaryValue)
+from database.routers import read_replica
 from database.study_models import (DashboardColorSetting, DashboardGradient, DashboardInflection,
     Study)
 from database.user_models import Participant
 from libs.admin_authentication import (authenticate_researcher_study_access,
     get_researcher_allowed_studies, researcher_is_an_admin)
+from libs.dashboard_grid import build_grid
 
 dashboard_api = Blueprint('dashboard_api', __name__)
 
@@ -109,40 +117,34 @@ def get_data_for_dashboard_datastream_display(study_id, data_stream):
 
     # --------------------- decide whether data is in Processed DB or Bytes DB -----------------------------
     if data_stream in ALL_DATA_STREAMS:
-        first_day, last_day = dashboard_chunkregistry_date_query(study_id, data_stream)
+        first_day, last_day = dashboard_data_volume_date_query(study_id, data_stream)
         if first_day is not None:
-            stream_data = OrderedDict(
-                (
-                    participant.patient_id,
-                    dashboard_chunkregistry_query(participant.id, data_stream=data_stream)
-                )
-                for participant in participant_objects
-            )
             unique_dates, _, _ = get_unique_dates(start, end, first_day, last_day)
             next_url, past_url = create_next_past_urls(first_day, last_day, start=start, end=end)
 
             # get the byte streams per date for each patient for a specific data stream for those dates
+            daily_bytes = dashboard_data_volume_query(unique_dates, study_id=study_id, data_stream=data_stream)
             byte_streams = OrderedDict(
                 (
                     participant.patient_id,
-                    [get_bytes_participant_match(stream_data[participant.patient_id], date) for date in unique_dates]
+                    [daily_bytes.get((participant.id, data_stream, date)) for date in unique_dates]
                 )
                 for participant in participant_objects
             )
             # check if there is data to display
             data_exists = len([data for patient in byte_streams for data in byte_streams[patient] if data is not None]) > 0
     else:
-        start, end = extract_date_args_from_request()
-        first_day, last_day, stream_data = parse_processed_data(study_id, participant_objects, data_stream)
+        first_day, last_day = dashboard_pipeline_date_query(study_id=study_id, data_stream=data_stream)
         if first_day is not None:
             unique_dates, _, _ = get_unique_dates(start, end, first_day, last_day)
             next_url, past_url = create_next_past_urls(first_day, last_day, start=start, end=end)
 
-            # get the byte streams per date for each patient for a specific data stream for those dates
+            # get the processed data per date for each patient for a specific data stream for those dates
+            daily_values = dashboard_pipeline_query(unique_dates, study_id=study_id, data_stream=data_stream)
             byte_streams = OrderedDict(
                 (
                     participant.patient_id,
-                    [get_bytes_processed_data_match(stream_data[participant.patient_id], date) for date in unique_dates]
+                    [daily_values.get((participant.id, data_stream, date)) for date in unique_dates]
                 )
                 for participant in participant_objects
             )
@@ -186,7 +188,6 @@ def get_data_for_dashboard_patient_display(study_id, patient_id):
     study = get_study_or_404(study_id)
     participant = get_participant(patient_id, study_id)
     start, end = extract_date_args_from_request()
-    chunks = dashboard_chunkregistry_query(participant.id)
     patient_ids = list(Participant.objects
                        .filter(study=study_id)
                        .exclude(patient_id=patient_id)
@@ -194,29 +195,27 @@ def get_data_for_dashboard_patient_display(study_id, patient_id):
                        )
 
     # ----------------- dates for bytes data streams -----------------------
-    if chunks:
-        first_day, last_day = dashboard_chunkregistry_date_query(study_id)
-        _, first_date_data_entry, last_date_data_entry = \
-            get_unique_dates(start, end, first_day, last_day, chunks)
-    else:
-        last_date_data_entry = first_date_data_entry = None
+    first_day, _ = dashboard_data_volume_date_query(study_id)
+    first_date_data_entry, last_date_data_entry = dashboard_participant_date_query(participant.id, first_day)
+    has_chunks = first_date_data_entry is not None
     # --------------- dates for  processed data streams -------------------
-    # all_data is a list of dicts [{"time_bin": , "stream": , "processed_data": }...]
-    processed_first_date_data_entry, processed_last_date_data_entry, all_data = parse_patient_processed_data(study_id, participant)
+    processed_first_date_data_entry, processed_last_date_data_entry = \
+        dashboard_pipeline_date_query(participant_id=participant.id)
+    has_processed_data = processed_first_date_data_entry is not None
 
     # ------- decide the first date of data entry from processed AND bytes data as well as put the data together ------
     # but only if there are both processed and bytes data
-    if chunks and all_data:
+    if has_chunks and has_processed_data:
         if (processed_first_date_data_entry - first_date_data_entry).days < 0:
             first_date_data_entry = processed_first_date_data_entry
         if (processed_last_date_data_entry - last_date_data_entry).days < 0:
             last_date_data_entry = processed_last_date_data_entry
-    if all_data and not chunks:
+    if has_processed_data and not has_chunks:
         first_date_data_entry = processed_first_date_data_entry
         last_date_data_entry = processed_last_date_data_entry
 
     # ---------------------- get next/past urls and unique dates, as long as data has been entered -------------------
-    if chunks or all_data:
+    if has_chunks or has_processed_data:
         next_url, past_url = create_next_past_urls(first_date_data_entry, last_date_data_entry, start=start, end=end)
         unique_dates, _, _ = get_unique_dates(start, end, first_date_data_entry, last_date_data_entry)
     else:
@@ -224,35 +223,37 @@ def get_data_for_dashboard_patient_display(study_id, patient_id):
 
     # --------------------- get all the data using the correct unique dates from both data sets ----------------------
         # get the byte data for the dates that have data collected in that week
-    if all_data:
+    if has_processed_data:
+        daily_values = dashboard_pipeline_query(unique_dates, participant_id=participant.id)
         processed_byte_streams = OrderedDict(
             (stream, [
-                get_bytes_patient_processed_match(all_data, date, stream) for date in unique_dates
+                daily_values.get((participant.id, stream, date)) for date in unique_dates
             ]) for stream in processed_data_stream_dict
         )
     else:
         processed_byte_streams = None
 
 
-    if chunks:
+    if has_chunks:
+        daily_bytes = dashboard_data_volume_query(unique_dates, participant_id=participant.id)
         byte_streams = OrderedDict(
             (stream, [
-                get_bytes_data_stream_match(chunks, date, stream) for date in unique_dates
+                daily_bytes.get((participant.id, stream, date)) for date in unique_dates
             ]) for stream in ALL_DATA_STREAMS
         )
     else:
         byte_streams = None
 
-    if chunks and all_data:
+    if has_chunks and has_processed_data:
         byte_streams.update(processed_byte_streams)
-    elif all_data and not chunks:
+    elif has_processed_data and not has_chunks:
         byte_streams = OrderedDict(
             (stream, [
                 None for date in unique_dates
             ]) for stream in ALL_DATA_STREAMS
         )
         byte_streams.update(processed_byte_streams)
-    elif chunks and not all_data:
+    elif has_chunks and not has_processed_data:
         processed_byte_streams = OrderedDict(
             (stream, [
                 None for date in unique_dates
@@ -288,79 +289,121 @@ def get_data_for_dashboard_patient_display(study_id, patient_id):
     )
 
 
-def parse_processed_data(study_id, participant_objects, data_stream):
-    """
-    get a list of dicts (pipeline_chunks) of the patient's data and extract the data for the data stream we want
-    stream_data = OrderedDict(participant.patient_id: {"time_bin":time_bin, "processed_data": processed_data}, ...)
-    this structure is similar to the stream_data structure in get_data_for_dashboard_data_stream_display
-    since they perform similar functions
-    """
-    first = True
-    data_exists = False
-    first_day = None
-    last_day = None
-    stream_data = OrderedDict()
-    for participant in participant_objects:
-        pipeline_chunks = dashboard_pipelineregistry_query(study_id, participant.id)
-        list_of_dicts_data = []
-        if pipeline_chunks is not None:
-            for chunk in pipeline_chunks:
-                if data_stream in chunk and "day" in chunk and chunk[data_stream] != "NA":
-                    time_bin = datetime.strptime(chunk["day"], REDUCED_API_TIME_FORMAT).date()
-                    data_exists = True
-                    if first:
-                        first_day = time_bin
-                        last_day = time_bin
-                        first = False
-                    else:
-                        if (time_bin - first_day).days < 0:
-                            first_day = time_bin
-                        elif (time_bin - last_day).days > 0:
-                            last_day = time_bin
-                    # check to see if the data should be a float or an int
-                    if chunk[data_stream].find(".") == -1:
-                        processed_data = int(chunk[data_stream])
-                    else:
-                        processed_data = float(chunk[data_stream])
-                    list_of_dicts_data.append({"time_bin": time_bin, "processed_data": processed_data})
-
-        stream_data[participant.patient_id] = None if not data_exists else list_of_dicts_data
-        data_exists = False  # you need to reset this
-    return first_day, last_day, stream_data
-
-
-def parse_patient_processed_data(study_id, participant):
-    """
-    Create a list of dicts of processed data for one patient.
-    [{"time_bin": , "processed_data": , "data_stream": ,}...]
-    if there is no data for a patient, first_day and last_day will be None, and all_data will be an empty list
-    """
-    first = True
-    first_day = None
-    last_day = None
-    pipeline_chunks = dashboard_pipelineregistry_query(study_id, participant.id)
-    all_data = []
-    if pipeline_chunks is not None:
-        for chunk in pipeline_chunks:
-            if "day" in chunk:
-                time_bin = datetime.strptime(chunk["day"], REDUCED_API_TIME_FORMAT).date()
-                if first:
-                    first_day = time_bin
-                    last_day = time_bin
-                    first = False
-                else:
-                    if (time_bin - first_day).days < 0:
-                        first_day = time_bin
-                    elif (time_bin - last_day).days > 0:
-                        last_day = time_bin
-                for stream_key in chunk:
-                    if stream_key in processed_data_stream_dict and chunk[stream_key] != "NA":
-                        if chunk[stream_key].find(".") == -1:
-                            processed_data = int(chunk[stream_key])
-                        else:
-                            processed_data = float(chunk[stream_key])
-                        all_data.append({"time_bin": time_bin, "processed_data": processed_data, "data_stream": stream_key})
-    return first_day, last_day, all_data
+@dashboard_api.route("/dashboard/<string:study_id>/data_stream/<string:data_stream>/grid", methods=["GET"])
+@authenticate_researcher_study_access
+def get_dashboard_datastream_grid(study_id, data_stream):
+    """ The bytes of data (or the values of a processed data stream) of a data stream per
+    participant per day, as JSON, see dashboard_grid_response.  Takes the same start and end
+    parameters as the data stream dashboard and covers the same days. """
+    get_study_or_404(study_id)
+    if data_stream in ALL_DATA_STREAMS:
+        first_day, last_day = dashboard_data_volume_date_query(study_id, data_stream)
+        values = DailyDataVolume.objects.filter(study_id=study_id, data_type=data_stream)
+        value_field = "bytes"
+    elif data_stream in processed_data_stream_dict:
+        first_day, last_day = dashboard_pipeline_date_query(study_id=study_id, data_stream=data_stream)
+        values = PipelineSummaryValue.objects.filter(study_id=study_id, data_stream=data_stream)
+        value_field = "value"
+    else:
+        return abort(404)
+
+    start, end = extract_date_args_from_request()
+    unique_dates = get_unique_dates(start, end, first_day, last_day)[0] if first_day is not None else []
+    participants = list(Participant.objects.filter(study=study_id).order_by("patient_id").values_list("pk", "patient_id"))
+    return dashboard_grid_response(
+        values,
+        unique_dates,
+        "participant_id",
+        [pk for pk, _ in participants],
+        [patient_id for _, patient_id in participants],
+        value_field=value_field,
+    )
+
+
+@dashboard_api.route("/dashboard/<string:study_id>/data_stream/<string:data_stream>/samples", methods=["GET"])
+@authenticate_researcher_study_access
+def get_dashboard_datastream_samples(study_id, data_stream):
+    """ The number of samples (rows) of a data stream per participant per day, from the ChunkStats
+    of the data stream's files, as JSON, see dashboard_grid_response.  Covers the same days as the
+    data stream grid. """
+    get_study_or_404(study_id)
+    if data_stream not in ALL_DATA_STREAMS:
+        return abort(404)
+    first_day, last_day = dashboard_data_volume_date_query(study_id, data_stream)
+    start, end = extract_date_args_from_request()
+    unique_dates = get_unique_dates(start, end, first_day, last_day)[0] if first_day is not None else []
+    participants = list(Participant.objects.filter(study=study_id).order_by("patient_id").values_list("pk", "patient_id"))
+    return dashboard_grid_response(
+        ChunkStats.objects.filter(chunk__study_id=study_id, chunk__data_type=data_stream).annotate(
+            participant_id=F("chunk__participant_id"), date=TruncDate("chunk__time_bin")
+        ),
+        unique_dates,
+        "participant_id",
+        [pk for pk, _ in participants],
+        [patient_id for _, patient_id in participants],
+        value_field="sample_count",
+    )
+
+
+@dashboard_api.route("/dashboard/<string:study_id>/patient/<string:patient_id>/grid", methods=["GET"])
+@authenticate_researcher_study_access
+def get_dashboard_patient_grid(study_id, patient_id):
+    """ The bytes of data of a participant per data stream per day, as JSON, see
+    dashboard_grid_response.  Takes the same start and end parameters as the participant
+    dashboard. """
+    participant = get_participant(patient_id, study_id)
+    start, end = extract_date_args_from_request()
+    first_day, _ = dashboard_data_volume_date_query(study_id)
+    first_date_data_entry, last_date_data_entry = dashboard_participant_date_query(participant.id, first_day)
+    if first_date_data_entry is not None:
+        unique_dates, _, _ = get_unique_dates(start, end, first_date_data_entry, last_date_data_entry)
+    else:
+        unique_dates = []
+    return dashboard_grid_response(
+        DailyDataVolume.objects.filter(participant_id=participant.id),
+        unique_dates,
+        "data_type",
+        ALL_DATA_STREAMS,
+        ALL_DATA_STREAMS,
+    )
+
+
+@read_replica()
+def dashboard_grid_response(values, unique_dates, row_field, row_keys, row_labels, value_field="bytes"):
+    """ A JSON response of the value_field of a QuerySet with a date field (DailyDataVolumes,
+    PipelineSummaryValues or ChunkStats annotated with a date) on the dates, with a row per row key
+    (the values of row_field) and a column per date:
+        {"rows": row_labels, "dates": ["2020-01-01", ...], "values": [[value or null, ...], ...]}
+    The response has an ETag and Last-Modified derived from the rows, requests with If-None-Match
+    or If-Modified-Since get a 304 (without a query for the grid) if nothing has changed. """
+    if unique_dates:
+        values = values.filter(date__gte=min(unique_dates), date__lte=max(unique_dates))
+    else:
+        values = values.none()
+    dates = [day.isoformat() for day in unique_dates]
+
+    state = values.aggregate(last_updated=Max("last_updated"), count=Count("id"))
+    response = Response(mimetype="application/json")
+    # browsers check with the server every time, and get a 304 if nothing has changed.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.set_etag(sha1(json.dumps(
+        [row_labels, dates, str(state["last_updated"]), state["count"]]
+    ).encode()).hexdigest())
+    if state["last_updated"] is not None:
+        response.last_modified = state["last_updated"]
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    grid = build_grid(
+        row_keys,
+        unique_dates,
+        list(values.values_list(row_field, "date", value_field)),
+        dtype=float if value_field == "value" else numpy.int64,
+    )
+    response.set_data(json.dumps({"rows": row_labels, "dates": dates, "values": grid}, separators=(",", ":")))
+    return response
 
 
 def set_default_settings_post_request(study, data_stream):
@@ -431,19 +474,10 @@ def set_default_settings_post_request(study, data_stream):
     return color_low_range, color_high_range, all_flags_list
 
 
-def get_unique_dates(start, end, first_day, last_day, chunks=None):
+def get_unique_dates(start, end, first_day, last_day):
     """ create a list of all the unique days in which data was recorded for this study """
     first_date_data_entry = None
     last_date_data_entry = None
-    if chunks:
-        all_dates = sorted(
-            chunk["time_bin"].date() for chunk in chunks if chunk["time_bin"].date() >= first_day
-            # must be >= first day bc there are some point for 1970 that get filtered out bc obv are garbage
-        )
-
-        # create a list of all of the valid days in this study
-        first_date_data_entry = all_dates[0]
-        last_date_data_entry = all_dates[-1]
 
     # validate start date is before end date
     if (start and end) and (end.date() - start.date()).days < 0:
@@ -510,112 +544,71 @@ def create_next_past_urls(first_day, last_day, start=None, end=None):
     return next_url, past_url
 
 
-def get_bytes_data_stream_match(chunks, date, stream):
-    """ returns byte value for correct chunk based on data stream and type comparisons"""
-    all_bytes = None
-    for chunk in chunks:
-        if (chunk["time_bin"]).date() == date and chunk["data_stream"] == stream:
-            if all_bytes is None:
-                all_bytes = chunk.get("bytes", 0)
-            else:
-                all_bytes += chunk.get("bytes", 0)
-    if all_bytes is not None:
-        return all_bytes
-    else:
-        return None
-
-
-def get_bytes_participant_match(stream_data, date):
-    all_bytes = None
-    for data_point in stream_data:
-        if (data_point["time_bin"]).date() == date:
-            if all_bytes is None:
-                all_bytes = data_point.get("bytes", 0)
-            else:
-                all_bytes += data_point.get("bytes", 0)
-    if all_bytes is not None:
-        return all_bytes
-    else:
-        return None
-
-
-def get_bytes_processed_data_match(participant_data, date):
-    # participant_data is a list of dicts which hold {time_bin: , processed_data: }
-    # there should only ever be one data_point corresponding to a specific date per patient
-    # if no data exists, return None -- if the participant_data object is none, there is no data for this data
-    # stream for this participant
-    if participant_data is not None:
-        for data_point in participant_data:
-            if(data_point["time_bin"]) == date:
-                return data_point["processed_data"]
-    return None
-
-
-def get_bytes_patient_processed_match(participant_data, date, stream):
-    # participant_data is a list of dicts which hold {time_bin: , processed_data: , stream:, }
-    # there should only ever be one data_point corresponding to a specific date per patient
-    # if no data exists, return None -- if the participant_data object is none, there is no data for this data
-    # stream for this participant
-    if participant_data is not None:
-        for data_point in participant_data:
-            if (data_point["time_bin"]) == date and data_point["data_stream"] == stream:
-                return data_point["processed_data"]
-    return None
-
-
-def dashboard_chunkregistry_date_query(study_id, data_stream=None):
+def dashboard_data_volume_date_query(study_id, data_stream=None):
     """ gets the first and last days in the study excluding 1/1/1970 bc that is obviously an error and makes
     the frontend annoying to use """
     kwargs = {"study_id": study_id}
     if data_stream:
         kwargs["data_type"] = data_stream
-    first = ChunkRegistry.objects.filter(**kwargs).exclude(time_bin__date=date(1970, 1, 1)).order_by("time_bin").values_list("time_bin", flat=True).first()
-    last = ChunkRegistry.objects.filter(**kwargs).order_by("time_bin").values_list("time_bin", flat=True).last()
+    first = DailyDataVolume.objects.filter(**kwargs).exclude(date=date(1970, 1, 1)).order_by("date").values_list("date", flat=True).first()
+    last = DailyDataVolume.objects.filter(**kwargs).order_by("date").values_list("date", flat=True).last()
     if first is None or last is None:
         return None, None
     else:
-        return first.date(), last.date()
+        return first, last
 
 
-def dashboard_chunkregistry_query(participant_id, data_stream=None, start=None, end=None):
-    """ Queries ChunkRegistry based on the provided parameters and returns a list of dictionaries
-    with 3 keys: bytes, data_stream, and time_bin. """
-    kwargs = {"participant__id": participant_id}
-    if start:
-        kwargs["time_bin__gte"] = start
-    if end:
-        kwargs["time_bin__lte"] = end
-    if data_stream:
-        kwargs["data_type"] = data_stream
-
-    # on a (good) test device running on sqlite, for 12,200 chunks, this takes ~135ms
-    # sticking the query_set directly into a list is a slight speedup. (We need it all in memory anyway.)
-    chunks = list(
-        ChunkRegistry.objects.filter(**kwargs)
-        .extra(
-            select={
-                # rename the data_type and file_size fields in the db query itself for speed
-                'data_stream': 'data_type',
-                'bytes': 'file_size',
-            }
-        ).values("bytes", "data_stream", "time_bin")
+def dashboard_participant_date_query(participant_id, first_day):
+    """ gets the first (on or after first_day, see dashboard_data_volume_date_query) and last days
+    with data of a participant, or None, None if there are none. """
+    if first_day is None:
+        return None, None
+    dates = DailyDataVolume.objects.filter(participant_id=participant_id, date__gte=first_day).aggregate(
+        first=Min("date"), last=Max("date")
     )
-
-    return chunks
-
-
-def dashboard_pipelineregistry_query(study_id, participant_id):
-    """ Queries Pipeline based on the provided parameters and returns a list of dicts with
-    an id (which is ignored), a "day", and a bunch of strings which are data streams """
-    # pipeline_chunks looks like this: [{day: 3/4/4, "data_stream1": 36634, "data_stream2": 2525}, ... ]
-    pipeline_data = PipelineRegistry.objects.filter(study_id=study_id, participant__id=participant_id).order_by(
-        "uploaded_at").last()
-    if pipeline_data is not None:
-        pipeline_chunks = json.loads(json.dumps(pipeline_data.processed_data)) # I feel like this shouldn't work but idk
-        if pipeline_chunks:
-            return pipeline_chunks
-
-    return None
+    return dates["first"], dates["last"]
+
+
+@read_replica()
+def dashboard_data_volume_query(unique_dates, **kwargs):
+    """ Returns the bytes of data on each of the dates as a dictionary of
+    (participant_id, data_stream, date): bytes, for either a study's data stream (study_id and
+    data_stream kwargs) or a participant (participant_id kwarg).  Dates without data are not in
+    the dictionary. """
+    if not unique_dates:
+        return {}
+    filters = {"date__gte": min(unique_dates), "date__lte": max(unique_dates)}
+    if "study_id" in kwargs:
+        filters.update(study_id=kwargs["study_id"], data_type=kwargs["data_stream"])
+    else:
+        filters.update(participant_id=kwargs["participant_id"])
+
+    return {
+        (participant_id, data_stream, day): byte_count
+        for participant_id, data_stream, day, byte_count in
+        DailyDataVolume.objects.filter(**filters).values_list("participant_id", "data_type", "date", "bytes")
+    }
+
+
+def dashboard_pipeline_date_query(**kwargs):
+    """ gets the first and last days with processed data of either a study's data stream (study_id
+    and data_stream kwargs) or a participant (participant_id kwarg), or None, None if there are
+    none. """
+    dates = PipelineSummaryValue.objects.filter(**kwargs).aggregate(first=Min("date"), last=Max("date"))
+    return dates["first"], dates["last"]
+
+
+@read_replica()
+def dashboard_pipeline_query(unique_dates, **kwargs):
+    """ As dashboard_data_volume_query, but the values of processed data streams. """
+    if not unique_dates:
+        return {}
+    return {
+        (participant_id, data_stream, day): display_pipeline_value(value)
+        for participant_id, data_stream, day, value in PipelineSummaryValue.objects.filter(
+            date__gte=min(unique_dates), date__lte=max(unique_dates), **kwargs
+        ).values_list("participant_id", "data_stream", "date", "value")
+    }
 
 
 def extract_date_args_from_request():
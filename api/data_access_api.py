@@ -1,20 +1,35 @@
-from multiprocessing.pool import ThreadPool
-from zipfile import ZipFile, ZIP_STORED
+import calendar
+from functools import partial
+from itertools import islice
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from datetime import datetime
+from django.db import transaction
 from flask import Blueprint, request, abort, json, Response
 
 # noinspection PyUnresolvedReferences
 from config import load_django
 
-from config.constants import (API_TIME_FORMAT, VOICE_RECORDING, ALL_DATA_STREAMS,
-    SURVEY_ANSWERS, SURVEY_TIMINGS, IMAGE_FILE)
+from config.constants import (API_TIME_FORMAT, ALL_DATA_STREAMS, CHUNKABLE_FILES, CONCURRENT_DOWNLOAD_OPS,
+    DOWNLOAD_COMPRESSION_LEVEL, DOWNLOAD_PREFETCH_BYTES, MAX_CONCURRENT_DOWNLOAD_OPS, RESAMPLABLE_FILES,
+    S3_STREAM_BLOCK_SIZE, STREAMING_DOWNLOAD_THRESHOLD)
 from database.models import is_object_id
-from database.data_access_models import ChunkRegistry, PipelineRegistry
+from database.routers import read_database
+from database.data_access_models import ChunkRegistry, PipelineRegistry, PipelineSummaryValue
 from database.study_models import Study
 from database.user_models import Participant, Researcher, StudyRelation
-from libs.s3 import s3_retrieve, s3_upload
-from libs.streaming_bytes_io import StreamingBytesIO
+from libs.csv_slicing import CsvSlice, slice_csv
+from libs.db_connections import DatabaseThreadPool
+from libs.export_bundles import BundleSplicer, determine_file_name, query_export_bundles
+from libs.prefetch import BudgetedPrefetcher
+from libs.registry import (decode_registry, InvalidRegistryError, sorted_registry_items,
+    unregistered_chunks)
+from libs.resampled_chunks import retrieve_resampled
+from libs.resampling import AGGREGATE, Resample, ResampleError, validate_resample
+from libs.s3 import s3_retrieve, s3_retrieve_stream, s3_upload_stream
+from libs.streaming_bytes_io import StreamingBytesIO, UnseekableStreamingBytesIO
+from libs.streaming_exports import CsvStream, TarStream
+from libs.streaming_zip import prepare_zip_entry, PreparedZipEntry, SplicingZipFile
 
 from database.data_access_models import PipelineUpload, InvalidUploadParameterError, \
     PipelineUploadTags
@@ -28,6 +43,28 @@ data_access_api = Blueprint('data_access_api', __name__)
 
 class DummyError(Exception): pass
 
+# the ChunkRegistry fields used to construct data downloads.
+CHUNK_FIELDS = ["pk", "participant_id", "data_type", "chunk_path", "time_bin", "chunk_hash",
+                "participant__patient_id", "study_id", "study__object_id", "survey_id",
+                "survey__object_id", "file_size", "plaintext_size", "last_updated"]
+
+# the ChunkRegistry and ChunkStats fields of data coverage.
+COVERAGE_FIELDS = ["pk", "participant__patient_id", "data_type", "time_bin", "stats__sample_count",
+                   "stats__first_timestamp", "stats__last_timestamp", "stats__sampling_rate",
+                   "stats__max_gap"]
+
+# manifest pages and batch downloads
+MANIFEST_PAGE_SIZE = 1000
+MAX_MANIFEST_PAGE_SIZE = 10000
+MAX_BATCH_CHUNKS = 1000
+# the number of ChunkRegistries read per database query when iterating over a data download's chunks.
+CHUNK_QUERY_PAGE_SIZE = 5000
+
+# data download formats
+ZIP_FORMAT = "zip"
+TAR_FORMAT = "tar"
+CSV_STREAM_FORMAT = "csvstream"
+
 #########################################################################################
 
 def get_and_validate_study_id(chunked_download=False):
@@ -162,12 +199,16 @@ def get_data():
     JSON blobs: data streams, users - default to all
     Strings: date-start, date-end - format as "YYYY-MM-DDThh:mm:ss"
     optional: top-up = a file (registry.dat)
+    optional: compression = "deflate" to DEFLATE compress the files in the zip, default "none"
+    optional: format = "zip" (the default), "tar", or "csvstream", see parse_export_format
+    optional: precise_start, precise_end, columns = only these rows and columns, see parse_csv_slice
+    optional: resample, resample_method = resample high frequency data streams, see parse_resample
     cases handled:
         missing creds or study, invalid researcher or study, researcher does not have access
         researcher creds are invalid
         (Flask automatically returns a 400 response if a parameter is accessed
         but does not exist in request.values() )
-    Returns a zip file of all data files found by the query. """
+    Returns a zip (or tar, or csv) file of all data files found by the query. """
 
     # uncomment the following line when doing a reindex
     # return abort(503)
@@ -175,61 +216,363 @@ def get_data():
     study = get_and_validate_study_id(chunked_download=True)
     get_and_validate_researcher(study)
 
-    query = {}
-    determine_data_streams_for_db_query(query)  # select data streams
-    determine_users_for_db_query(query)  # select users
-    determine_time_range_for_db_query(query)  # construct time ranges
-
+    compress = parse_compression()
+    export_format = parse_export_format()
+    csv_slice = parse_csv_slice()
+    resample = parse_resample()
+    # a registry of partial (or resampled) files would make later downloads skip the original files.
+    construct_registry = 'web_form' not in request.values and csv_slice is None and resample is None
     # Do query (this is actually a generator)
-    if "registry" in request.values:
-        get_these_files = handle_database_query(study.pk, query, registry=parse_registry(request.values["registry"]))
-    else:
-        get_these_files = handle_database_query(study.pk, query, registry=None)
+    query = parse_chunk_query()
+    get_these_files = query_chunks_from_request(study, query)
+
+    if export_format == CSV_STREAM_FORMAT:
+        return Response(
+            csv_stream_generator(get_these_files, csv_slice=csv_slice, resample=resample), mimetype="text/csv"
+        )
+    if export_format == TAR_FORMAT:
+        headers = {'Content-Disposition': 'attachment; filename="data.tar"'} if 'web_form' in request.values else {}
+        return Response(
+            tar_generator(get_these_files, construct_registry=construct_registry, csv_slice=csv_slice,
+                          resample=resample),
+            mimetype="application/x-tar",
+            headers=headers,
+        )
+
+    # sliced and resampled files are not in export bundles.
+    export_bundles = None
+    if csv_slice is None and resample is None:
+        export_bundles = query_export_bundles(study.pk, **query)
 
     # If the request is from the web form we need to indicate that it is an attachment,
     # and don't want to create a registry file.
     # Oddly, it is the presence of  mimetype=zip that causes the streaming response to actually stream.
     if 'web_form' in request.values:
         return Response(
-            zip_generator(get_these_files, construct_registry=False),
+            zip_generator(get_these_files, construct_registry=False, compress=compress, csv_slice=csv_slice,
+                          resample=resample, export_bundles=export_bundles),
             mimetype="zip",
             headers={'Content-Disposition': 'attachment; filename="data.zip"'}
         )
     else:
         return Response(
-                zip_generator(get_these_files, construct_registry=True),
+                zip_generator(get_these_files, construct_registry=construct_registry, compress=compress,
+                              csv_slice=csv_slice, resample=resample, export_bundles=export_bundles),
                 mimetype="zip",
         )
 
 
+@data_access_api.route("/get-data-manifest/v1", methods=['POST', "GET"])
+def get_data_manifest():
+    """ Takes the same parameters as /get-data/v1 (including the registry), plus optional page_size
+    and cursor parameters.  Returns one page of the files that /get-data/v1 would return, ordered
+    by chunk_path, as JSON:
+        {"chunks": [{"chunk_id", "chunk_path", "chunk_hash", "file_size", "file_name"}, ...],
+         "next_cursor": pass this as the cursor to get the next page, null on the last page}
+    file_name is the path of the file in a /get-data/v1 zip file, file_size is the size of the
+    file as it is downloaded, it may be null for old files.  The files are then downloaded (in parallel) with /get-data-chunk/v1 or
+    /get-data-batch/v1. """
+    study = get_and_validate_study_id(chunked_download=True)
+    get_and_validate_researcher(study)
+
+    try:
+        page_size = int(request.values.get("page_size", MANIFEST_PAGE_SIZE))
+    except ValueError:
+        return abort(400)
+    if not 0 < page_size <= MAX_MANIFEST_PAGE_SIZE:
+        return abort(400)
+    # the cursor is the last chunk_path of the previous page.
+    cursor = request.values.get("cursor") or None
+
+    # keyset pagination, fetch one extra chunk to find out whether there is another page.
+    try:
+        chunks = list(islice(query_chunks_from_request(study, parse_chunk_query(), ordered=True, after=cursor),
+                             page_size + 1))
+    except InvalidRegistryError as e:
+        print("invalid registry: %s" % e)
+        return abort(400)
+    next_cursor = chunks[page_size - 1]["chunk_path"] if len(chunks) > page_size else None
+
+    return json.dumps({
+        "chunks": [
+            {
+                "chunk_id": chunk["pk"],
+                "chunk_path": chunk["chunk_path"],
+                "chunk_hash": chunk["chunk_hash"],
+                "file_size": chunk["plaintext_size"],
+                "file_name": determine_file_name(chunk),
+            } for chunk in chunks[:page_size]
+        ],
+        "next_cursor": next_cursor,
+    })
+
+
+@data_access_api.route("/get-data-coverage/v1", methods=['POST', "GET"])
+def get_data_coverage():
+    """ Takes the same data_streams, user_ids, time_start and time_end parameters as /get-data/v1.
+    Returns the coverage of the files that /get-data/v1 would return, one per participant per data
+    stream per hour, from their ChunkStats (no files are read), as a JSON list:
+        [{"user_id", "data_stream", "time_bin", "sample_count", "first_timestamp", "last_timestamp",
+          "sampling_rate", "max_gap"}, ...]
+    Timestamps are unix milliseconds, the sampling rate is in samples per second and max_gap is the
+    longest time in milliseconds between samples.  Hours without an entry are gaps in the data.
+    The statistics are null for files that have not been processed since they were recorded. """
+    study = get_and_validate_study_id()
+    get_and_validate_researcher(study)
+
+    query = {}
+    determine_data_streams_for_db_query(query)
+    determine_users_for_db_query(query)
+    determine_time_range_for_db_query(query)
+    chunks = ChunkRegistry.get_chunks_time_range(study.pk, **query).using(read_database())
+    return Response(
+        coverage_generator(ChunkRegistry.iterate_by_pk(chunks.values(*COVERAGE_FIELDS), CHUNK_QUERY_PAGE_SIZE)),
+        mimetype="application/json",
+    )
+
+
+@data_access_api.route("/get-data-chunk/v1", methods=['POST', "GET"])
+def get_data_chunk():
+    """ Required: access key, access secret, study_id, chunk_id (from /get-data-manifest/v1).
+    Returns the contents of that one file.  An interrupted download can be resumed by sending a
+    "Range: bytes=<bytes already received>-" header, which returns the rest of the file.  (Ranges
+    are only supported for files with a known size, see the manifest's file_size, otherwise the
+    whole file is returned.  Files registered before sizes were recorded have no size until the
+    backfill_plaintext_sizes management command has run.) """
+    study = get_and_validate_study_id(chunked_download=True)
+    get_and_validate_researcher(study)
+
+    try:
+        chunk_id = int(request.values["chunk_id"])
+    except ValueError:
+        return abort(400)
+    chunk = ChunkRegistry.objects.using(read_database()).filter(
+        study_id=study.pk, pk=chunk_id).values(*CHUNK_FIELDS).first()
+    if chunk is None:
+        return abort(404)
+
+    file_size = chunk["plaintext_size"]
+    start = parse_range_start(request.headers.get("Range")) if file_size is not None else 0
+    if file_size is not None and start and start >= file_size:
+        return Response(status=416, headers={"Content-Range": "bytes */%s" % file_size})
+
+    headers = {
+        "Content-Disposition": 'attachment; filename="%s"' % determine_file_name(chunk).replace("/", "_"),
+        "X-Chunk-Hash": chunk["chunk_hash"],
+    }
+    # the sizes of files registered before plaintext sizes were recorded are unknown.
+    if file_size is not None:
+        headers["Accept-Ranges"] = "bytes"
+        headers["Content-Length"] = str(file_size - start)
+    else:
+        headers["Accept-Ranges"] = "none"
+    if start:
+        headers["Content-Range"] = "bytes %s-%s/%s" % (start, file_size - 1, file_size)
+
+    return Response(
+        s3_retrieve_stream(chunk["chunk_path"], study.object_id, raw_path=True, start=start),
+        status=206 if start else 200,
+        mimetype="application/octet-stream",
+        headers=headers,
+    )
+
+
+@data_access_api.route("/get-data-batch/v1", methods=['POST', "GET"])
+def get_data_batch():
+    """ Required: access key, access secret, study_id, chunk_ids: a JSON list of up to
+    MAX_BATCH_CHUNKS chunk_ids from /get-data-manifest/v1, optional compression as /get-data/v1.
+    Returns a zip file of those files, as /get-data/v1 does, without the registry file. """
+    study = get_and_validate_study_id(chunked_download=True)
+    get_and_validate_researcher(study)
+    compress = parse_compression()
+
+    try:
+        chunk_ids = json.loads(request.values["chunk_ids"])
+    except ValueError:
+        return abort(400)
+    if (not isinstance(chunk_ids, list) or len(chunk_ids) > MAX_BATCH_CHUNKS
+            or not all(isinstance(chunk_id, int) for chunk_id in chunk_ids)):
+        return abort(400)
+
+    chunks = ChunkRegistry.objects.using(read_database()).filter(
+        study_id=study.pk, pk__in=chunk_ids).values(*CHUNK_FIELDS)
+    return Response(zip_generator(chunks, construct_registry=False, compress=compress), mimetype="zip")
+
+
+def parse_chunk_query() -> dict:
+    """ The data streams, users and time range parameters of a data download request, as the
+    arguments of ChunkRegistry.get_chunks_time_range. """
+    query = {}
+    determine_data_streams_for_db_query(query)  # select data streams
+    determine_users_for_db_query(query)  # select users
+    determine_time_range_for_db_query(query)  # construct time ranges
+    return query
+
+
+def query_chunks_from_request(study, query, **kwargs):
+    """ The ChunkRegistry query of a data download request, see parse_chunk_query, kwargs are
+    passed to handle_database_query. """
+    return handle_database_query(study.pk, query, registry=parse_registry(), **kwargs)
+
+
+def parse_compression():
+    """ Whether a data download should be compressed, the compression parameter is either "none"
+    (the default) or "deflate". """
+    compression = request.values.get("compression", "none")
+    if compression not in ("none", "deflate"):
+        print("invalid compression '%s'" % compression)
+        return abort(400)
+    return compression == "deflate"
+
+
+def parse_export_format():
+    """ The format of a data download, the format parameter is one of:
+        "zip" (the default).
+        "tar": as zip, for very large downloads, see tar_generator.
+        "csvstream": a single csv of all of the files of one chunked data stream, which must be the
+            only data stream requested, see csv_stream_generator. """
+    export_format = request.values.get("format", ZIP_FORMAT)
+    if export_format not in (ZIP_FORMAT, TAR_FORMAT, CSV_STREAM_FORMAT):
+        print("invalid format '%s'" % export_format)
+        return abort(400)
+
+    if export_format == CSV_STREAM_FORMAT:
+        query = {}
+        determine_data_streams_for_db_query(query)
+        data_types = query.get("data_types", [])
+        if len(data_types) != 1 or data_types[0] not in CHUNKABLE_FILES:
+            print("csvstream downloads require exactly one chunked data stream")
+            return abort(400)
+    return export_format
+
+
+def parse_csv_slice():
+    """ The precise_start and precise_end (inclusive, in API_TIME_FORMAT) and columns (a json list
+    of column names) parameters select rows and columns of the csv files of chunked data streams
+    (other files are not changed).  Returns a CsvSlice, or None if there are none of these
+    parameters. """
+    start = request.values.get("precise_start")
+    end = request.values.get("precise_end")
+    columns = None
+    if "columns" in request.values:
+        try:
+            columns = json.loads(request.values["columns"])
+        except ValueError:
+            columns = request.values.getlist("columns")
+        if not isinstance(columns, list) or not columns or not all(isinstance(c, str) for c in columns):
+            print("invalid columns: %s" % request.values["columns"])
+            return abort(400)
+
+    if start is None and end is None and columns is None:
+        return None
+    return CsvSlice(
+        start=datetime_to_unix_milliseconds(str_to_datetime(start)) if start else None,
+        end=datetime_to_unix_milliseconds(str_to_datetime(end)) if end else None,
+        columns=[column.encode() for column in columns] if columns else None,
+    )
+
+
+def parse_resample():
+    """ The resample parameter is a window length in milliseconds that evenly divides an hour,
+    the files of high frequency data streams are resampled into windows of that length (other files
+    are not changed).  The resample_method parameter is "aggregate" (the default, statistics of
+    each window) or "decimate" (the first row of each window), see libs.resampling.  Returns a
+    Resample, or None if there is no resample parameter. """
+    if "resample" not in request.values:
+        return None
+    try:
+        resample = Resample(int(request.values["resample"]), request.values.get("resample_method", AGGREGATE))
+        validate_resample(resample)
+    except (ValueError, ResampleError) as e:
+        print("invalid resample: %s" % e)
+        return abort(400)
+    return resample
+
+
+def parse_range_start(range_header):
+    """ Returns the first byte of a "bytes=<start>-" Range header.  Any other kind of range is
+    ignored (which is allowed), and the whole file is returned. """
+    if not range_header or not range_header.startswith("bytes=") or not range_header.endswith("-"):
+        return 0
+    try:
+        return max(int(range_header[len("bytes="):-1]), 0)
+    except ValueError:
+        return 0
+
+
 # from libs.security import generate_random_string
 
+# chunks registered before plaintext sizes were recorded have no plaintext_size (until the
+# backfill_plaintext_sizes management command has run on them).  For chunked data the file_size is
+# the size of the compressed file, csv data compresses to somewhere between a fifth and a tenth of
+# its size, overestimating is the safe direction.
+CHUNKED_DATA_COMPRESSION_RATIO_ESTIMATE = 10
+UNKNOWN_FILE_SIZE_ESTIMATE = 1024*1024
+
+
+def download_size(chunk) -> int:
+    """ The size of a chunk's file as it is retrieved (decrypted and decompressed), or an estimate. """
+    if chunk.get("plaintext_size") is not None:
+        return chunk["plaintext_size"]
+    if chunk.get("file_size") is None:
+        return UNKNOWN_FILE_SIZE_ESTIMATE
+    if chunk["data_type"] in CHUNKABLE_FILES:
+        return chunk["file_size"] * CHUNKED_DATA_COMPRESSION_RATIO_ESTIMATE
+    return chunk["file_size"]
+
+
+def download_prefetcher(fetch, files_list):
+    """ Files are retrieved on a thread pool, smallest first, keeping DOWNLOAD_PREFETCH_BYTES of
+    files in flight: many threads for many small files, few for large ones.  The S3 connection pool
+    is sized to include these threads. """
+    return BudgetedPrefetcher(
+        fetch,
+        files_list,
+        size_of=download_size,
+        byte_budget=DOWNLOAD_PREFETCH_BYTES,
+        max_concurrency=MAX_CONCURRENT_DOWNLOAD_OPS,
+    )
+
+
 # Note: you cannot access the request context inside a generator function
-def zip_generator(files_list, construct_registry=False):
+def zip_generator(files_list, construct_registry=False, compress=False, csv_slice=None, resample=None,
+                  export_bundles=None):
     """ Pulls in data from S3 in a multithreaded network operation, constructs a zip file of that
     data. This is a generator, advantage is it starts returning data (file by file, but wrapped
-    in zip compression) almost immediately. """
+    in zip compression) almost immediately.
+
+    Whole days or months of a participant's data stream that have an up to date export bundle (of
+    export_bundles, see query_export_bundles) are copied into the zip from the bundle after the
+    other files, see libs.export_bundles.
+
+    If compress is True files are DEFLATE compressed, on the retrieval threads (files that are
+    streamed are compressed as they are written).
+
+    If there is a csv_slice or a resample files are sliced or resampled as they are retrieved, see
+    parse_csv_slice and parse_resample, and export bundles must not be used. """
 
     processed_files = set()
     duplicate_files = set()
-    pool = ThreadPool(3)
-    # 3 Threads has been heuristically determined to be a good value, it does not cause the server
-    # to be overloaded, and provides more-or-less the maximum data download speed.  This was tested
-    # on an m4.large instance (dual core, 8GB of ram).
+    splicer = BundleSplicer(export_bundles or {})
+    files_list = splicer.filter(files_list)
+    prefetcher = download_prefetcher(
+        partial(batch_retrieve_and_compress_s3 if compress else batch_retrieve_s3, csv_slice=csv_slice,
+                resample=resample),
+        files_list,
+    )
     file_registry = {}
 
-    zip_output = StreamingBytesIO()
-    zip_input = ZipFile(zip_output, mode="w", compression=ZIP_STORED, allowZip64=True)
+    # large files are written into the zip in pieces, which requires data descriptors, see
+    # UnseekableStreamingBytesIO.
+    zip_output = UnseekableStreamingBytesIO()
+    zip_input = SplicingZipFile(zip_output, mode="w", compression=ZIP_DEFLATED if compress else ZIP_STORED,
+                                compresslevel=DOWNLOAD_COMPRESSION_LEVEL, allowZip64=True)
     # random_id = generate_random_string()[:32]
     # print "returning data for query %s" % random_id
     try:
-        # chunks_and_content is a list of tuples, of the chunk and the content of the file.
-        # chunksize (which is a keyword argument of imap, not to be confused with Beiwe Chunks)
-        # is the size of the batches that are handed to the pool. We always want to add the next
-        # file to retrieve to the pool asap, so we want a chunk size of 1.
-        # (In the documentation there are comments about the timeout, it is irrelevant under this construction.)
-        chunks_and_content = pool.imap_unordered(batch_retrieve_s3, files_list, chunksize=1)
         total_size = 0
+        # chunks_and_content is an iterator of tuples, of the chunk and the content of the file.
+        chunks_and_content = iter(prefetcher)
         for chunk, file_contents in chunks_and_content:
             if construct_registry:
                 file_registry[chunk['chunk_path']] = chunk["chunk_hash"]
@@ -239,7 +582,22 @@ def zip_generator(files_list, construct_registry=False):
                 continue
             processed_files.add(file_name)
             # print file_name
-            zip_input.writestr(file_name, file_contents)
+            if isinstance(file_contents, PreparedZipEntry):
+                # case: a file that was compressed on a retrieval thread.
+                zip_input.write_prepared_entry(file_contents)
+            elif not isinstance(file_contents, bytes):
+                # case: a large file, file_contents is a generator of decrypted blocks.
+                with zip_input.open(file_name, mode="w", force_zip64=True) as zip_entry:
+                    for block in file_contents:
+                        zip_entry.write(block)
+                        x = zip_output.getvalue()
+                        total_size += len(x)
+                        yield x
+                        del x, block
+                        zip_output.empty()
+                file_contents = b""
+            else:
+                zip_input.writestr(file_name, file_contents)
             # These can be large, and we don't want them sticking around in memory as we wait for the yield
             del file_contents, chunk
             # print len(zip_output)
@@ -250,6 +608,23 @@ def zip_generator(files_list, construct_registry=False):
             del x
             zip_output.empty()
 
+        # every chunk has been seen, the bundles that cover their periods are known.
+        for bundle, bundle_chunks in splicer.spliced:
+            if construct_registry:
+                for chunk in bundle_chunks:
+                    file_registry[chunk['chunk_path']] = chunk["chunk_hash"]
+            processed_files.update(determine_file_name(chunk) for chunk in bundle_chunks)
+            # the bundle is written verbatim, then its entries are added to the zip.
+            offset = zip_output.tell()
+            for block in s3_retrieve_stream(bundle.bundle_path, bundle.study.object_id, raw_path=True):
+                zip_output.write(block)
+                x = zip_output.getvalue()
+                total_size += len(x)
+                yield x
+                del x, block
+                zip_output.empty()
+            zip_input.add_spliced_entries(json.loads(bundle.zip_entries), offset, bundle.file_size)
+
         if construct_registry:
             zip_input.writestr("registry", json.dumps(file_registry))
             yield zip_output.getvalue()
@@ -258,6 +633,8 @@ def zip_generator(files_list, construct_registry=False):
         # close, then yield all remaining data in the zip.
         zip_input.close()
         yield zip_output.getvalue()
+        print("data download: %s, %s export bundles, %.1fMB zip" % (
+            prefetcher.throughput_report, len(splicer.spliced), total_size / 1024 / 1024))
 
     except DummyError:
         # The try-except-finally block is here to guarantee the Threadpool is closed and terminated.
@@ -267,70 +644,114 @@ def zip_generator(files_list, construct_registry=False):
     finally:
         # We rely on the finally block to ensure that the threadpool will be closed and terminated,
         # and also to print an error to the log if we need to.
-        pool.close()
-        pool.terminate()
+        prefetcher.close()
         # if duplicate_files:
         #     duplcate_file_message = "encountered duplicate files: %s" % ",".join(
         #             str(name_path) for name_path in duplicate_files)
 
 
 
+def tar_generator(files_list, construct_registry=False, csv_slice=None, resample=None):
+    """ As zip_generator, but constructs a tar file.  Unlike a zip file nothing is kept in memory
+    for the files that have been sent (other than their names and, for the registry, their chunk
+    paths and hashes), and file contents are yielded without being copied.  Files are always read
+    into memory whole (a tar entry's header includes its size), so memory use is at most
+    DOWNLOAD_PREFETCH_BYTES or the size of the largest file. """
+    processed_files = set()
+    file_registry = {}
+    prefetcher = download_prefetcher(
+        partial(batch_retrieve_s3, allow_streaming=False, csv_slice=csv_slice, resample=resample), files_list
+    )
+    tar = TarStream()
+    try:
+        for chunk, file_contents in prefetcher:
+            if construct_registry:
+                file_registry[chunk['chunk_path']] = chunk["chunk_hash"]
+            file_name = determine_file_name(chunk)
+            if file_name in processed_files:
+                continue
+            processed_files.add(file_name)
+            del chunk
+            yield from tar.add(file_name, file_contents)
+            del file_contents
+
+        if construct_registry:
+            yield from tar.add("registry", json.dumps(file_registry).encode())
+        yield tar.close()
+        print("data download: %s, %.1fMB tar" % (prefetcher.throughput_report, tar.size / 1024 / 1024))
+    finally:
+        prefetcher.close()
+
+
+def csv_stream_generator(files_list, csv_slice=None, resample=None):
+    """ Constructs a single csv of the files (of one data stream), with an additional first column
+    of the patient id of each row, see CsvStream.  Rows are grouped by file, the files are in no
+    particular order. """
+    processed_files = set()
+    prefetcher = download_prefetcher(
+        partial(batch_retrieve_s3, allow_streaming=False, csv_slice=csv_slice, resample=resample), files_list
+    )
+    csv_stream = CsvStream()
+    try:
+        for chunk, file_contents in prefetcher:
+            file_name = determine_file_name(chunk)
+            if file_name in processed_files:
+                continue
+            processed_files.add(file_name)
+            yield csv_stream.add(chunk["participant__patient_id"], file_contents)
+            del file_contents, chunk
+        print("data download: %s, csv stream" % prefetcher.throughput_report)
+    finally:
+        prefetcher.close()
+
+
 #########################################################################################
 
-def parse_registry(reg_dat):
-    """ Parses the provided registry.dat file and returns a dictionary of chunk
-    file names and hashes.  (The registry file is just a json dictionary containing
-    a list of file names and hashes.) """
+def coverage_generator(chunks):
+    """ Streams the JSON list of /get-data-coverage/v1, a page of chunks at a time. """
+    yield "["
+    for i, chunk in enumerate(chunks):
+        yield ("," if i else "") + json.dumps({
+            "user_id": chunk["participant__patient_id"],
+            "data_stream": chunk["data_type"],
+            "time_bin": chunk["time_bin"].strftime(API_TIME_FORMAT),
+            "sample_count": chunk["stats__sample_count"],
+            "first_timestamp": chunk["stats__first_timestamp"],
+            "last_timestamp": chunk["stats__last_timestamp"],
+            "sampling_rate": chunk["stats__sampling_rate"],
+            "max_gap": chunk["stats__max_gap"],
+        })
+    yield "]"
+
+
+def parse_registry():
+    """ Returns the registry provided with a data request as an iterator of (chunk_path, chunk_hash)
+    pairs in chunk_path order, or None if there is no registry.  The registry is either a binary
+    registry (see libs.registry) uploaded as a file named "registry", or the original format, a
+    json dictionary of chunk paths and hashes in the "registry" parameter. """
+    if "registry" in request.files:
+        try:
+            return decode_registry(request.files["registry"].read())
+        except InvalidRegistryError as e:
+            print("invalid registry: %s" % e)
+            return abort(400)
+
+    if "registry" not in request.values:
+        return None
     try:
-        ret = json.loads(reg_dat)
+        ret = json.loads(request.values["registry"])
     except ValueError:
         print("invalid registry 1")
         return abort(400)
     if not isinstance(ret, dict):
         print("invalid registry 2")
         return abort(400)
-    return ret
-
-
-def determine_file_name(chunk):
-    """ Generates the correct file name to provide the file with in the zip file.
-        (This also includes the folder location files in the zip.) """
-    extension = chunk["chunk_path"][-3:]  # get 3 letter file extension from the source.
-    if chunk["data_type"] == SURVEY_ANSWERS:
-        # add the survey_id from the file path.
-        return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
-                                   chunk["chunk_path"].rsplit("/", 2)[1], # this is the survey id
-                                   str(chunk["time_bin"]).replace(":", "_"), extension)
-
-    elif chunk["data_type"] == IMAGE_FILE:
-        # add the survey_id from the file path.
-        return "%s/%s/%s/%s/%s" % (
-            chunk["participant__patient_id"],
-            chunk["data_type"],
-            chunk["chunk_path"].rsplit("/", 3)[1],  # this is the survey id
-            chunk["chunk_path"].rsplit("/", 2)[1],  # this is the instance of the user taking a survey
-            chunk["chunk_path"].rsplit("/", 1)[1]
-        )
-
-    elif chunk["data_type"] == SURVEY_TIMINGS:
-        # add the survey_id from the database entry.
-        return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
-                                   chunk["survey__object_id"],  # this is the survey id
-                                   str(chunk["time_bin"]).replace(":", "_"), extension)
+    return sorted_registry_items(ret)
 
-    elif chunk["data_type"] == VOICE_RECORDING:
-        # Due to a bug that was not noticed until July 2016 audio surveys did not have the survey id
-        # that they were associated with.  Later versions of the app (legacy update 1 and Android 6)
-        # correct this.  We can identify those files by checking for the existence of the extra /.
-        # When we don't find it, we revert to original behavior.
-        if chunk["chunk_path"].count("/") == 4:  #
-            return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
-                                       chunk["chunk_path"].rsplit("/", 2)[1],  # this is the survey id
-                                       str(chunk["time_bin"]).replace(":", "_"), extension)
 
-    # all other files have this form:
-    return "%s/%s/%s.%s" % (chunk['participant__patient_id'], chunk["data_type"],
-                            str(chunk["time_bin"]).replace(":", "_"), extension)
+def datetime_to_unix_milliseconds(dt):
+    """ The unix millisecond timestamp of a (naive, UTC) datetime. """
+    return calendar.timegm(dt.utctimetuple()) * 1000
 
 
 def str_to_datetime(time_string):
@@ -342,11 +763,33 @@ def str_to_datetime(time_string):
             return abort(400)
 
 
-def batch_retrieve_s3(chunk):
-    """ Data is returned in the form (chunk_object, file_data). """
-    return chunk, s3_retrieve(chunk["chunk_path"],
-                              study_object_id=Study.objects.get(id=chunk["study_id"]).object_id,
-                              raw_path=True)
+def batch_retrieve_s3(chunk, allow_streaming=True, csv_slice=None, resample=None):
+    """ Data is returned in the form (chunk_object, file_data).  Files larger than
+    STREAMING_DOWNLOAD_THRESHOLD are not read into memory (unless allow_streaming is False, or
+    there is a csv_slice or resample), file_data is instead a generator of decrypted blocks of the
+    file.  Files of high frequency data streams are resampled by resample, and then csv files of
+    chunked data streams are sliced by csv_slice. """
+    study_object_id = chunk["study__object_id"]
+    if csv_slice is not None or resample is not None:
+        if resample is not None and chunk["data_type"] in RESAMPLABLE_FILES:
+            file_contents = retrieve_resampled(chunk, study_object_id, resample)
+        else:
+            file_contents = s3_retrieve(chunk["chunk_path"], study_object_id=study_object_id, raw_path=True)
+        if csv_slice is not None and chunk["data_type"] in CHUNKABLE_FILES:
+            file_contents = slice_csv(file_contents, csv_slice)
+        return chunk, file_contents
+    if allow_streaming and download_size(chunk) > STREAMING_DOWNLOAD_THRESHOLD:
+        return chunk, s3_retrieve_stream(chunk["chunk_path"], study_object_id, raw_path=True)
+    return chunk, s3_retrieve(chunk["chunk_path"], study_object_id=study_object_id, raw_path=True)
+
+
+def batch_retrieve_and_compress_s3(chunk, csv_slice=None, resample=None):
+    """ As batch_retrieve_s3, but files that are read into memory are returned compressed, as a
+    PreparedZipEntry. """
+    chunk, file_contents = batch_retrieve_s3(chunk, csv_slice=csv_slice, resample=resample)
+    if isinstance(file_contents, bytes):
+        file_contents = prepare_zip_entry(determine_file_name(chunk), file_contents, DOWNLOAD_COMPRESSION_LEVEL)
+    return chunk, file_contents
 
 
 #########################################################################################
@@ -399,37 +842,38 @@ def determine_time_range_for_db_query(query):
     if 'time_end' in request.values:
         query['end'] = str_to_datetime(request.values['time_end'])
 
+    # precise_start and precise_end select rows within files (see parse_csv_slice), and the hourly
+    # files that contain those rows.
+    if 'precise_start' in request.values:
+        precise_start = str_to_datetime(request.values['precise_start'])
+        precise_start = precise_start.replace(minute=0, second=0, microsecond=0)
+        query['start'] = max(query['start'], precise_start) if 'start' in query else precise_start
+    if 'precise_end' in request.values:
+        precise_end = str_to_datetime(request.values['precise_end'])
+        query['end'] = min(query['end'], precise_end) if 'end' in query else precise_end
+
 
-def handle_database_query(study_id, query, registry=None):
+def handle_database_query(study_id, query, registry=None, ordered=False, after=None):
     """
-    Runs the database query and returns a QuerySet.
+    Runs the database query and returns an iterator of the chunks (dictionaries of CHUNK_FIELDS).
+    The chunks are read from the database in pages of CHUNK_QUERY_PAGE_SIZE, so however many chunks
+    the query matches only one page of them is in memory at a time.
+
+    If there is a registry (an iterable of (chunk_path, chunk_hash) pairs in chunk_path order), or
+    ordered is True, the chunks are in chunk_path order, optionally only those with a chunk_path
+    after `after`, excluding any chunks that are in the registry.  The registry is merged against
+    the chunks as they are read from the database.
     """
-    chunk_fields = ["pk", "participant_id", "data_type", "chunk_path", "time_bin", "chunk_hash",
-                    "participant__patient_id", "study_id", "survey_id", "survey__object_id"]
-
-    chunks = ChunkRegistry.get_chunks_time_range(study_id, **query)
-
-    if not registry:
-        return chunks.values(*chunk_fields)
-
-    # If there is a registry, we need to filter the chunks
-    else:
-        # Get all chunks whose path and hash are both in the registry
-        possible_registered_chunks = (
-            chunks
-            .filter(chunk_path__in=registry, chunk_hash__in=registry.values())
-            .values('pk', 'chunk_path', 'chunk_hash')
-        )
+    # downloads read from a replica, every page is routed to the same database.
+    chunks = ChunkRegistry.get_chunks_time_range(study_id, **query).using(read_database())
 
-        # determine those chunks that we do not want present in the download
-        # (get a list of pks that have hashes that don't match the database)
-        registered_chunk_pks = [
-            c['pk'] for c in possible_registered_chunks if registry[c['chunk_path']] == c['chunk_hash']
-        ]
+    if registry is None and not ordered:
+        return ChunkRegistry.iterate_by_pk(chunks.values(*CHUNK_FIELDS), CHUNK_QUERY_PAGE_SIZE)
 
-        # add the exclude and return the queryset
-        unregistered_chunks = chunks.exclude(pk__in=registered_chunk_pks)
-        return unregistered_chunks.values(*chunk_fields)
+    chunks = ChunkRegistry.iterate_by_chunk_path(chunks, CHUNK_FIELDS, CHUNK_QUERY_PAGE_SIZE, after=after)
+    if registry is None:
+        return chunks
+    return unregistered_chunks(chunks, registry)
 
 
 #########################################################################################
@@ -479,9 +923,11 @@ def data_pipeline_upload():
         creation_args, tags = PipelineUpload.get_creation_arguments(request.values, request.files['file'])
     except InvalidUploadParameterError as e:
         return Response(str(e), 400)
-    s3_upload(
+    # stream the upload to s3 rather than reading it into memory, large files use multipart uploads.
+    uploaded_file = request.files['file']
+    s3_upload_stream(
             creation_args['s3_path'],
-            request.files['file'].read(),
+            iter(lambda: uploaded_file.read(S3_STREAM_BLOCK_SIZE), b""),
             Study.objects.get(id=creation_args['study_id']).object_id,
             raw_path=True
     )
@@ -542,14 +988,21 @@ def json_pipeline_upload():
     else:
         summary_type = file_name
 
-    PipelineRegistry.register_pipeline_data(study_obj, participant_id, json_data, summary_type)
+    with transaction.atomic():
+        PipelineRegistry.register_pipeline_data(study_obj, participant_id, json_data, summary_type)
+        # the dashboards read the parsed values of the participant's most recent pipeline data.
+        PipelineSummaryValue.replace_values(study_obj.pk, participant_id, json_data)
     return Response("SUCCESS", status=200)
 
 
 @data_access_api.route("/get-pipeline/v1", methods=["GET", "POST"])
 def pipeline_data_download():
+    """ Optional format parameter, "zip" (the default) or "tar". """
     study_obj = get_and_validate_study_id(chunked_download=False)
     get_and_validate_researcher(study_obj)
+    export_format = request.values.get("format", ZIP_FORMAT)
+    if export_format not in (ZIP_FORMAT, TAR_FORMAT):
+        return abort(400)
 
     # the following two cases are for difference in content wrapping between the CLI script and
     # the download page.
@@ -565,6 +1018,12 @@ def pipeline_data_download():
         query = PipelineUpload.objects.filter(study__id=study_obj.id)
 
     ####################################
+    if export_format == TAR_FORMAT:
+        return Response(
+                tar_generator_for_pipeline(query),
+                mimetype="application/x-tar",
+                headers={'Content-Disposition': 'attachment; filename="data.tar"'}
+        )
     return Response(
             zip_generator_for_pipeline(query),
             mimetype="zip",
@@ -573,7 +1032,7 @@ def pipeline_data_download():
 
 #TODO: This is a trivial rewrite of the other zip generator function for minor differences. refactor when you get to django.
 def zip_generator_for_pipeline(files_list):
-    pool = ThreadPool(3)
+    pool = DatabaseThreadPool(CONCURRENT_DOWNLOAD_OPS)
     zip_output = StreamingBytesIO()
     zip_input = ZipFile(zip_output, mode="w", compression=ZIP_STORED, allowZip64=True)
     try:
@@ -607,6 +1066,22 @@ def zip_generator_for_pipeline(files_list):
         pool.terminate()
         
         
+def tar_generator_for_pipeline(files_list):
+    """ As zip_generator_for_pipeline, but constructs a tar file, see tar_generator. """
+    pool = DatabaseThreadPool(CONCURRENT_DOWNLOAD_OPS)
+    tar = TarStream()
+    try:
+        for pipeline_upload, file_contents in pool.imap_unordered(batch_retrieve_pipeline_s3, files_list, chunksize=1):
+            file_name = "data/" + pipeline_upload.file_name
+            del pipeline_upload
+            yield from tar.add(file_name, file_contents)
+            del file_contents
+        yield tar.close()
+    finally:
+        pool.close()
+        pool.terminate()
+
+
 def batch_retrieve_pipeline_s3(pipeline_upload):
     """ Data is returned in the form (chunk_object, file_data). """
     study = Study.objects.get(id = pipeline_upload.study_id)
@@ -1,13 +1,12 @@
 import calendar
 import time
 
-from django.utils import timezone
 from flask import abort, Blueprint, json, render_template, request
 from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import BadRequestKeyError
 
 from config.constants import ALLOWED_EXTENSIONS, DEVICE_IDENTIFIERS_HEADER
-from database.data_access_models import FileToProcess
+from database.data_access_models import FileToProcess, SurveyAnswerFile
 from database.profiling_models import DecryptionKeyError, UploadTracking
 from database.user_models import Participant
 from libs.encryption import decrypt_device_file, DecryptionKeyInvalidError, HandledError
@@ -133,12 +132,8 @@ def upload(OS_API=""):
     if uploaded_file and file_name and contains_valid_extension(file_name):
         s3_upload(file_name.replace("_", "/"), uploaded_file, user.study.object_id)
         FileToProcess.append_file_for_processing(file_name.replace("_", "/"), user.study.object_id, participant=user)
-        UploadTracking.objects.create(
-            file_path=file_name.replace("_", "/"),
-            file_size=len(uploaded_file),
-            timestamp=timezone.now(),
-            participant=user,
-        )
+        UploadTracking.track(file_name.replace("_", "/"), len(uploaded_file), user)
+        SurveyAnswerFile.register(user, file_name.replace("_", "/"))
         return render_template('blank.html'), 200
 
     else:
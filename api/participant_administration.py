@@ -1,9 +1,11 @@
+import json
 from csv import writer
 from re import sub
 
 from flask import Blueprint, flash, redirect, request, Response
 
 from libs.admin_authentication import authenticate_researcher_study_access
+from libs.participant_list import get_participant_page
 from libs.s3 import s3_upload, create_client_key_pair
 from libs.streaming_bytes_io import StreamingBytesIO, StreamingStringsIO
 from database.study_models import Study
@@ -12,6 +14,28 @@ from database.user_models import Participant
 participant_administration = Blueprint('participant_administration', __name__)
 
 
+@participant_administration.route('/view_study/<string:study_id>/participants', methods=["GET"])
+@authenticate_researcher_study_access
+def participant_list_page(study_id=None):
+    """ A page of a study's participants for the participant table of the study page, in the
+    format of DataTables' server-side processing. """
+    sort_column_index = request.values.get("order[0][column]", 0, type=int)
+    total, filtered, rows = get_participant_page(
+        study_id,
+        search=request.values.get("search[value]", ""),
+        sort_column=request.values.get("columns[%s][data]" % sort_column_index, "patient_id"),
+        descending=request.values.get("order[0][dir]") == "desc",
+        start=request.values.get("start", 0, type=int),
+        length=request.values.get("length", 25, type=int),
+    )
+    return Response(json.dumps({
+        "draw": request.values.get("draw", 0, type=int),
+        "recordsTotal": total,
+        "recordsFiltered": filtered,
+        "data": rows,
+    }), mimetype="application/json")
+
+
 @participant_administration.route('/reset_participant_password', methods=["POST"])
 @authenticate_researcher_study_access
 def reset_participant_password():
@@ -7,6 +7,7 @@ from raven.contrib.flask import Sentry
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from config import load_django
+from django.db import close_old_connections
 
 from api import (admin_api, copy_study_api, dashboard_api, data_access_api, data_pipeline_api,
     mobile_api, participant_administration, survey_api)
@@ -55,6 +56,13 @@ def strip_dot_html(page):
     return redirect("/%s" % page)
 
 
+@app.teardown_request
+def release_database_connections(exception):
+    # Django does this at the end of its own requests: it closes this thread's connection if it is
+    # broken or older than CONN_MAX_AGE (always, in pgbouncer mode).
+    close_old_connections()
+
+
 @app.context_processor
 def inject_dict_for_all_templates():
     return {"SENTRY_JAVASCRIPT_DSN": SENTRY_JAVASCRIPT_DSN}
@@ -52,7 +52,34 @@ for mandatory_var in MANDATORY_VARS:
 # Environment variables might be unpredictable, so we sanitize the numerical ones as ints.
 constants.DEFAULT_S3_RETRIES = int(constants.DEFAULT_S3_RETRIES)
 constants.CONCURRENT_NETWORK_OPS = int(constants.CONCURRENT_NETWORK_OPS)
+constants.CONCURRENT_DOWNLOAD_OPS = int(constants.CONCURRENT_DOWNLOAD_OPS)
+constants.DOWNLOAD_PREFETCH_BYTES = int(constants.DOWNLOAD_PREFETCH_BYTES)
+constants.MAX_CONCURRENT_DOWNLOAD_OPS = int(constants.MAX_CONCURRENT_DOWNLOAD_OPS)
+constants.DOWNLOAD_COMPRESSION_LEVEL = int(constants.DOWNLOAD_COMPRESSION_LEVEL)
+constants.S3_MAX_POOL_CONNECTIONS = int(constants.S3_MAX_POOL_CONNECTIONS)
+constants.S3_MULTIPART_THRESHOLD = int(constants.S3_MULTIPART_THRESHOLD)
+constants.S3_MULTIPART_PART_SIZE = max(int(constants.S3_MULTIPART_PART_SIZE), 5*1024*1024)
+constants.S3_MULTIPART_CONCURRENCY = int(constants.S3_MULTIPART_CONCURRENCY)
+constants.S3_STREAM_BLOCK_SIZE = int(constants.S3_STREAM_BLOCK_SIZE)
+constants.STREAMING_DOWNLOAD_THRESHOLD = int(constants.STREAMING_DOWNLOAD_THRESHOLD)
+constants.S3_RETRY_BACKOFF_BASE = float(constants.S3_RETRY_BACKOFF_BASE)
+constants.S3_RETRY_BACKOFF_MAX = float(constants.S3_RETRY_BACKOFF_MAX)
 constants.FILE_PROCESS_PAGE_SIZE = int(constants.FILE_PROCESS_PAGE_SIZE)
+constants.REPLICA_MAX_LAG_SECONDS = float(constants.REPLICA_MAX_LAG_SECONDS)
+constants.REPLICA_LAG_CHECK_INTERVAL = float(constants.REPLICA_LAG_CHECK_INTERVAL)
+constants.EXPORT_BUNDLE_DELAY_DAYS = int(constants.EXPORT_BUNDLE_DELAY_DAYS)
+constants.EXPORT_BUNDLE_MIN_FILES = int(constants.EXPORT_BUNDLE_MIN_FILES)
+constants.EXPORT_BUNDLE_LOOKBACK_DAYS = int(constants.EXPORT_BUNDLE_LOOKBACK_DAYS)
+constants.EXPORT_BUNDLES_PER_RUN = int(constants.EXPORT_BUNDLES_PER_RUN)
+constants.RESAMPLE_CACHE_LOOKBACK_DAYS = int(constants.RESAMPLE_CACHE_LOOKBACK_DAYS)
+constants.RESAMPLED_CHUNKS_PER_RUN = int(constants.RESAMPLED_CHUNKS_PER_RUN)
+constants.UPLOAD_TRACKING_RETENTION_DAYS = int(constants.UPLOAD_TRACKING_RETENTION_DAYS)
+constants.GPS_SUMMARY_LOOKBACK_DAYS = int(constants.GPS_SUMMARY_LOOKBACK_DAYS)
+constants.GPS_SUMMARY_DAYS_PER_RUN = int(constants.GPS_SUMMARY_DAYS_PER_RUN)
+
+# resample windows are parsed from a comma separated list of milliseconds
+constants.RESAMPLE_CACHED_WINDOWS = [int(_window) for _window in constants.RESAMPLE_CACHED_WINDOWS.split(",")
+                                     if _window.strip()]
 
 # email addresses are parsed from a comma separated list
 # whitespace before and after addresses are stripped
@@ -60,6 +87,11 @@ if settings.SYSADMIN_EMAILS:
     settings.SYSADMIN_EMAILS = [_email_address.strip()
                                 for _email_address in settings.SYSADMIN_EMAILS.split(",")]
 
+# the storage backend must be one we know how to instantiate.
+settings.STORAGE_BACKEND = settings.STORAGE_BACKEND.lower()
+if settings.STORAGE_BACKEND not in ("s3", "local"):
+    errors.append("STORAGE_BACKEND must be either 's3' or 'local'.")
+
 # IS_STAGING needs to resolve to False except under specific settings.
 # The default needs to be production.
 if settings.IS_STAGING is True or settings.IS_STAGING.upper() == "TRUE":
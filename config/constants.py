@@ -12,15 +12,82 @@ from config.settings import DOMAIN_NAME
 ## Networking
 # This value is used in libs.s3, does what it says.
 DEFAULT_S3_RETRIES = getenv("DEFAULT_S3_RETRIES") or 3
+# Retries back off exponentially with full jitter; these are the base and the cap of that delay
+# (in seconds). Permanent errors (missing keys, bad credentials) are never retried.
+S3_RETRY_BACKOFF_BASE = getenv("S3_RETRY_BACKOFF_BASE") or 0.25
+S3_RETRY_BACKOFF_MAX = getenv("S3_RETRY_BACKOFF_MAX") or 20
+# Size of the boto3 connection pool. When unset (0) it is derived from the total configured
+# concurrency (CONCURRENT_NETWORK_OPS + CONCURRENT_DOWNLOAD_OPS) so threads never block on it.
+S3_MAX_POOL_CONNECTIONS = getenv("S3_MAX_POOL_CONNECTIONS") or 0
+# Objects larger than this (in bytes) are uploaded with a parallel multipart upload, in parts of
+# S3_MULTIPART_PART_SIZE bytes (S3 requires at least 5MB), S3_MULTIPART_CONCURRENCY at a time.
+S3_MULTIPART_THRESHOLD = getenv("S3_MULTIPART_THRESHOLD") or 32*1024*1024
+S3_MULTIPART_PART_SIZE = getenv("S3_MULTIPART_PART_SIZE") or 16*1024*1024
+S3_MULTIPART_CONCURRENCY = getenv("S3_MULTIPART_CONCURRENCY") or 4
+# Block size used when streaming an object out of S3.
+S3_STREAM_BLOCK_SIZE = getenv("S3_STREAM_BLOCK_SIZE") or 1024*1024
+# Files larger than this (in bytes) are streamed into data downloads instead of loaded whole.
+STREAMING_DOWNLOAD_THRESHOLD = getenv("STREAMING_DOWNLOAD_THRESHOLD") or 16*1024*1024
 
 ## File processing directives
 # NOTE: these numbers were determined through trial and error on a C4 Large AWS instance.
 # Used in data download and data processing, base this on CPU core count.
 CONCURRENT_NETWORK_OPS = getenv("CONCURRENT_NETWORK_OPS") or 10
+# Used in the data access api, number of files retrieved simultaneously for a single download.
+CONCURRENT_DOWNLOAD_OPS = getenv("CONCURRENT_DOWNLOAD_OPS") or 3
+# Data access api downloads prefetch files while keeping at most DOWNLOAD_PREFETCH_BYTES of files
+# (by their ChunkRegistry plaintext_size) in flight, with up to MAX_CONCURRENT_DOWNLOAD_OPS retrievals
+# at once.  Downloads of many small files get many threads, downloads of large files get few.
+DOWNLOAD_PREFETCH_BYTES = getenv("DOWNLOAD_PREFETCH_BYTES") or 128*1024*1024
+MAX_CONCURRENT_DOWNLOAD_OPS = getenv("MAX_CONCURRENT_DOWNLOAD_OPS") or 16
+# zlib level of compressed data downloads (compression=deflate), files are compressed on the
+# prefetching threads.  Level 1 compresses csv files about 4x at ~100MB/s per core, higher levels
+# save little more for several times the cpu, see scripts/benchmark_compression.py.
+DOWNLOAD_COMPRESSION_LEVEL = getenv("DOWNLOAD_COMPRESSION_LEVEL") or 1
 #Used in file processing, number of files to be pulled in and processed simultaneously.
 # Higher values reduce s3 usage, reduce processing time, but increase ram requirements.
 FILE_PROCESS_PAGE_SIZE = getenv("FILE_PROCESS_PAGE_SIZE") or 250
 
+## Read replicas
+# Reads routed to a replica fall back to the primary database if the replica is more than this
+# many seconds behind it.  Lag is checked at most once per REPLICA_LAG_CHECK_INTERVAL seconds.
+REPLICA_MAX_LAG_SECONDS = getenv("REPLICA_MAX_LAG_SECONDS") or 30
+REPLICA_LAG_CHECK_INTERVAL = getenv("REPLICA_LAG_CHECK_INTERVAL") or 10
+
+## Export bundles
+# Each participant's files of each data stream are bundled by month (and by day in the current
+# month) once the period has been over for EXPORT_BUNDLE_DELAY_DAYS.  Files uploaded later than
+# that make the bundle stale, it is then rebuilt.  Periods with fewer than EXPORT_BUNDLE_MIN_FILES
+# files are not bundled.
+EXPORT_BUNDLE_DELAY_DAYS = getenv("EXPORT_BUNDLE_DELAY_DAYS") or 3
+EXPORT_BUNDLE_MIN_FILES = getenv("EXPORT_BUNDLE_MIN_FILES") or 12
+# Only periods that started in the last EXPORT_BUNDLE_LOOKBACK_DAYS are bundled (0 for all of
+# history), and each run builds at most EXPORT_BUNDLES_PER_RUN bundles, most recent first.
+EXPORT_BUNDLE_LOOKBACK_DAYS = getenv("EXPORT_BUNDLE_LOOKBACK_DAYS") or 92
+EXPORT_BUNDLES_PER_RUN = getenv("EXPORT_BUNDLES_PER_RUN") or 2000
+
+## Resampling
+# High frequency data streams are resampled into windows of these lengths (in milliseconds, as a
+# comma separated list) in the background, so that data downloads with those resample windows
+# do not have to resample files themselves.
+RESAMPLE_CACHED_WINDOWS = getenv("RESAMPLE_CACHED_WINDOWS") or "1000,60000"
+# Only files of the last RESAMPLE_CACHE_LOOKBACK_DAYS are resampled (0 for all of history), and
+# each run resamples at most RESAMPLED_CHUNKS_PER_RUN files, most recent first.
+RESAMPLE_CACHE_LOOKBACK_DAYS = getenv("RESAMPLE_CACHE_LOOKBACK_DAYS") or 30
+RESAMPLED_CHUNKS_PER_RUN = getenv("RESAMPLED_CHUNKS_PER_RUN") or 20000
+
+## Upload tracking
+# Uploads are counted by day in UploadDailyStats as they arrive, UploadTracking rows (one per
+# uploaded file) older than UPLOAD_TRACKING_RETENTION_DAYS are deleted once their days have been
+# rolled up.  0 keeps every row.
+UPLOAD_TRACKING_RETENTION_DAYS = getenv("UPLOAD_TRACKING_RETENTION_DAYS") or 90
+
+## GPS summaries
+# Only days of the last GPS_SUMMARY_LOOKBACK_DAYS are summarized (0 for all of history), and each
+# run summarizes at most GPS_SUMMARY_DAYS_PER_RUN participant days, most recent first.
+GPS_SUMMARY_LOOKBACK_DAYS = getenv("GPS_SUMMARY_LOOKBACK_DAYS") or 30
+GPS_SUMMARY_DAYS_PER_RUN = getenv("GPS_SUMMARY_DAYS_PER_RUN") or 20000
+
 #This string will be printed into non-error hourly reports to improve error filtering.
 DATA_PROCESSING_NO_ERROR_STRING = getenv("DATA_PROCESSING_NO_ERROR_STRING") or "2HEnBwlawY"
 
@@ -137,6 +204,16 @@ processed_data_stream_dict = {
     "MaxHomeDist_km": "Maximum Home Distance (km)",
 }
 
+# processed data streams that are computed on the server from GPS data (see libs.gps_summaries)
+# and from call and text logs (see libs.communication_summaries) for studies with server_summaries
+# turned on, values of these data streams in those studies' pipeline uploads are ignored.
+GPS_SUMMARY_STREAMS = ("Hometime_hrs", "DistTravelled_km", "RoG_km", "MaxDiam_km")
+CALL_SUMMARY_STREAMS = ("incoming_calls", "outgoing_calls", "incoming_calllengths", "outgoing_calllengths",
+                        "call_indegree", "call_outdegree")
+TEXT_SUMMARY_STREAMS = ("incoming_texts", "outgoing_texts", "incoming_textlengths", "outgoing_textlengths",
+                        "text_indegree", "text_outdegree", "reciprocity", "responsiveness")
+SERVER_SUMMARY_STREAMS = GPS_SUMMARY_STREAMS + CALL_SUMMARY_STREAMS + TEXT_SUMMARY_STREAMS
+
 # dictionary for printing ALL data streams (processed and bytes)
 complete_data_stream_dict = {
     "responsiveness": "Responsiveness",
@@ -274,6 +351,12 @@ CHUNKABLE_FILES = {ACCELEROMETER,
                    REACHABILITY,
                    IOS_LOG_FILE}
 
+# the data streams that can be resampled, see libs.resampling.
+RESAMPLABLE_FILES = {ACCELEROMETER,
+                     GYRO,
+                     MAGNETOMETER,
+                     DEVICEMOTION}
+
 ## Survey Question Types
 FREE_RESPONSE = "free_response"
 CHECKBOX = "checkbox"
@@ -19,7 +19,14 @@ if 'test' in sys.argv:
             'TEST_NAME': TEST_DATABASE_PATH,
             'TEST': {'NAME': TEST_DATABASE_PATH},
             'CONN_MAX_AGE': None,
-        }
+        },
+        # a replica of the test database (a second connection to it, it is not migrated separately).
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': TEST_DATABASE_PATH,
+            'TEST': {'MIRROR': 'default'},
+            'CONN_MAX_AGE': None,
+        },
     }
 elif os.environ['DJANGO_DB_ENV'] == "local":
     DATABASES = {
@@ -29,6 +36,13 @@ elif os.environ['DJANGO_DB_ENV'] == "local":
             'CONN_MAX_AGE': None,
         },
     }
+    # To try out read replica routing locally point LOCAL_REPLICA_DB_PATH at a copy of the database.
+    if os.environ.get('LOCAL_REPLICA_DB_PATH'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['LOCAL_REPLICA_DB_PATH'],
+            'CONN_MAX_AGE': None,
+        }
 elif os.environ['DJANGO_DB_ENV'] == "remote":
     DATABASES = {
         'default': {
@@ -37,15 +51,30 @@ elif os.environ['DJANGO_DB_ENV'] == "remote":
             'USER': os.environ['RDS_USERNAME'],
             'PASSWORD': os.environ['RDS_PASSWORD'],
             'HOST': os.environ['RDS_HOSTNAME'],
+            'PORT': os.environ.get('RDS_PORT', ''),
             'CONN_MAX_AGE': None,
             'OPTIONS': {'sslmode': 'require'},
         },
     }
+    # Set DJANGO_DB_POOLING to "pgbouncer" when RDS_HOSTNAME points at a pgbouncer in transaction
+    # pooling mode.  Connections are then closed (returned to pgbouncer) at the end of every request
+    # and every DatabaseThreadPool task, and server side cursors are disabled because they do not
+    # survive across transactions that pgbouncer may route to different server connections.
+    if os.environ.get('DJANGO_DB_POOLING', 'persistent') == 'pgbouncer':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+    # Read replicas: a comma separated list of hosts, each becomes a database alias "replica_N" that
+    # the dashboard, data access api, and reporting code read from (see database/routers.py).
+    for _i, _host in enumerate(filter(None, os.environ.get('RDS_REPLICA_HOSTNAMES', '').split(','))):
+        DATABASES['replica_%s' % _i] = dict(DATABASES['default'], HOST=_host.strip())
 else:
     from django.core.exceptions import ImproperlyConfigured
     raise ImproperlyConfigured("server not running as expected, could not find environment variable DJANGO_DB_ENV")
 
 
+DATABASE_ROUTERS = ['database.routers.ReadReplicaRouter']
+
 TIME_ZONE = 'UTC'
 USE_TZ = True
 
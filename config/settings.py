@@ -1,4 +1,5 @@
 from os import getenv
+from os.path import dirname, join
 
 """
 To customize any of these values, append a line to config/remote_db_env.py such as:
@@ -37,3 +38,8 @@ S3_REGION_NAME = getenv("S3_REGION_NAME", "us-east-1")
 
 # Location of the downloadable Android APK file that'll be served from /download
 DOWNLOADABLE_APK_URL = getenv("DOWNLOADABLE_APK_URL", "https://s3.amazonaws.com/beiwe-app-backups/release/Beiwe-2.4.1-onnelaLabServer-release.apk")
+
+# Object storage backend: "s3" (the default), or "local" to store files on this server's own disk
+# under LOCAL_STORAGE_ROOT (e.g. a local NVMe volume for a single-server deployment).
+STORAGE_BACKEND = getenv("STORAGE_BACKEND", "s3")
+LOCAL_STORAGE_ROOT = getenv("LOCAL_STORAGE_ROOT") or join(dirname(dirname(__file__)), "private", "local_storage")
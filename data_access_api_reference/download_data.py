@@ -1,7 +1,16 @@
+import argparse
 import io
 import json
 import os
+import struct
+import sys
+import threading
+import time
 import zipfile
+import zlib
+from array import array
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from os import path
 
@@ -22,6 +31,11 @@ except ImportError:
 # used in commented out code
 API_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
+# download_data settings: number of simultaneous downloads, and how many times to retry a file.
+DEFAULT_PARALLELISM = 8
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
 
 # Data Streams
 ACCELEROMETER = "accelerometer"
@@ -56,7 +70,7 @@ if not API_URL_BASE.endswith("/"):
 
 
 def make_request(study_id, access_key=ACCESS_KEY, secret_key=SECRET_KEY, user_ids=None, data_streams=None,
-                 time_start=None, time_end=None):
+                 time_start=None, time_end=None, compress=False):
     """
     Behavior
     This function will download the data from the server, decompress it, and WRITE IT TO FILES IN YOUR CURRENT WORKING DIRECTORY.
@@ -85,32 +99,16 @@ def make_request(study_id, access_key=ACCESS_KEY, secret_key=SECRET_KEY, user_id
     Default behavior: if you provide no start time parameter data will be returned starting from the beginning of time for that user; if you provide no end time parameter data will be returned up to the most current indexed data.
     NOTE: granularity of requesting time is by hour, data will be updated on the server roughly once an hour.
     NOTE: Use the string from this module's API_TIME_FORMAT variable if you are using the Python DateTime library to generate date strings, or investigate the commented out lines of code in this function.
-    """
 
-    if access_key is None or secret_key is None:
-        raise Exception("You must provide credentials to run this API call.")
+    Compression
+    If compress is True the server compresses the files in the zip file, csv data is about 4 times smaller.  This is slower for the server, use it when your connection is slow.
+    Default behavior: the files are not compressed.
+    """
 
     url = API_URL_BASE + 'get-data/v1'
-    values = {
-        'access_key': access_key,
-        'secret_key': secret_key,
-        'study_id': study_id,
-    }
-
-    if user_ids:
-        values['user_ids'] = json.dumps(user_ids)
-    if data_streams:
-        values['data_streams'] = json.dumps(data_streams)
-
-    # Uncomment the below lines to enable (time zone unaware) datetime object support, add 'from datetime import datetime' to the imports.
-    if time_start:
-        # if isinstance(time_start, datetime):
-        # time_start = time_start.strftime(API_TIME_FORMAT)
-        values['time_start'] = time_start
-    if time_end:
-        # if isinstance(time_end, datetime):
-        # time_end = time_end.strftime(API_TIME_FORMAT)
-        values['time_end'] = time_end
+    values = make_query_values(study_id, access_key, secret_key, user_ids, data_streams, time_start, time_end)
+    if compress:
+        values["compression"] = "deflate"
 
     if path.exists("master_registry"):
         with open("master_registry") as f:
@@ -141,6 +139,262 @@ def make_request(study_id, access_key=ACCESS_KEY, secret_key=SECRET_KEY, user_id
     # return [name.filename for name in z.filelist if name.filename != "registry"]
 
 
+def make_query_values(study_id, access_key, secret_key, user_ids, data_streams, time_start, time_end):
+    """ The request parameters for a data query, see make_request for details. """
+    if access_key is None or secret_key is None:
+        raise Exception("You must provide credentials to run this API call.")
+
+    values = {
+        'access_key': access_key,
+        'secret_key': secret_key,
+        'study_id': study_id,
+    }
+
+    if user_ids:
+        values['user_ids'] = json.dumps(user_ids)
+    if data_streams:
+        values['data_streams'] = json.dumps(data_streams)
+
+    # Uncomment the below lines to enable (time zone unaware) datetime object support, add 'from datetime import datetime' to the imports.
+    if time_start:
+        # if isinstance(time_start, datetime):
+        # time_start = time_start.strftime(API_TIME_FORMAT)
+        values['time_start'] = time_start
+    if time_end:
+        # if isinstance(time_end, datetime):
+        # time_end = time_end.strftime(API_TIME_FORMAT)
+        values['time_end'] = time_end
+    return values
+
+
+def download_data(study_id, access_key=ACCESS_KEY, secret_key=SECRET_KEY, user_ids=None, data_streams=None,
+                  time_start=None, time_end=None, parallelism=DEFAULT_PARALLELISM, destination="."):
+    """
+    Behavior
+    Downloads the same data as make_request, writing files into the destination folder, but downloads
+    up to `parallelism` files at once over separate connections, and can be stopped and restarted.
+     - Files are downloaded to "<file name>.part" and renamed when complete, a file without the .part
+       extension is always complete.
+     - An interrupted download (of a file or of the whole study) resumes where it stopped: run the
+       same call again.  Partially downloaded files are continued from their last byte.
+     - The "master_registry" file (shared with make_request) is updated as files complete, so a
+       later call only downloads files that are new or have changed.
+    Returns a list of the files that failed to download (after retries), which an additional call
+    will try again.
+
+    Parameters are as make_request.
+    """
+    values = make_query_values(study_id, access_key, secret_key, user_ids, data_streams, time_start, time_end)
+    registry_path = path.join(destination, "master_registry")
+    registry = {}
+    if path.exists(registry_path):
+        with open(registry_path) as f:
+            registry = json.load(f)
+
+    print("getting the list of files to download...")
+    manifest = get_manifest(values, encode_registry(registry))
+    progress = DownloadProgress(len(manifest), sum(entry["file_size"] or 0 for entry in manifest))
+    print("downloading %s files, %.1fMB, into %s" % (progress.total_files, progress.total_bytes / 1024 / 1024,
+                                                     path.abspath(destination)))
+
+    failures = []
+    last_saved = time.time()
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {
+            executor.submit(download_file, values, entry, destination, progress): entry for entry in manifest
+        }
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                registry[entry["chunk_path"]] = future.result()
+            except Exception as e:
+                failures.append(entry["file_name"])
+                print("\nfailed to download %s: %s" % (entry["file_name"], e))
+            progress.file_done()
+            # save the registry regularly so that an interrupted download does not start over.
+            if time.time() - last_saved > 10:
+                save_registry(registry, registry_path)
+                last_saved = time.time()
+
+    save_registry(registry, registry_path)
+    print("\nOperations complete, %s files failed." % len(failures) if failures else "\nOperations complete.")
+    return failures
+
+
+def get_manifest(values, registry):
+    """ Returns the full list of files to download, from all pages of the manifest. """
+    url = API_URL_BASE + 'get-data-manifest/v1'
+    manifest = []
+    cursor = ""
+    while cursor is not None:
+        response = requests.post(url, data=dict(values, cursor=cursor), files={"registry": ("registry", registry)})
+        response.raise_for_status()
+        page = response.json()
+        manifest.extend(page["chunks"])
+        cursor = page["next_cursor"]
+    return manifest
+
+
+_thread_local = threading.local()
+
+
+def _session():
+    # a requests Session per thread, each thread keeps its connection open between files.
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def get_expected_size(response, start, entry, file_hash):
+    """ The size the part file should have once the response has been written to it from byte
+    start, or None if it is unknown. """
+    content_length = response.headers.get("Content-Length")
+    # a Content-Length of a compressed response is not the size of what we write.
+    if content_length is not None and not response.headers.get("Content-Encoding"):
+        return start + int(content_length)
+    # the manifest's file_size is of the version of the file with the manifest's hash.
+    if file_hash == entry["chunk_hash"]:
+        return entry["file_size"]
+    return None
+
+
+def download_file(values, entry, destination, progress):
+    """ Downloads one file from the manifest to destination, resuming a partial download if there is
+    one.  Returns the registry hash of the file. """
+    url = API_URL_BASE + 'get-data-chunk/v1'
+    final_path = path.join(destination, entry["file_name"])
+    part_path = final_path + ".part"
+    os.makedirs(path.dirname(final_path) or ".", exist_ok=True)
+
+    # the registry records the hash the server has for the file (the hash of its compressed
+    # contents, not of the file we write).  If the file changed on the server since the manifest was
+    # made the response has the new hash.  (Some files have no hash, the empty string.)
+    file_hash = entry["chunk_hash"]
+    for attempt in range(DOWNLOAD_RETRIES):
+        start = path.getsize(part_path) if path.exists(part_path) else 0
+        headers = {"Range": "bytes=%s-" % start} if start else {}
+        try:
+            with _session().post(url, data=dict(values, chunk_id=entry["chunk_id"]), headers=headers,
+                                 stream=True, timeout=60) as response:
+                if response.status_code == 416:
+                    # the partial file is already complete (file_size is the size of the file we
+                    # receive), or is somehow longer than the file.
+                    if start == entry["file_size"]:
+                        break
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                file_hash = response.headers.get("X-Chunk-Hash", file_hash)
+                if response.status_code == 206 and file_hash != entry["chunk_hash"]:
+                    # the partial file is of an older version of the file.
+                    os.remove(part_path)
+                    entry = dict(entry, chunk_hash=file_hash, file_size=None)
+                    continue
+                # a 200 response is the whole file (the server ignores ranges on some files).
+                if response.status_code != 206:
+                    start = 0
+                expected_size = get_expected_size(response, start, entry, file_hash)
+                with open(part_path, "ab" if response.status_code == 206 else "wb") as f:
+                    for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+                        f.write(block)
+                        progress.add_bytes(len(block))
+            # a dropped connection can end the body early without an error.
+            received_size = path.getsize(part_path)
+            if expected_size is None or received_size == expected_size:
+                break
+            print("received %s of %s bytes of %s" % (received_size, expected_size, entry["file_name"]))
+            if received_size > expected_size:
+                os.remove(part_path)
+        except requests.RequestException:
+            if attempt == DOWNLOAD_RETRIES - 1:
+                raise
+        time.sleep(2 ** attempt)
+    else:
+        raise Exception("could not download %s after %s attempts" % (entry["file_name"], DOWNLOAD_RETRIES))
+
+    os.replace(part_path, final_path)
+    return file_hash
+
+
+def encode_registry(registry):
+    """ Encodes the registry in the server's compact binary registry format (see libs/registry.py in
+    the server code), which is much smaller than the json registry. """
+    shared_lengths, suffix_lengths, text_hash_lengths = array("H"), array("H"), array("H")
+    hash_types, suffixes, digests, text_hashes = bytearray(), bytearray(), bytearray(), bytearray()
+    previous_path = b""
+    items = sorted((key.encode(), value) for key, value in registry.items())
+    for file_path, file_hash in items:
+        shared = len(path.commonprefix([previous_path, file_path]))
+        shared_lengths.append(shared)
+        suffix_lengths.append(len(file_path) - shared)
+        suffixes += file_path[shared:]
+        previous_path = file_path
+        try:
+            digest = b64decode(file_hash, validate=True)
+        except ValueError:
+            digest = b""
+        if len(digest) == 16 and b64encode(digest).decode() == file_hash:
+            hash_types.append(1)
+            digests += digest
+        else:
+            hash_types.append(0)
+            text_hash_lengths.append(len(file_hash.encode()))
+            text_hashes += file_hash.encode()
+
+    if sys.byteorder == "big":
+        for uint16s in (shared_lengths, suffix_lengths, text_hash_lengths):
+            uint16s.byteswap()
+    body = b"".join([
+        struct.pack("<I", len(items)), shared_lengths.tobytes(), suffix_lengths.tobytes(), hash_types,
+        suffixes, digests, text_hash_lengths.tobytes(), text_hashes,
+    ])
+    return b"BRG1" + zlib.compress(body, 6)
+
+
+def save_registry(registry, registry_path):
+    """ Writes the registry to a temporary file and renames it over the old one, so that a crash
+    never leaves a truncated registry. """
+    with open(registry_path + ".tmp", "w") as f:
+        json.dump(registry, f)
+    os.replace(registry_path + ".tmp", registry_path)
+
+
+class DownloadProgress:
+    """ Thread safe download counters, prints a progress line at most twice per second. """
+
+    def __init__(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.start_time = time.time()
+        self.last_print = 0
+        self.lock = threading.Lock()
+
+    def add_bytes(self, number_bytes):
+        with self.lock:
+            self.bytes += number_bytes
+        self.print_progress()
+
+    def file_done(self):
+        with self.lock:
+            self.files += 1
+        self.print_progress(force=self.files == self.total_files)
+
+    def print_progress(self, force=False):
+        now = time.time()
+        if not force and now - self.last_print < 0.5:
+            return
+        self.last_print = now
+        megabytes = self.bytes / 1024 / 1024
+        elapsed = now - self.start_time
+        sys.stdout.write("\r%s/%s files, %.1f/%.1fMB, %.2fMB/s   " % (
+            self.files, self.total_files, megabytes, self.total_bytes / 1024 / 1024,
+            megabytes / elapsed if elapsed else 0,
+        ))
+        sys.stdout.flush()
+
+
 def get_users_request(study_id, access_key=ACCESS_KEY, secret_key=SECRET_KEY):
     """ Provides a list of user ids enrolled in the given study. """
     url = API_URL_BASE + 'get-users/v1'
@@ -162,3 +416,21 @@ def get_studies_request(access_key=ACCESS_KEY, secret_key=SECRET_KEY):
     }
     data = requests.post(url, data=values).content.decode()
     return json.loads(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download Beiwe data into a folder, resuming any previous download.")
+    parser.add_argument("study_id")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM,
+                        help="number of files to download at once (default %s)" % DEFAULT_PARALLELISM)
+    parser.add_argument("--user-ids", nargs="*", help="default: all users")
+    parser.add_argument("--data-streams", nargs="*", help="default: all data streams")
+    parser.add_argument("--time-start", help="YYYY-MM-DDThh:mm:ss")
+    parser.add_argument("--time-end", help="YYYY-MM-DDThh:mm:ss")
+    parser.add_argument("--destination", default=".")
+    args = parser.parse_args()
+    failed = download_data(
+        args.study_id, user_ids=args.user_ids, data_streams=args.data_streams, time_start=args.time_start,
+        time_end=args.time_end, parallelism=args.parallelism, destination=args.destination,
+    )
+    exit(1 if failed else 0)
@@ -1,7 +1,8 @@
 import json
 from random import choice as random_choice
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.db.models.fields.related import RelatedField
 
 from config.study_constants import OBJECT_ID_ALLOWED_CHARS
@@ -58,6 +59,21 @@ class AbstractModel(models.Model):
         
         return object_id
     
+    @classmethod
+    def add_or_create(cls, key: dict, amounts: dict, defaults: dict = None):
+        """ Adds amounts to the numeric fields of the row with these key fields (the fields of a
+        unique constraint), or creates the row with the amounts (and defaults) if there is none.
+        Safe to run concurrently: the addition happens in the database. """
+        changes = {field: F(field) + amount for field, amount in amounts.items()}
+        if cls.objects.filter(**key).update(**changes):
+            return
+        try:
+            # a savepoint, so that losing a race to create the row does not break the transaction.
+            with transaction.atomic():
+                cls.objects.bulk_create([cls(**key, **amounts, **(defaults or {}))])
+        except IntegrityError:
+            cls.objects.filter(**key).update(**changes)
+    
     @classmethod
     def query_set_as_native_json(cls, query_set, remove_timestamps=True):
         return json.dumps([obj.as_native_python(remove_timestamps) for obj in query_set])
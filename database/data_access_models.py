@@ -3,13 +3,17 @@ import random
 import string
 from datetime import datetime, timedelta
 
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from django_extensions.db.fields.json import JSONField
 
 from config.constants import (API_TIME_FORMAT, CHUNK_TIMESLICE_QUANTUM, CHUNKABLE_FILES,
-    CHUNKS_FOLDER, IDENTIFIERS, PIPELINE_FOLDER, REVERSE_UPLOAD_FILE_TYPE_MAPPING)
-from database.models import AbstractModel
+    CHUNKS_FOLDER, IDENTIFIERS, PIPELINE_FOLDER, processed_data_stream_dict, REDUCED_API_TIME_FORMAT,
+    REVERSE_UPLOAD_FILE_TYPE_MAPPING, SERVER_SUMMARY_STREAMS)
+from database.models import AbstractModel, JSONTextField
 from database.study_models import Study
 from database.user_models import Participant
 from database.validators import LengthValidator
@@ -42,6 +46,90 @@ class PipelineRegistry(AbstractModel):
         )
 
 
+def parse_pipeline_summary(processed_data):
+    """ Yields (data_stream, date, value) for the values of the processed data streams in the
+    processed_data of a PipelineRegistry, a list of dictionaries of a "day" (in
+    REDUCED_API_TIME_FORMAT) and values (as strings, "NA" if there is no value) by data stream.
+    Anything else is skipped. """
+    if isinstance(processed_data, (str, bytes)):
+        try:
+            processed_data = json.loads(processed_data)
+        except ValueError:
+            return
+    if not isinstance(processed_data, list):
+        return
+
+    for day_values in processed_data:
+        if not isinstance(day_values, dict) or "day" not in day_values:
+            continue
+        try:
+            day = datetime.strptime(day_values["day"], REDUCED_API_TIME_FORMAT).date()
+        except (TypeError, ValueError):
+            continue
+        for data_stream, value in day_values.items():
+            if data_stream not in processed_data_stream_dict or value == "NA":
+                continue
+            try:
+                yield data_stream, day, float(value)
+            except (TypeError, ValueError):
+                continue
+
+
+class PipelineSummaryValue(AbstractModel):
+    """
+    The values of the processed data streams on each day of each participant's most recent
+    PipelineRegistry, for the dashboards.  Parsed once when the pipeline data is uploaded (see
+    replace_values) instead of on every page view.
+    """
+    study = models.ForeignKey('Study', on_delete=models.PROTECT, related_name='pipeline_summary_values')
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='pipeline_summary_values')
+    data_stream = models.CharField(max_length=64)
+    date = models.DateField()
+    value = models.FloatField()
+
+    class Meta:
+        # the participant dashboard reads a participant's rows, the data stream dashboard reads a
+        # study's rows of one data stream.
+        unique_together = (("participant", "data_stream", "date"),)
+        indexes = [models.Index(fields=["study", "data_stream", "date"], name="pipelinesummary_study_idx")]
+
+    @classmethod
+    def replace_values(cls, study_id, participant_id, processed_data):
+        """ Replaces a participant's values with those of processed_data, see
+        parse_pipeline_summary.  (The dashboards show the most recent PipelineRegistry.)  If the
+        study has server_summaries turned on the values of SERVER_SUMMARY_STREAMS are computed on
+        the server, they are not replaced. """
+        server_streams = ()
+        if Study.objects.filter(pk=study_id, server_summaries=True).exists():
+            server_streams = SERVER_SUMMARY_STREAMS
+        values = {
+            (data_stream, day): value for data_stream, day, value in parse_pipeline_summary(processed_data)
+            if data_stream not in server_streams
+        }
+        with transaction.atomic():
+            cls.objects.filter(participant_id=participant_id).exclude(data_stream__in=server_streams).delete()
+            cls.objects.bulk_create([
+                cls(study_id=study_id, participant_id=participant_id, data_stream=data_stream, date=day, value=value)
+                for (data_stream, day), value in values.items()
+            ])
+
+    @classmethod
+    def replace_day_values(cls, study_id, participant_id, date, data_streams, values):
+        """ Replaces a participant's values of the data streams on a day with values, a dictionary
+        of data stream to value (data streams without a value have no value that day). """
+        with transaction.atomic():
+            cls.objects.filter(participant_id=participant_id, date=date, data_stream__in=data_streams).delete()
+            cls.objects.bulk_create([
+                cls(study_id=study_id, participant_id=participant_id, data_stream=data_stream, date=date, value=value)
+                for data_stream, value in values.items()
+            ])
+
+
+def display_pipeline_value(value: float):
+    """ Whole numbers are shown as integers. """
+    return int(value) if value.is_integer() else value
+
+
 class ChunkRegistry(AbstractModel):
     # this is declared in the abstract model but needs to be indexed for pipeline queries.
     last_updated = models.DateTimeField(auto_now=True, db_index=True)
@@ -60,13 +148,41 @@ class ChunkRegistry(AbstractModel):
     survey = models.ForeignKey('Survey', blank=True, null=True, on_delete=models.PROTECT, related_name='chunk_registries', db_index=True)
 
     file_size = models.IntegerField(null=True, default=None)
+    # the size of the file as the data access api serves it (decrypted, and decompressed for chunked
+    # data), null for files registered before it was recorded.
+    plaintext_size = models.BigIntegerField(blank=True, null=True, default=None)
+
+    class Meta:
+        # data downloads filter on all of these columns, see get_chunks_time_range.
+        indexes = [
+            models.Index(fields=["study", "participant", "data_type", "time_bin"], name="chunkregistry_download_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        chunk = super(ChunkRegistry, cls).from_db(db, field_names, values)
+        # the file size in the database, so that save can update DailyDataVolume by the difference.
+        chunk._saved_file_size = chunk.__dict__.get("file_size")
+        return chunk
+
+    def save(self, *args, **kwargs):
+        """ Saves the ChunkRegistry and updates the DailyDataVolume of its day in the same
+        transaction.  (QuerySet updates and deletes do not, see DailyDataVolume.rebuild.) """
+        adding = self._state.adding
+        with transaction.atomic():
+            super(ChunkRegistry, self).save(*args, **kwargs)
+            size_change = (self.file_size or 0) - (0 if adding else getattr(self, "_saved_file_size", 0) or 0)
+            if adding or size_change:
+                DailyDataVolume.add(self.study_id, self.participant_id, self.data_type,
+                                    self.time_bin.date(), size_change, 1 if adding else 0)
+        self._saved_file_size = self.file_size
 
     def s3_retrieve(self):
         return s3_retrieve(self.chunk_path, self.study.object_id)
 
     @classmethod
     def register_chunked_data(cls, data_type, time_bin, chunk_path, file_contents, study_id,
-                              participant_id, survey_id=None):
+                              participant_id, survey_id=None, plaintext_size=None):
         
         if data_type not in CHUNKABLE_FILES:
             raise UnchunkableDataTypeError
@@ -85,7 +201,7 @@ class ChunkRegistry(AbstractModel):
         # timezone so it should be generalizable) is to add UTC as a timezone when storing a naive
         # datetime in the database.
         
-        cls.objects.create(
+        return cls.objects.create(
             is_chunkable=True,
             chunk_path=chunk_path,
             chunk_hash=chunk_hash_str,
@@ -95,6 +211,7 @@ class ChunkRegistry(AbstractModel):
             participant_id=participant_id,
             survey_id=survey_id,
             file_size=len(file_contents),
+            plaintext_size=plaintext_size,
         )
     
     @classmethod
@@ -116,6 +233,7 @@ class ChunkRegistry(AbstractModel):
             participant_id=participant_id,
             survey_id=survey_id,
             file_size=len(file_contents),
+            plaintext_size=len(file_contents),
         )
 
     @classmethod
@@ -126,6 +244,7 @@ class ChunkRegistry(AbstractModel):
             raise ChunkableDataTypeError
         chunk = cls.objects.get(chunk_path=chunk_path)
         chunk.file_size = len(file_contents)
+        chunk.plaintext_size = len(file_contents)
         chunk.save()
 
 
@@ -135,11 +254,17 @@ class ChunkRegistry(AbstractModel):
         This function uses Django query syntax to provide datetimes and have Django do the
         comparison operation, and the 'in' operator to have Django only match the user list
         provided.
+
+        Every filter is on a column of the chunkregistry_download_idx index, the user list is
+        resolved to participant primary keys first so that the query does not join the participant
+        table.
         """
 
         query = {'study_id': study_id}
         if user_ids:
-            query['participant__patient_id__in'] = user_ids
+            query['participant_id__in'] = list(
+                Participant.objects.filter(patient_id__in=user_ids).values_list("pk", flat=True)
+            )
         if data_types:
             query['data_type__in'] = data_types
         if start:
@@ -148,6 +273,55 @@ class ChunkRegistry(AbstractModel):
             query['time_bin__lte'] = end
         return cls.objects.filter(**query)
 
+    @classmethod
+    def order_by_chunk_path(cls, query_set, after=None):
+        """
+        Orders a ChunkRegistry QuerySet by chunk_path in code point order (the order Python sorts
+        strings in), optionally only including chunk paths after the provided one.
+
+        Postgres orders text by the database's collation, which is usually not code point order,
+        so on Postgres the ordering uses the "C" collation.
+        """
+        if connections[query_set.db].vendor != "postgresql":
+            if after is not None:
+                query_set = query_set.filter(chunk_path__gt=after)
+            return query_set.order_by("chunk_path")
+
+        column = '"%s"."chunk_path" COLLATE "C"' % cls._meta.db_table
+        if after is not None:
+            query_set = query_set.extra(where=[column + " > %s"], params=[after])
+        return query_set.order_by(RawSQL(column, []).asc())
+
+    @classmethod
+    def iterate_by_pk(cls, values_query_set, page_size):
+        """
+        Iterates over a values() QuerySet (which must include "pk") in primary key order, reading
+        page_size rows per database query.  Each page starts after the last primary key of the
+        previous page (keyset pagination), so every page is as cheap as the first, and at most one
+        page of rows is in memory at a time.
+        """
+        last_pk = None
+        while True:
+            page = values_query_set if last_pk is None else values_query_set.filter(pk__gt=last_pk)
+            page = list(page.order_by("pk")[:page_size])
+            yield from page
+            if len(page) < page_size:
+                return
+            last_pk = page[-1]["pk"]
+
+    @classmethod
+    def iterate_by_chunk_path(cls, query_set, fields, page_size, after=None):
+        """
+        As iterate_by_pk, but in chunk_path order (see order_by_chunk_path), optionally only
+        including chunk paths after the provided one.  fields must include "chunk_path".
+        """
+        while True:
+            page = list(cls.order_by_chunk_path(query_set, after=after).values(*fields)[:page_size])
+            yield from page
+            if len(page) < page_size:
+                return
+            after = page[-1]["chunk_path"]
+
     def update_chunk_hash(self, data_to_hash):
         self.chunk_hash = chunk_hash(data_to_hash)
         self.save()
@@ -163,6 +337,267 @@ class ChunkRegistry(AbstractModel):
         ).values_list("participant__patient_id", flat=True).distinct()
 
 
+class DailyDataVolume(AbstractModel):
+    """
+    The number of bytes and files (ChunkRegistries) of each participant's data of each data stream
+    on each (UTC) day, for the dashboards.  Rows are updated as ChunkRegistries are created and
+    their files change size, see ChunkRegistry.save, and can be rebuilt from the ChunkRegistry
+    table with the backfill_daily_data_volume management command.
+    """
+    study = models.ForeignKey('Study', on_delete=models.PROTECT, related_name='daily_data_volumes')
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='daily_data_volumes')
+    data_type = models.CharField(max_length=32)
+    date = models.DateField()
+
+    bytes = models.BigIntegerField(default=0)
+    chunk_count = models.IntegerField(default=0)
+
+    class Meta:
+        # the participant dashboard reads a participant's rows, the data stream dashboard reads a
+        # study's rows of one data stream.
+        unique_together = (("participant", "data_type", "date"),)
+        indexes = [models.Index(fields=["study", "data_type", "date"], name="dailydatavolume_study_idx")]
+
+    @classmethod
+    def add(cls, study_id, participant_id, data_type, date, byte_count, chunk_count):
+        """ Adds to the totals of a day, creating its row if there is none. """
+        cls.add_or_create(
+            dict(participant_id=participant_id, data_type=data_type, date=date),
+            dict(bytes=byte_count, chunk_count=chunk_count),
+            defaults=dict(study_id=study_id),
+        )
+
+    @classmethod
+    def rebuild(cls, participant_id):
+        """ Replaces a participant's rows with totals computed from the ChunkRegistry table.  Chunks
+        that are created while this runs may be missed, run it again if files were processed. """
+        with transaction.atomic():
+            days = ChunkRegistry.objects.filter(participant_id=participant_id).annotate(
+                date=TruncDate("time_bin")
+            ).values("study_id", "data_type", "date").annotate(
+                total_bytes=Coalesce(Sum("file_size"), 0), total_chunks=Count("id")
+            ).order_by()
+            cls.objects.filter(participant_id=participant_id).delete()
+            cls.objects.bulk_create([
+                cls(
+                    study_id=day["study_id"],
+                    participant_id=participant_id,
+                    data_type=day["data_type"],
+                    date=day["date"],
+                    bytes=day["total_bytes"],
+                    chunk_count=day["total_chunks"],
+                ) for day in days
+            ])
+
+
+class ExportBundle(AbstractModel):
+    """
+    An immutable, pre-built zip of one participant's files of one data stream for one whole day or
+    month, stored encrypted.  Data downloads that include all of those files splice the bundle into
+    their zip instead of retrieving the files one by one, see libs.export_bundles.
+
+    The bundle is only valid while the period's ChunkRegistries are exactly chunk_ids and none of
+    them has been updated since chunks_last_updated.  Stale bundles are rebuilt.
+    """
+    DAY = "day"
+    MONTH = "month"
+    PERIODS = ((DAY, DAY), (MONTH, MONTH))
+
+    study = models.ForeignKey('Study', on_delete=models.PROTECT, related_name='export_bundles')
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='export_bundles')
+    data_type = models.CharField(max_length=32)
+    period = models.CharField(max_length=8, choices=PERIODS)
+    period_start = models.DateTimeField()
+
+    bundle_path = models.CharField(max_length=256, unique=True)
+    file_size = models.BigIntegerField()
+    chunk_count = models.IntegerField()
+    chunks_last_updated = models.DateTimeField()
+    # a json list of the pks of the ChunkRegistries in the bundle.
+    chunk_ids = JSONTextField()
+    # a json list of the zip entries in the bundle, see libs.export_bundles.zip_info_to_json.
+    zip_entries = JSONTextField()
+
+    class Meta:
+        unique_together = (("participant", "data_type", "period", "period_start"),)
+
+    def covers(self, chunks):
+        """ Whether the bundle contains exactly these chunks (dictionaries with pk and last_updated
+        keys) and is up to date. """
+        return (
+            {chunk["pk"] for chunk in chunks} == set(json.loads(self.chunk_ids))
+            and max(chunk["last_updated"] for chunk in chunks) <= self.chunks_last_updated
+        )
+
+
+class ResampledChunk(AbstractModel):
+    """
+    A cached resampling of a ChunkRegistry's file (see libs.resampling), stored encrypted.  It is
+    only valid while the chunk has not been updated since chunk_last_updated.  Stale resamplings
+    are rebuilt, see libs.resampled_chunks.
+    """
+    chunk = models.ForeignKey('ChunkRegistry', on_delete=models.CASCADE, related_name='resampled_chunks')
+    # window in milliseconds and method, see libs.resampling.Resample.
+    window = models.IntegerField()
+    method = models.CharField(max_length=16)
+
+    resampled_path = models.CharField(max_length=256, unique=True)
+    chunk_last_updated = models.DateTimeField()
+
+    class Meta:
+        unique_together = (("chunk", "window", "method"),)
+
+
+class SummarizedDay(AbstractModel):
+    """
+    A day (UTC) of a participant's files of a data stream that has been summarized into
+    PipelineSummaryValues on the server, and the most recent last_updated of the day's
+    ChunkRegistries at the time.  Days whose chunks have been updated since are summarized again.
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='summarized_days')
+    data_type = models.CharField(max_length=32)
+    date = models.DateField()
+    chunks_last_updated = models.DateTimeField()
+
+    class Meta:
+        unique_together = (("participant", "data_type", "date"),)
+
+
+class CommunicationContactDay(AbstractModel):
+    """
+    A participant's calls (or texts) with one contact (a hashed phone number) on one (UTC) day, the
+    running state of the communication summaries, see libs.communication_summaries.  Rows are
+    updated with the new rows of the call and text logs as they are chunked.
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='communication_contact_days')
+    data_type = models.CharField(max_length=32)
+    date = models.DateField()
+    contact = models.CharField(max_length=128)
+
+    incoming_count = models.IntegerField(default=0)
+    outgoing_count = models.IntegerField(default=0)
+    # call durations in seconds, text lengths in characters.
+    incoming_length = models.BigIntegerField(default=0)
+    outgoing_length = models.BigIntegerField(default=0)
+    # the texts sent in reply to a text from the contact, and the seconds taken to reply.
+    response_count = models.IntegerField(default=0)
+    response_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("participant", "data_type", "date", "contact"),)
+
+    @classmethod
+    def add(cls, participant_id, data_type, date, contact, **counts):
+        """ Adds to the counts of a contact's day, creating its row if there is none. """
+        cls.add_or_create(
+            dict(participant_id=participant_id, data_type=data_type, date=date, contact=contact), counts
+        )
+
+
+class CommunicationContact(AbstractModel):
+    """
+    The time (unix milliseconds) of the most recent text a participant received from a contact that
+    has not been replied to, for the responsiveness of the communication summaries, and of the most
+    recent text with the contact (texts older than that arrived late, they do not change the
+    unanswered text).
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='communication_contacts')
+    contact = models.CharField(max_length=128)
+    unanswered_since = models.BigIntegerField(blank=True, null=True)
+    last_seen = models.BigIntegerField(blank=True, null=True)
+
+    class Meta:
+        unique_together = (("participant", "contact"),)
+
+
+class ChunkStats(AbstractModel):
+    """
+    The samples (rows) of a ChunkRegistry's file: how many there are, the first and last
+    timestamps, the effective sampling rate and the longest gap between samples.  Recorded as files
+    are chunked (see libs.chunk_stats), so that the coverage of the data is known without
+    retrieving the files.  Chunks that have not been processed since this table was added have no
+    ChunkStats.
+    """
+    chunk = models.OneToOneField('ChunkRegistry', on_delete=models.CASCADE, related_name='stats')
+    sample_count = models.IntegerField()
+    # unix milliseconds
+    first_timestamp = models.BigIntegerField()
+    last_timestamp = models.BigIntegerField()
+    # samples per second between the first and last samples, and the longest time in milliseconds
+    # between samples, null if there is only one sample.
+    sampling_rate = models.FloatField(null=True)
+    max_gap = models.BigIntegerField(null=True)
+
+    @classmethod
+    def record(cls, chunk_id, stats):
+        """ Replaces the statistics of a chunk, see libs.chunk_stats.get_chunk_stats. """
+        if stats is None:
+            cls.objects.filter(chunk_id=chunk_id).delete()
+        else:
+            cls.objects.update_or_create(chunk_id=chunk_id, defaults=stats)
+
+
+class SurveyAnswerFile(AbstractModel):
+    """
+    The survey answers files uploaded by each participant, by survey, so that the most recent
+    answers to a survey (see libs.graph_data) are found with a query instead of listing all of the
+    participant's survey answers files on S3.  Filled by the upload endpoint, see register.
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='survey_answer_files')
+    survey_object_id = models.CharField(max_length=24)
+    # the path on S3 without the study folder, as uploaded, e.g. patient/surveyAnswers/survey/timestamp.csv
+    file_path = models.CharField(max_length=256, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["participant", "survey_object_id", "file_path"], name="surveyanswerfile_idx")
+        ]
+
+    @staticmethod
+    def get_survey_object_id(file_path):
+        """ The survey of a survey answers file path, or None if it is not a survey answers file. """
+        path_components = file_path.split("/")
+        if len(path_components) == 4 and path_components[1] == "surveyAnswers":
+            return path_components[2]
+        return None
+
+    @classmethod
+    def register(cls, participant, file_path):
+        """ Records an uploaded file if it is a survey answers file, and clears the participant's
+        cached results of that survey. """
+        survey_object_id = cls.get_survey_object_id(file_path)
+        if survey_object_id is None:
+            return
+        with transaction.atomic():
+            # files that are uploaded again are already registered.
+            if not cls.objects.filter(file_path=file_path).exists():
+                cls.objects.create(participant=participant, survey_object_id=survey_object_id, file_path=file_path)
+            SurveyResultsCache.objects.filter(participant=participant, survey_object_id=survey_object_id).delete()
+
+    @classmethod
+    def forget(cls, file_paths):
+        """ Removes the records (and the cached results) of deleted survey answers files. """
+        files = cls.objects.filter(file_path__in=file_paths)
+        for participant_id, survey_object_id in set(files.values_list("participant_id", "survey_object_id")):
+            SurveyResultsCache.objects.filter(participant_id=participant_id, survey_object_id=survey_object_id).delete()
+        files.delete()
+
+
+class SurveyResultsCache(AbstractModel):
+    """
+    A participant's results of a survey as shown on the graph page of the app (the output of
+    libs.graph_data.get_survey_results, as JSON), cleared when a survey answers file of the survey
+    is uploaded.
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='survey_results_caches')
+    survey_object_id = models.CharField(max_length=24)
+    number_points = models.PositiveIntegerField()
+    results = JSONTextField()
+
+    class Meta:
+        unique_together = (("participant", "survey_object_id", "number_points"),)
+
+
 class FileToProcess(AbstractModel):
 
     s3_file_path = models.CharField(max_length=256, blank=False)
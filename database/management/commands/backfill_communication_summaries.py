@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from config.constants import CALL_SUMMARY_STREAMS, TEXT_SUMMARY_STREAMS
+from database.data_access_models import (ChunkRegistry, CommunicationContact,
+    CommunicationContactDay, PipelineSummaryValue)
+from database.user_models import Participant
+from libs.communication_summaries import COMMUNICATION_DATA_TYPES, summarize_communications
+from libs.resampling import split_rows
+from libs.s3 import s3_retrieve
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the call and text summaries (and their running state) from the chunked call and text "
+            "logs, of the studies with server summaries turned on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--study", dest="study_object_ids", action="append", default=[],
+                            help="only rebuild the participants of this study, can be repeated.")
+
+    def handle(self, *args, **options):
+        participants = Participant.objects.filter(study__server_summaries=True)
+        if options["study_object_ids"]:
+            participants = participants.filter(study__object_id__in=options["study_object_ids"])
+
+        participants = list(participants.order_by("pk").values_list("pk", "study_id", "study__object_id"))
+        print("%s rebuilding the communication summaries of %s participants" % (datetime.now(), len(participants)))
+        for i, (participant_id, study_id, study_object_id) in enumerate(participants):
+            if i % 100 == 0:
+                print("%s %s of %s" % (datetime.now(), i, len(participants)))
+            with transaction.atomic():
+                CommunicationContactDay.objects.filter(participant_id=participant_id).delete()
+                CommunicationContact.objects.filter(participant_id=participant_id).delete()
+                PipelineSummaryValue.objects.filter(
+                    participant_id=participant_id, data_stream__in=CALL_SUMMARY_STREAMS + TEXT_SUMMARY_STREAMS
+                ).delete()
+                chunks = ChunkRegistry.objects.filter(
+                    participant_id=participant_id, data_type__in=COMMUNICATION_DATA_TYPES
+                ).order_by("time_bin").values_list("chunk_path", "data_type")
+                for chunk_path, data_type in chunks:
+                    header, rows = split_rows(s3_retrieve(chunk_path, study_object_id, raw_path=True))
+                    summarize_communications(
+                        study_id, participant_id, data_type, header, [row.split(b",") for row in rows]
+                    )
+        print("%s done" % datetime.now())
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from database.data_access_models import DailyDataVolume
+from database.user_models import Participant
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the DailyDataVolume table (used by the dashboards) from the ChunkRegistry table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--study", dest="study_object_ids", action="append", default=[],
+                            help="only rebuild the participants of this study, can be repeated.")
+
+    def handle(self, *args, **options):
+        participants = Participant.objects.all()
+        if options["study_object_ids"]:
+            participants = participants.filter(study__object_id__in=options["study_object_ids"])
+
+        participant_ids = list(participants.order_by("pk").values_list("pk", flat=True))
+        print("%s rebuilding daily data volumes of %s participants" % (datetime.now(), len(participant_ids)))
+        for i, participant_id in enumerate(participant_ids):
+            if i % 100 == 0:
+                print("%s %s of %s" % (datetime.now(), i, len(participant_ids)))
+            DailyDataVolume.rebuild(participant_id)
+        print("%s done" % datetime.now())
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from database.data_access_models import ChunkRegistry
+from libs.s3 import s3_retrieve_size
+
+
+class Command(BaseCommand):
+    help = ("Records the plaintext_size of ChunkRegistry entries registered before it was recorded, "
+            "the data access api needs it for ranged downloads and for sizing its prefetching.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--study", dest="study_object_ids", action="append", default=[],
+                            help="only backfill the chunks of this study, can be repeated.")
+
+    def handle(self, *args, **options):
+        chunks = ChunkRegistry.objects.filter(plaintext_size__isnull=True)
+        if options["study_object_ids"]:
+            chunks = chunks.filter(study__object_id__in=options["study_object_ids"])
+
+        print("%s backfilling plaintext sizes of %s chunks" % (datetime.now(), chunks.count()))
+        # keyset pages by primary key, this is a huge table and rows are updated as we go.
+        last_pk = 0
+        done = 0
+        while True:
+            page = list(
+                chunks.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "chunk_path")[:1000]
+            )
+            if not page:
+                break
+            for pk, chunk_path in page:
+                try:
+                    plaintext_size = s3_retrieve_size(chunk_path, None, raw_path=True)
+                except Exception as e:
+                    # e.g. a missing file, the chunk is left for the next run.
+                    print("%s could not get the size of %s: %s" % (datetime.now(), chunk_path, e))
+                    continue
+                # plaintext_size is not tracked by DailyDataVolume, so a queryset update is fine.  A
+                # chunk that was re-uploaded in the meantime already has its new size.
+                ChunkRegistry.objects.filter(pk=pk, plaintext_size__isnull=True).update(plaintext_size=plaintext_size)
+            last_pk = page[-1][0]
+            done += len(page)
+            print("%s %s done" % (datetime.now(), done))
+        print("%s done" % datetime.now())
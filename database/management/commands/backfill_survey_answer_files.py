@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from database.data_access_models import SurveyAnswerFile, SurveyResultsCache
+from database.user_models import Participant
+from libs.s3 import s3_list_files
+
+
+class Command(BaseCommand):
+    help = "Fills the SurveyAnswerFile table (used by the graph page of the app) from the files on S3."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--study", dest="study_object_ids", action="append", default=[],
+                            help="only fill in the participants of this study, can be repeated.")
+
+    def handle(self, *args, **options):
+        participants = Participant.objects.all()
+        if options["study_object_ids"]:
+            participants = participants.filter(study__object_id__in=options["study_object_ids"])
+
+        participants = list(participants.order_by("pk").values_list("pk", "patient_id", "study__object_id"))
+        print("%s filling in the survey answers files of %s participants" % (datetime.now(), len(participants)))
+        for i, (participant_id, patient_id, study_object_id) in enumerate(participants):
+            if i % 100 == 0:
+                print("%s %s of %s" % (datetime.now(), i, len(participants)))
+            prefix = "%s/%s/surveyAnswers/" % (study_object_id, patient_id)
+            # paths on S3 start with the study folder.
+            file_paths = [file_path.split("/", 1)[1] for file_path in s3_list_files(prefix, as_generator=True)]
+            known_file_paths = set(
+                SurveyAnswerFile.objects.filter(participant_id=participant_id).values_list("file_path", flat=True)
+            )
+            new_files = [
+                SurveyAnswerFile(
+                    participant_id=participant_id,
+                    survey_object_id=SurveyAnswerFile.get_survey_object_id(file_path),
+                    file_path=file_path,
+                )
+                for file_path in file_paths
+                if file_path not in known_file_paths and SurveyAnswerFile.get_survey_object_id(file_path)
+            ]
+            if new_files:
+                SurveyAnswerFile.objects.bulk_create(new_files)
+                # results cached before the files were filled in are missing their answers.
+                SurveyResultsCache.objects.filter(participant_id=participant_id).delete()
+        print("%s done" % datetime.now())
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0025_auto_20200106_2153'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkregistry',
+            name='plaintext_size',
+            field=models.BigIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import database.common_models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0026_chunkregistry_plaintext_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportBundle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_type', models.CharField(max_length=32)),
+                ('period', models.CharField(choices=[('day', 'day'), ('month', 'month')], max_length=8)),
+                ('period_start', models.DateTimeField()),
+                ('bundle_path', models.CharField(max_length=256, unique=True)),
+                ('file_size', models.BigIntegerField()),
+                ('chunk_count', models.IntegerField()),
+                ('chunks_last_updated', models.DateTimeField()),
+                ('chunk_ids', database.common_models.JSONTextField()),
+                ('zip_entries', database.common_models.JSONTextField()),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='export_bundles', to='database.Participant')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='export_bundles', to='database.Study')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='exportbundle',
+            unique_together=set([('participant', 'data_type', 'period', 'period_start')]),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0027_exportbundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResampledChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('window', models.IntegerField()),
+                ('method', models.CharField(max_length=16)),
+                ('resampled_path', models.CharField(max_length=256, unique=True)),
+                ('chunk_last_updated', models.DateTimeField()),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resampled_chunks', to='database.ChunkRegistry')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='resampledchunk',
+            unique_together=set([('chunk', 'window', 'method')]),
+        ),
+    ]
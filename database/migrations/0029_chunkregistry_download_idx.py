@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0028_resampledchunk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chunkregistry',
+            index=models.Index(fields=['study', 'participant', 'data_type', 'time_bin'], name='chunkregistry_download_idx'),
+        ),
+    ]
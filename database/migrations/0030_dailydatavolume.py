@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0029_chunkregistry_download_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDataVolume',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_type', models.CharField(max_length=32)),
+                ('date', models.DateField()),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_data_volumes', to='database.Participant')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_data_volumes', to='database.Study')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailydatavolume',
+            index=models.Index(fields=['study', 'data_type', 'date'], name='dailydatavolume_study_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailydatavolume',
+            unique_together=set([('participant', 'data_type', 'date')]),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0030_dailydatavolume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineSummaryValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_stream', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pipeline_summary_values', to='database.Participant')),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pipeline_summary_values', to='database.Study')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pipelinesummaryvalue',
+            index=models.Index(fields=['study', 'data_stream', 'date'], name='pipelinesummary_study_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pipelinesummaryvalue',
+            unique_together=set([('participant', 'data_stream', 'date')]),
+        ),
+    ]
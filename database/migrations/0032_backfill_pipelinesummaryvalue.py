@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from datetime import datetime
+
+from django.db import migrations
+
+# copies of the data stream names and the parser as they were when this migration was written, so
+# that later changes to the live code do not change what this migration does.
+PROCESSED_DATA_STREAMS = {
+    "responsiveness", "outgoing_calllengths", "call_indegree", "incoming_calllengths", "reciprocity",
+    "call_outdegree", "incoming_calls", "outgoing_calls", "outgoing_textlengths", "text_indegree",
+    "incoming_textlengths", "text_outdegree", "incoming_texts", "outgoing_texts", "RoG_km", "MaxDiam_km",
+    "StdFlightDur_min", "AvgFlightLen_km", "Hometime_hrs", "AvgFlightDur_min", "DistTravelled_km",
+    "StdFlightLen_km", "MaxHomeDist_km",
+}
+
+
+def parse_pipeline_summary(processed_data):
+    """ Yields (data_stream, date, value) for the values of the processed data streams in the
+    processed_data of a PipelineRegistry, a list of dictionaries of a "day" (YYYY-MM-DD) and values
+    (as strings, "NA" if there is no value) by data stream.  Anything else is skipped. """
+    if isinstance(processed_data, (str, bytes)):
+        try:
+            processed_data = json.loads(processed_data)
+        except ValueError:
+            return
+    if not isinstance(processed_data, list):
+        return
+
+    for day_values in processed_data:
+        if not isinstance(day_values, dict) or "day" not in day_values:
+            continue
+        try:
+            day = datetime.strptime(day_values["day"], "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            continue
+        for data_stream, value in day_values.items():
+            if data_stream not in PROCESSED_DATA_STREAMS or value == "NA":
+                continue
+            try:
+                yield data_stream, day, float(value)
+            except (TypeError, ValueError):
+                continue
+
+
+def backfill_pipeline_summary_values(apps, schema_editor):
+    """ Populates PipelineSummaryValue from each participant's most recent PipelineRegistry. """
+    PipelineRegistry = apps.get_model('database', 'PipelineRegistry')
+    PipelineSummaryValue = apps.get_model('database', 'PipelineSummaryValue')
+
+    participant_ids = PipelineRegistry.objects.values_list("participant_id", flat=True).distinct()
+    for participant_id in list(participant_ids):
+        pipeline_registry = PipelineRegistry.objects.filter(participant_id=participant_id).order_by("uploaded_at").last()
+        values = {
+            (data_stream, day): value
+            for data_stream, day, value in parse_pipeline_summary(pipeline_registry.processed_data)
+        }
+        PipelineSummaryValue.objects.bulk_create([
+            PipelineSummaryValue(
+                study_id=pipeline_registry.study_id,
+                participant_id=participant_id,
+                data_stream=data_stream,
+                date=day,
+                value=value,
+            ) for (data_stream, day), value in values.items()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0031_pipelinesummaryvalue'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pipeline_summary_values, migrations.RunPython.noop),
+    ]
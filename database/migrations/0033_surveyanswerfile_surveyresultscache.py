@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+import database.common_models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0032_backfill_pipelinesummaryvalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveyAnswerFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('survey_object_id', models.CharField(max_length=24)),
+                ('file_path', models.CharField(max_length=256, unique=True)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='survey_answer_files', to='database.Participant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SurveyResultsCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('survey_object_id', models.CharField(max_length=24)),
+                ('number_points', models.PositiveIntegerField()),
+                ('results', database.common_models.JSONTextField()),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='survey_results_caches', to='database.Participant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='surveyanswerfile',
+            index=models.Index(fields=['participant', 'survey_object_id', 'file_path'], name='surveyanswerfile_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='surveyresultscache',
+            unique_together=set([('participant', 'survey_object_id', 'number_points')]),
+        ),
+    ]
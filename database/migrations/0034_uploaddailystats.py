@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0033_surveyanswerfile_surveyresultscache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_stream', models.CharField(max_length=32)),
+                ('date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='upload_daily_stats', to='database.Participant')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='uploadtracking',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='uploaddailystats',
+            index=models.Index(fields=['date', 'data_stream'], name='uploaddailystats_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploaddailystats',
+            unique_together=set([('participant', 'data_stream', 'date')]),
+        ),
+    ]
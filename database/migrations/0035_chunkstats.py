@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0034_uploaddailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('sample_count', models.IntegerField()),
+                ('first_timestamp', models.BigIntegerField()),
+                ('last_timestamp', models.BigIntegerField()),
+                ('sampling_rate', models.FloatField(null=True)),
+                ('max_gap', models.BigIntegerField(null=True)),
+                ('chunk', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='database.ChunkRegistry')),
+            ],
+        ),
+    ]
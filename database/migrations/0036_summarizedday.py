@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0035_chunkstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummarizedDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_type', models.CharField(max_length=32)),
+                ('date', models.DateField()),
+                ('chunks_last_updated', models.DateTimeField()),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='summarized_days', to='database.Participant')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='summarizedday',
+            unique_together=set([('participant', 'data_type', 'date')]),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0036_summarizedday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunicationContact',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('contact', models.CharField(max_length=128)),
+                ('unanswered_since', models.BigIntegerField(blank=True, null=True)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='communication_contacts', to='database.Participant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommunicationContactDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('data_type', models.CharField(max_length=32)),
+                ('date', models.DateField()),
+                ('contact', models.CharField(max_length=128)),
+                ('incoming_count', models.IntegerField(default=0)),
+                ('outgoing_count', models.IntegerField(default=0)),
+                ('incoming_length', models.BigIntegerField(default=0)),
+                ('outgoing_length', models.BigIntegerField(default=0)),
+                ('response_count', models.IntegerField(default=0)),
+                ('response_seconds', models.BigIntegerField(default=0)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='communication_contact_days', to='database.Participant')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='communicationcontactday',
+            unique_together=set([('participant', 'data_type', 'date', 'contact')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='communicationcontact',
+            unique_together=set([('participant', 'contact')]),
+        ),
+    ]
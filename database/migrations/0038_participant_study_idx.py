@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0037_communicationcontact_communicationcontactday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['study', 'patient_id'], name='participant_study_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0038_participant_study_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='study',
+            name='server_summaries',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0039_study_server_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communicationcontact',
+            name='last_seen',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
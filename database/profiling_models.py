@@ -1,12 +1,16 @@
-from datetime import timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta
 from time import sleep
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 
-from config.constants import UPLOAD_FILE_TYPE_MAPPING
+from config.constants import UPLOAD_FILE_TYPE_MAPPING, UPLOAD_TRACKING_RETENTION_DAYS
 from libs.security import decode_base64
 from database.models import JSONTextField, AbstractModel, Participant
+from database.routers import read_database
 
 
 class EncryptionErrorMetadata(AbstractModel):
@@ -68,7 +72,8 @@ class UploadTracking(AbstractModel):
     
     file_path = models.CharField(max_length=256)
     file_size = models.PositiveIntegerField()
-    timestamp = models.DateTimeField()
+    # indexed for UploadTracking.compact.
+    timestamp = models.DateTimeField(db_index=True)
 
     participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='upload_trackers')
 
@@ -113,46 +118,145 @@ class UploadTracking(AbstractModel):
 
     @classmethod
     def weekly_stats(cls, days=7, get_usernames=False):
+        """ Upload counts, megabytes and users by data stream (and in total) of the past days,
+        aggregated from UploadDailyStats.  Days are whole (UTC) days, starting with the day it was
+        [days] days ago. """
         ALL_FILETYPES = UPLOAD_FILE_TYPE_MAPPING.values()
         if get_usernames:
             data = {filetype: {"megabytes": 0., "count": 0, "users": set()} for filetype in ALL_FILETYPES}
         else:
             data = {filetype: {"megabytes": 0., "count": 0} for filetype in ALL_FILETYPES}
-        
-        data["totals"] = {}
-        data["totals"]["total_megabytes"] = 0
-        data["totals"]["total_count"] = 0
-        data["totals"]["users"] = set()
-        days_delta = timezone.now() - timedelta(days=days)
-        # .values is a huge speedup, .iterator isn't but it does let us print progress realistically
-        query = UploadTracking.objects.filter(timestamp__gte=days_delta).values(
-                "file_path", "file_size", "participant"
-        ).iterator()
-        
-        for i, upload in enumerate(query):
-            # global stats
-            data["totals"]["total_count"] += 1
-            data["totals"]["total_megabytes"] += upload["file_size"]/ 1024. / 1024.
-            data["totals"]["users"].add(upload["participant"])
-            
-            # get data stream type from file_path (woops, ios log broke this code, fixed)
-            path_extraction = upload["file_path"].split("/", 2)[1]
-            if path_extraction == "ios":
-                path_extraction = "ios_log"
-                
-            file_type = UPLOAD_FILE_TYPE_MAPPING[path_extraction]
-            # update per-data-stream information
-            data[file_type]["megabytes"] += upload["file_size"]/ 1024. / 1024.
-            data[file_type]["count"] += 1
-            
-            if get_usernames:
-                data[file_type]["users"].add(upload["participant"])
-            if i % 10000 == 0:
-                print("processed %s uploads..." % i)
-        
-        data["totals"]["user_count"] = len(data["totals"]["users"])
-        
-        if not get_usernames:  # purge usernames if we don't need them.
-            del data["totals"]["users"]
-        
+
+        start_date = (timezone.now() - timedelta(days=days)).date()
+        for data_stream, stream_totals in UploadDailyStats.get_totals(start_date).items():
+            stream_data = data.setdefault(data_stream, {"megabytes": 0., "count": 0})
+            stream_data["megabytes"] = stream_totals["bytes"] / 1024. / 1024.
+            stream_data["count"] = stream_totals["count"]
+
+        stats = UploadDailyStats.objects.using(read_database()).filter(date__gte=start_date)
+        totals = stats.aggregate(
+            count=Coalesce(Sum("count"), 0),
+            bytes=Coalesce(Sum("bytes"), 0),
+            user_count=Count("participant", distinct=True),
+        )
+        data["totals"] = {
+            "total_megabytes": totals["bytes"] / 1024. / 1024.,
+            "total_count": totals["count"],
+            "user_count": totals["user_count"],
+        }
+
+        if get_usernames:
+            data["totals"]["users"] = set()
+            for data_stream, participant_id in stats.values_list("data_stream", "participant").distinct():
+                data.setdefault(data_stream, {"megabytes": 0., "count": 0}).setdefault("users", set()).add(participant_id)
+                data["totals"]["users"].add(participant_id)
+
         return data
+
+    @staticmethod
+    def get_data_stream(file_path):
+        """ The data stream of an uploaded file's path, e.g. patient/gps/timestamp.csv """
+        # (woops, ios log broke this code, fixed)
+        path_extraction = file_path.split("/", 2)[1]
+        if path_extraction == "ios":
+            path_extraction = "ios_log"
+        return UPLOAD_FILE_TYPE_MAPPING.get(path_extraction, path_extraction)
+
+    @classmethod
+    def track(cls, file_path, file_size, participant):
+        """ Records an upload, and counts it in the UploadDailyStats of its day. """
+        now = timezone.now()
+        with transaction.atomic():
+            cls.objects.create(file_path=file_path, file_size=file_size, timestamp=now, participant=participant)
+            UploadDailyStats.add(participant.pk, cls.get_data_stream(file_path), now.date(), 1, file_size)
+
+    @classmethod
+    def compact(cls, now=None):
+        """ Deletes the rows older than UPLOAD_TRACKING_RETENTION_DAYS.  Days whose rows are not all
+        counted in UploadDailyStats (uploads from before it existed) are rolled up first.  Run
+        daily. """
+        today = (now or timezone.now()).date()
+        rolled_up = dict(
+            UploadDailyStats.objects.filter(date__lt=today).values("date").annotate(
+                total=Sum("count")
+            ).order_by().values_list("date", "total")
+        )
+        tracked_days = cls.objects.filter(timestamp__lt=day_start(today)).annotate(
+            date=TruncDate("timestamp")
+        ).values("date").annotate(total=Count("id")).order_by().values_list("date", "total")
+        for date, total in sorted(tracked_days):
+            if rolled_up.get(date) != total:
+                print("rolling up the uploads of %s" % date)
+                UploadDailyStats.rebuild(date)
+
+        if UPLOAD_TRACKING_RETENTION_DAYS > 0:
+            horizon = day_start(today - timedelta(days=UPLOAD_TRACKING_RETENTION_DAYS))
+            deleted, _ = cls.objects.filter(timestamp__lt=horizon).delete()
+            print("deleted %s upload tracking rows from before %s" % (deleted, horizon.date()))
+
+
+def day_start(date):
+    return datetime.combine(date, datetime.min.time()).replace(tzinfo=timezone.utc)
+
+
+class UploadDailyStats(AbstractModel):
+    """
+    The number and bytes of the files uploaded by each participant of each data stream on each
+    (UTC) day.  Updated as files are uploaded (see UploadTracking.track), so that upload statistics
+    are aggregated in the database and old UploadTracking rows can be deleted, see
+    UploadTracking.compact.
+    """
+    participant = models.ForeignKey('Participant', on_delete=models.PROTECT, related_name='upload_daily_stats')
+    data_stream = models.CharField(max_length=32)
+    date = models.DateField()
+
+    count = models.IntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("participant", "data_stream", "date"),)
+        indexes = [models.Index(fields=["date", "data_stream"], name="uploaddailystats_date_idx")]
+
+    @classmethod
+    def add(cls, participant_id, data_stream, date, count, byte_count):
+        """ Adds to the totals of a day, creating its row if there is none. """
+        cls.add_or_create(
+            dict(participant_id=participant_id, data_stream=data_stream, date=date),
+            dict(count=count, bytes=byte_count),
+        )
+
+    @classmethod
+    def rebuild(cls, date):
+        """ Replaces the rows of a day with totals computed from the UploadTracking table. """
+        totals = defaultdict(lambda: [0, 0])
+        uploads = UploadTracking.objects.filter(
+            timestamp__gte=day_start(date), timestamp__lt=day_start(date + timedelta(days=1))
+        ).values_list("participant_id", "file_path", "file_size").iterator()
+        # the data stream is part of the file path, which is parsed in python.
+        for participant_id, file_path, file_size in uploads:
+            day_totals = totals[participant_id, UploadTracking.get_data_stream(file_path)]
+            day_totals[0] += 1
+            day_totals[1] += file_size
+
+        with transaction.atomic():
+            cls.objects.filter(date=date).delete()
+            cls.objects.bulk_create([
+                cls(participant_id=participant_id, data_stream=data_stream, date=date, count=count, bytes=byte_count)
+                for (participant_id, data_stream), (count, byte_count) in totals.items()
+            ])
+
+    @classmethod
+    def get_totals(cls, start_date, end_date=None, **filters):
+        """ {data stream: {"count": uploads, "bytes": bytes, "user_count": participants}} of the days
+        from start_date through end_date (or today), filters are further filters of the rows, e.g.
+        participant__study_id=study.pk. """
+        stats = cls.objects.using(read_database()).filter(date__gte=start_date, **filters)
+        if end_date is not None:
+            stats = stats.filter(date__lte=end_date)
+        rows = stats.values("data_stream").annotate(
+            count=Sum("count"), bytes=Sum("bytes"), user_count=Count("participant", distinct=True)
+        ).order_by()
+        return {
+            row["data_stream"]: {"count": row["count"], "bytes": row["bytes"], "user_count": row["user_count"]}
+            for row in rows
+        }
@@ -0,0 +1,111 @@
+import random
+from contextlib import ContextDecorator
+from threading import Lock, local
+from time import monotonic
+
+from django.conf import settings
+from django.db import connections
+
+from config.constants import REPLICA_LAG_CHECK_INTERVAL, REPLICA_MAX_LAG_SECONDS
+
+PRIMARY_DATABASE = "default"
+
+_state = local()
+_lag_lock = Lock()
+_lag_checked_at = {}  # alias -> (monotonic time of the check, whether the replica was usable)
+
+
+class ReadReplicaRouter:
+    """
+    Sends reads made inside a read_replica() block to a replica database, every other query goes to
+    the primary.  Replicas are any database alias other than "default", see
+    config/django_settings.py.  Only code that can tolerate slightly stale data should use this:
+    the dashboard, the data access api, and reporting.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, "depth", 0):
+            return read_database()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every database holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are migrated by replication, but a local sqlite replica is a real database.  (The
+        # test replica mirrors the test database, the test runner does not migrate it.)
+        return True
+
+
+class read_replica(ContextDecorator):
+    """ Context manager and decorator; reads inside it are routed to a replica.  Querysets are
+    routed when they are evaluated, so evaluate them inside the block (or use
+    queryset.using(read_database()) for querysets that are returned lazily). """
+
+    def __enter__(self):
+        _state.depth = getattr(_state, "depth", 0) + 1
+        return self
+
+    def __exit__(self, *exc):
+        _state.depth -= 1
+        return False
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY_DATABASE]
+
+
+def read_database() -> str:
+    """ Returns a replica alias that is within REPLICA_MAX_LAG_SECONDS of the primary, or the
+    primary if there is no such replica.  Reads inside a transaction on the primary stay on the
+    primary so that they see the transaction's own writes. """
+    if connections[PRIMARY_DATABASE].in_atomic_block:
+        return PRIMARY_DATABASE
+    usable = [alias for alias in replica_aliases() if replica_is_usable(alias)]
+    if not usable:
+        return PRIMARY_DATABASE
+    return random.choice(usable)
+
+
+def replica_is_usable(alias) -> bool:
+    now = monotonic()
+    with _lag_lock:
+        checked_at, usable = _lag_checked_at.get(alias, (None, False))
+        if checked_at is not None and now - checked_at < REPLICA_LAG_CHECK_INTERVAL:
+            return usable
+
+    try:
+        usable = replica_lag_seconds(alias) <= REPLICA_MAX_LAG_SECONDS
+    except Exception as e:
+        print("could not determine replication lag of database '%s': %s" % (alias, e))
+        usable = False
+
+    with _lag_lock:
+        _lag_checked_at[alias] = (now, usable)
+    return usable
+
+
+def replica_lag_seconds(alias) -> float:
+    """ How far behind the primary a replica is.  Databases that do not replicate (e.g. the local
+    sqlite replica) are never behind. """
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+
+    with connection.cursor() as cursor:
+        # a replica that has replayed everything it has received is caught up, even if nothing has
+        # been written to the primary for a while (which would make the replay timestamp old).
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def clear_replica_lag_cache():
+    with _lag_lock:
+        _lag_checked_at.clear()
@@ -26,6 +26,10 @@ class Study(AbstractModel):
                                  help_text='ID used for naming S3 files')
 
     is_test = models.BooleanField(default=True)
+    # whether the dashboards' GPS, call and text summaries (SERVER_SUMMARY_STREAMS) are computed on
+    # the server (see libs.gps_summaries and libs.communication_summaries) instead of taken from
+    # pipeline uploads.
+    server_summaries = models.BooleanField(default=False)
 
     @classmethod
     def create_with_object_id(cls, **kwargs):
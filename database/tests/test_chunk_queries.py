@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from config.constants import ACCELEROMETER, GPS
+from database.data_access_models import ChunkRegistry
+from database.tests.tests import create_participants, create_study
+from database.user_models import Participant
+
+
+class TestChunkRegistryQueries(TestCase):
+
+    def setUp(self):
+        self.study = create_study()
+        participants = create_participants(self.study, ["patient1", "patient2"])
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        ChunkRegistry.objects.bulk_create([
+            ChunkRegistry(
+                is_chunkable=True,
+                chunk_path="CHUNKED_DATA/%s/%s/%s/%s.csv" % (self.study.object_id, participant.patient_id, data_type, hour),
+                data_type=data_type,
+                time_bin=start + timedelta(hours=hour),
+                study=self.study,
+                participant=participant,
+            )
+            for participant in participants for data_type in [ACCELEROMETER, GPS] for hour in range(5)
+        ])
+
+    def query_plan(self, query_set):
+        sql, params = query_set.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " ".join(str(row) for row in cursor.fetchall())
+
+    def test_time_range_query_uses_the_download_index(self):
+        chunks = ChunkRegistry.get_chunks_time_range(
+            self.study.pk, user_ids=["patient1"], data_types=[GPS],
+            start=datetime(2020, 1, 1, 1, tzinfo=timezone.utc), end=datetime(2020, 1, 1, 3, tzinfo=timezone.utc),
+        )
+        plan = self.query_plan(chunks)
+        self.assertIn("chunkregistry_download_idx", plan)
+        # the patient ids are resolved before the query, it does not join the participant table.
+        self.assertNotIn(Participant._meta.db_table, plan)
+        self.assertEqual(chunks.count(), 3)
+
+    def test_iterate_by_pk_reads_pages(self):
+        chunks = ChunkRegistry.objects.values("pk", "chunk_path")
+        # 20 chunks in pages of 6, the last query finds the last page is short.
+        with self.assertNumQueries(4):
+            results = list(ChunkRegistry.iterate_by_pk(chunks, 6))
+        self.assertEqual(results, list(chunks.order_by("pk")))
+
+    def test_iterate_by_chunk_path_reads_pages(self):
+        chunks = ChunkRegistry.objects.all()
+        expected = sorted(chunks.values_list("chunk_path", flat=True))
+        with self.assertNumQueries(5):
+            results = list(ChunkRegistry.iterate_by_chunk_path(chunks, ["chunk_path"], 5))
+        self.assertEqual([chunk["chunk_path"] for chunk in results], expected)
+        results = ChunkRegistry.iterate_by_chunk_path(chunks, ["chunk_path"], 5, after=expected[11])
+        self.assertEqual([chunk["chunk_path"] for chunk in results], expected[12:])
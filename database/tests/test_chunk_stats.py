@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from libs.chunk_stats import get_chunk_stats
+
+
+class TestChunkStats(TestCase):
+
+    def test_chunk_stats(self):
+        rows = [[b"1000", b"a"], [b"1500", b"b"], [b"1500", b"b"], [b"3000", b"c"], [b"3100", b"d"]]
+        self.assertEqual(get_chunk_stats(rows, 4), {
+            "sample_count": 4,
+            "first_timestamp": 1000,
+            "last_timestamp": 3100,
+            "sampling_rate": 3 * 1000 / 2100,
+            "max_gap": 1500,
+        })
+
+    def test_one_row(self):
+        self.assertEqual(get_chunk_stats([[b"1000", b"a"]], 1), {
+            "sample_count": 1,
+            "first_timestamp": 1000,
+            "last_timestamp": 1000,
+            "sampling_rate": None,
+            "max_gap": None,
+        })
+        self.assertIsNone(get_chunk_stats([], 0))
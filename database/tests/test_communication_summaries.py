@@ -0,0 +1,118 @@
+from datetime import date
+
+from cronutils.error_handler import ErrorHandler
+from django.test import TestCase
+
+from config.constants import CALL_LOG, TEXTS_LOG
+from database.data_access_models import CommunicationContactDay, PipelineSummaryValue
+from database.tests.tests import create_participant, create_study
+from libs.communication_summaries import (new_unique_rows, parse_communications,
+    summarize_chunked_communications, summarize_communications)
+
+CALL_HEADER = b"timestamp,UTC time,hashed phone number,call type,duration in seconds"
+TEXT_HEADER = b"timestamp,UTC time,hashed phone number,sent vs received,message length,time sent"
+
+# 2020-01-01T00:00:00 UTC
+DAY = 1577836800000
+
+
+def make_rows(rows):
+    return [[b"%d" % timestamp, b"2020-01-01T00:00:00.000", contact, direction, length, b""][:columns]
+            for timestamp, contact, direction, length, columns in rows]
+
+
+class TestCommunicationSummaries(TestCase):
+
+    def setUp(self):
+        self.study = create_study(server_summaries=True)
+        self.participant = create_participant(self.study)
+
+    def values(self, day=date(2020, 1, 1)):
+        return dict(PipelineSummaryValue.objects.filter(date=day).values_list("data_stream", "value"))
+
+    def summarize(self, data_type, header, rows):
+        summarize_communications(self.study.pk, self.participant.pk, data_type, header, rows)
+
+    def test_parse_skips_missed_calls(self):
+        rows = make_rows([
+            (DAY, b"a", b"Incoming Call", b"60", 5),
+            (DAY + 1000, b"b", b"Missed Call", b"0", 5),
+            (DAY + 2000, b"c", b"Outgoing Call", b"30", 5),
+            (DAY + 3000, b"c", b"Outgoing Call", b"30", 4),
+        ])
+        self.assertEqual(
+            list(parse_communications(CALL_LOG, CALL_HEADER, rows)),
+            [(DAY, "a", True, 60), (DAY + 2000, "c", False, 30)],
+        )
+
+    def test_calls(self):
+        self.summarize(CALL_LOG, CALL_HEADER, make_rows([
+            (DAY, b"a", b"Incoming Call", b"60", 5),
+            (DAY + 1000, b"a", b"Outgoing Call", b"30", 5),
+            (DAY + 2000, b"b", b"Outgoing Call", b"10", 5),
+        ]))
+        self.assertEqual(self.values(), {
+            "incoming_calls": 1, "outgoing_calls": 2, "incoming_calllengths": 60, "outgoing_calllengths": 40,
+            "call_indegree": 1, "call_outdegree": 2,
+        })
+
+        # new rows update the day's values.
+        self.summarize(CALL_LOG, CALL_HEADER, make_rows([(DAY + 3000, b"c", b"Incoming Call", b"5", 5)]))
+        self.assertEqual(self.values()["incoming_calls"], 2)
+        self.assertEqual(self.values()["call_indegree"], 2)
+        self.assertEqual(CommunicationContactDay.objects.count(), 3)
+
+    def test_texts_reciprocity_and_responsiveness(self):
+        self.summarize(TEXTS_LOG, TEXT_HEADER, make_rows([
+            (DAY, b"a", b"received SMS", b"10", 6),
+            (DAY + 60000, b"a", b"received SMS", b"10", 6),
+            (DAY + 120000, b"b", b"sent SMS", b"5", 6),
+        ]))
+        self.assertEqual(self.values()["reciprocity"], 0)
+        self.assertNotIn("responsiveness", self.values())
+
+        # the reply to a is in a later upload, it is counted from a's first unanswered text.
+        self.summarize(TEXTS_LOG, TEXT_HEADER, make_rows([(DAY + 240000, b"a", b"sent SMS", b"20", 6)]))
+        values = self.values()
+        self.assertEqual(values["incoming_texts"], 2)
+        self.assertEqual(values["outgoing_texts"], 2)
+        self.assertEqual(values["outgoing_textlengths"], 25)
+        self.assertEqual(values["text_indegree"], 1)
+        self.assertEqual(values["text_outdegree"], 2)
+        self.assertEqual(values["reciprocity"], 1)
+        self.assertEqual(values["responsiveness"], 4)
+
+    def test_texts_that_arrive_late_are_not_matched_to_replies(self):
+        self.summarize(TEXTS_LOG, TEXT_HEADER, make_rows([
+            (DAY + 600000, b"a", b"received SMS", b"10", 6),
+            (DAY + 660000, b"a", b"sent SMS", b"10", 6),
+        ]))
+        self.assertEqual(self.values()["responsiveness"], 1)
+
+        # an older file is uploaded after the newer one, its text is counted but is not unanswered.
+        self.summarize(TEXTS_LOG, TEXT_HEADER, make_rows([(DAY, b"a", b"received SMS", b"10", 6)]))
+        self.summarize(TEXTS_LOG, TEXT_HEADER, make_rows([(DAY + 720000, b"a", b"sent SMS", b"10", 6)]))
+        values = self.values()
+        self.assertEqual(values["incoming_texts"], 2)
+        self.assertEqual(values["outgoing_texts"], 2)
+        self.assertEqual(values["responsiveness"], 1)
+
+    def test_new_unique_rows(self):
+        rows = make_rows([(DAY, b"a", b"sent SMS", b"5", 6), (DAY + 1000, b"a", b"sent SMS", b"5", 6)])
+        self.assertEqual(new_unique_rows(rows + rows[:1]), rows)
+        self.assertEqual(new_unique_rows(rows, rows[:1]), rows[1:])
+
+    def test_errors_are_handled_per_participant(self):
+        rows = make_rows([(DAY, b"a", b"Incoming Call", b"60", 5)])
+        communications = [
+            (DAY, "CHUNKED_DATA/missing", "missing", CALL_LOG, CALL_HEADER, rows),
+            (DAY, "CHUNKED_DATA/patient1", "patient1", CALL_LOG, CALL_HEADER, rows),
+            (DAY, "CHUNKED_DATA/not_uploaded", "patient1", CALL_LOG, CALL_HEADER, rows),
+        ]
+        error_handler = ErrorHandler()
+        summarize_chunked_communications(
+            communications, {"CHUNKED_DATA/missing", "CHUNKED_DATA/patient1"}, error_handler
+        )
+        self.assertEqual(self.values()["incoming_calls"], 1)
+        with self.assertRaises(Exception):
+            error_handler.raise_errors()
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from libs.csv_slicing import CsvSlice, slice_csv
+
+
+def make_csv(timestamps):
+    return b"timestamp,UTC time,x,y\n" + b"\n".join(
+        b"%d,2020-01-01T00:00:00.000,%d,%d" % (timestamp, timestamp * 2, timestamp * 3)
+        for timestamp in timestamps
+    )
+
+
+class TestSliceCsv(TestCase):
+
+    def timestamps(self, csv):
+        return [int(row.split(b",")[0]) for row in csv.split(b"\n")[1:]]
+
+    def test_time_range_is_inclusive(self):
+        csv = make_csv(range(1000, 2000, 10))
+        self.assertEqual(self.timestamps(slice_csv(csv, CsvSlice(1100, 1150, None))),
+                         [1100, 1110, 1120, 1130, 1140, 1150])
+        # between rows
+        self.assertEqual(self.timestamps(slice_csv(csv, CsvSlice(1101, 1119, None))), [1110])
+        self.assertEqual(self.timestamps(slice_csv(csv, CsvSlice(1985, None, None))), [1990])
+        self.assertEqual(self.timestamps(slice_csv(csv, CsvSlice(None, 1015, None))), [1000, 1010])
+
+    def test_every_range(self):
+        timestamps = [1, 2, 2, 2, 5, 8, 13, 13, 21]
+        csv = make_csv(timestamps)
+        for start in range(0, 23):
+            for end in range(start, 23):
+                self.assertEqual(self.timestamps(slice_csv(csv, CsvSlice(start, end, None))),
+                                 [t for t in timestamps if start <= t <= end])
+
+    def test_no_rows(self):
+        csv = make_csv(range(10))
+        self.assertEqual(slice_csv(csv, CsvSlice(100, 200, None)), b"timestamp,UTC time,x,y")
+        self.assertEqual(slice_csv(b"timestamp,x", CsvSlice(0, 1, None)), b"timestamp,x")
+        self.assertEqual(slice_csv(b"timestamp,x\n", CsvSlice(0, 1, [b"x"])), b"x")
+
+    def test_columns(self):
+        csv = make_csv([1, 2]) + b"\n"
+        self.assertEqual(slice_csv(csv, CsvSlice(None, None, [b"y", b"timestamp", b"missing"])),
+                         b"y,timestamp,missing\n3,1,\n6,2,")
+        self.assertEqual(slice_csv(csv, CsvSlice(2, None, [b"x"])), b"x\n4")
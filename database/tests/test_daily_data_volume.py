@@ -0,0 +1,47 @@
+from datetime import date, datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from config.constants import ACCELEROMETER, GPS
+from database.data_access_models import ChunkRegistry, DailyDataVolume
+from database.tests.tests import create_participant, create_study
+
+
+class TestDailyDataVolume(TestCase):
+
+    def setUp(self):
+        self.study = create_study()
+        self.participant = create_participant(self.study)
+
+    def register(self, data_type, hour, file_contents):
+        time_bin = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp() // 3600 + hour
+        ChunkRegistry.register_chunked_data(
+            data_type, time_bin, "%s/%s/%s" % (self.participant.patient_id, data_type, hour), file_contents,
+            self.study.pk, self.participant.pk,
+        )
+
+    def volumes(self):
+        return sorted(DailyDataVolume.objects.values_list("data_type", "date", "bytes", "chunk_count"))
+
+    def test_volumes_are_updated_with_chunks(self):
+        self.register(GPS, 1, b"a" * 10)
+        self.register(GPS, 2, b"a" * 5)
+        self.register(GPS, 25, b"a" * 7)
+        self.register(ACCELEROMETER, 3, b"a" * 100)
+        # a chunk that grows.
+        chunk = ChunkRegistry.objects.get(chunk_path="patient1/%s/2" % GPS)
+        chunk.file_size = 20
+        chunk.save()
+
+        expected = [
+            (ACCELEROMETER, date(2020, 1, 1), 100, 1),
+            (GPS, date(2020, 1, 1), 30, 2),
+            (GPS, date(2020, 1, 2), 7, 1),
+        ]
+        self.assertEqual(self.volumes(), expected)
+
+        # rebuilding from the ChunkRegistry table produces the same rows.
+        DailyDataVolume.objects.all().delete()
+        DailyDataVolume.rebuild(self.participant.pk)
+        self.assertEqual(self.volumes(), expected)
@@ -0,0 +1,32 @@
+from datetime import date
+from unittest import TestCase
+
+from libs.dashboard_grid import build_grid
+
+
+class TestBuildGrid(TestCase):
+
+    def test_cells_are_summed_into_rows_and_dates(self):
+        dates = [date(2020, 1, 1), date(2020, 1, 2), date(2020, 1, 3)]
+        cells = [
+            (12, date(2020, 1, 1), 10),
+            (12, date(2020, 1, 1), 5),
+            (3, date(2020, 1, 3), 0),
+            # not in the grid
+            (7, date(2020, 1, 2), 1),
+            (3, date(2020, 1, 4), 1),
+        ]
+        self.assertEqual(
+            build_grid([12, 3, 5], dates, cells),
+            [[15, None, None], [None, None, 0], [None, None, None]],
+        )
+
+    def test_string_row_keys(self):
+        self.assertEqual(
+            build_grid(["gps", "accelerometer"], [date(2020, 1, 1)], [("accelerometer", date(2020, 1, 1), 2.5)], float),
+            [[None], [2.5]],
+        )
+
+    def test_empty(self):
+        self.assertEqual(build_grid([], [], []), [])
+        self.assertEqual(build_grid([1], [date(2020, 1, 1)], []), [[None]])
@@ -0,0 +1,38 @@
+from django.db import connection
+from django.test import TransactionTestCase
+
+from database.study_models import Study
+from libs.db_connections import DatabaseThreadPool, get_connection_metrics
+
+
+def count_studies(_):
+    return Study.objects.count()
+
+
+class TestDatabaseThreadPool(TransactionTestCase):
+
+    def test_worker_connections_are_closed_on_terminate(self):
+        connection.ensure_connection()
+        open_before = get_connection_metrics()["open_connections"]
+
+        pool = DatabaseThreadPool(4)
+        try:
+            self.assertEqual(pool.map(count_studies, range(20), chunksize=1), [0] * 20)
+            self.assertGreater(get_connection_metrics()["open_connections"], open_before)
+        finally:
+            pool.close()
+            pool.terminate()
+        # the workers close their connections as they exit.
+        pool.join()
+
+        self.assertEqual(get_connection_metrics()["open_connections"], open_before)
+
+    def test_pgbouncer_mode_closes_after_each_task(self):
+        pool = DatabaseThreadPool(2, close_after_each_task=True)
+        closed_before = get_connection_metrics()["connections_closed"]
+        try:
+            pool.map(count_studies, range(4), chunksize=1)
+            self.assertEqual(get_connection_metrics()["connections_closed"] - closed_before, 4)
+        finally:
+            pool.close()
+            pool.terminate()
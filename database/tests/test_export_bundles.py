@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from django.utils import timezone
+
+from database.data_access_models import ExportBundle
+from libs.export_bundles import BundleSplicer, get_period_end, get_period_start
+
+
+class TestExportBundlePeriods(TestCase):
+
+    def test_periods(self):
+        time = datetime(2020, 12, 31, 23, 30, tzinfo=timezone.utc)
+        self.assertEqual(get_period_start(time, ExportBundle.DAY), datetime(2020, 12, 31, tzinfo=timezone.utc))
+        self.assertEqual(get_period_start(time, ExportBundle.MONTH), datetime(2020, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(get_period_end(datetime(2020, 12, 1, tzinfo=timezone.utc), ExportBundle.MONTH),
+                         datetime(2021, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(get_period_end(datetime(2020, 2, 29, tzinfo=timezone.utc), ExportBundle.DAY),
+                         datetime(2020, 3, 1, tzinfo=timezone.utc))
+
+    def test_covers(self):
+        built = datetime(2020, 1, 5, tzinfo=timezone.utc)
+        bundle = ExportBundle(chunk_ids=json.dumps([1, 2]), chunks_last_updated=built)
+        chunks = [{"pk": 1, "last_updated": built}, {"pk": 2, "last_updated": built}]
+        self.assertTrue(bundle.covers(chunks))
+        # some of the period's chunks were excluded from the download.
+        self.assertFalse(bundle.covers(chunks[:1]))
+        # a chunk was updated after the bundle was built.
+        self.assertFalse(bundle.covers(chunks[:1] + [{"pk": 2, "last_updated": built + timedelta(1)}]))
+
+
+class TestBundleSplicer(TestCase):
+
+    def setUp(self):
+        self.built = datetime(2020, 3, 5, tzinfo=timezone.utc)
+        self.month = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.day = datetime(2020, 2, 3, tzinfo=timezone.utc)
+        self.month_bundle = ExportBundle(chunk_ids=json.dumps([1, 2]), chunks_last_updated=self.built)
+        self.day_bundle = ExportBundle(chunk_ids=json.dumps([3]), chunks_last_updated=self.built)
+        self.splicer = BundleSplicer({
+            (1, "gps", ExportBundle.MONTH, self.month): self.month_bundle,
+            (1, "gps", ExportBundle.DAY, self.day): self.day_bundle,
+        })
+
+    def chunk(self, pk, time_bin, participant_id=1, data_type="gps"):
+        return {"pk": pk, "participant_id": participant_id, "data_type": data_type, "time_bin": time_bin,
+                "last_updated": self.built}
+
+    def test_unbundled_chunks_are_passed_on_as_they_arrive(self):
+        seen = []
+
+        def chunks():
+            for chunk in [
+                self.chunk(1, self.month + timedelta(days=1)),
+                self.chunk(4, self.month, participant_id=2),
+                self.chunk(5, self.day + timedelta(days=1)),
+                self.chunk(2, self.month + timedelta(days=2)),
+                self.chunk(3, self.day + timedelta(hours=1)),
+            ]:
+                seen.append(chunk["pk"])
+                yield chunk
+
+        filtered = self.splicer.filter(chunks())
+        self.assertEqual(next(filtered)["pk"], 4)
+        self.assertEqual(seen, [1, 4])
+        self.assertEqual(next(filtered)["pk"], 5)
+        self.assertEqual(list(filtered), [])
+        self.assertEqual(
+            [(bundle, [chunk["pk"] for chunk in chunks]) for bundle, chunks in self.splicer.spliced],
+            [(self.month_bundle, [1, 2]), (self.day_bundle, [3])],
+        )
+
+    def test_chunks_of_bundles_that_do_not_cover_them_are_passed_on_at_the_end(self):
+        # the month bundle is missing chunk 6, the day bundle's chunk was updated.
+        updated = dict(self.chunk(3, self.day), last_updated=self.built + timedelta(days=1))
+        chunks = [self.chunk(1, self.month), self.chunk(2, self.month), self.chunk(6, self.month), updated]
+        self.assertEqual([chunk["pk"] for chunk in self.splicer.filter(chunks)], [1, 2, 6, 3])
+        self.assertEqual(self.splicer.spliced, [])
@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+import numpy
+
+from libs.gps_features import compute_gps_features, haversine_km, parse_gps_points
+
+
+class TestGpsFeatures(TestCase):
+
+    def test_haversine(self):
+        # a degree of latitude is about 111 km.
+        self.assertAlmostEqual(float(haversine_km(0, 0, 1, 0)), 111.2, places=1)
+
+    def test_parse_gps_points(self):
+        contents = (
+            b"timestamp,UTC time,latitude,longitude,altitude,accuracy\n"
+            b"1000,2020-01-01T00:00:01.000,42.0,-71.0,10,5\n"
+            b"2000,2020-01-01T00:00:02.000,42.1,-71.1,10,500\n"
+            b"3000,2020-01-01T00:00:03.000,42.2,-71.2,10,5"
+        )
+        timestamps, latitudes, longitudes = parse_gps_points(contents)
+        # the inaccurate point is dropped.
+        self.assertEqual(timestamps.tolist(), [1, 3])
+        self.assertEqual(latitudes.tolist(), [42.0, 42.2])
+        self.assertEqual(longitudes.tolist(), [-71.0, -71.2])
+        self.assertIsNone(parse_gps_points(b"timestamp,UTC time,latitude,longitude,altitude,accuracy"))
+
+    def test_compute_gps_features(self):
+        # at home (for 10 hours, of which one counts, see MAX_DWELL_SECONDS), a trip 0.1 degrees
+        # north for an hour, then home.
+        timestamps = numpy.array([0, 36000, 39600, 43200, 46800], dtype=float)
+        latitudes = numpy.array([42.0, 42.0, 42.1, 42.0, 42.0])
+        longitudes = numpy.full(5, -71.0)
+        features = compute_gps_features(timestamps, latitudes, longitudes)
+        trip = float(haversine_km(42.0, -71.0, 42.1, -71.0))
+        self.assertAlmostEqual(features["DistTravelled_km"], 2 * trip)
+        self.assertAlmostEqual(features["MaxDiam_km"], trip, places=3)
+        self.assertAlmostEqual(features["Hometime_hrs"], 3)
+        self.assertGreater(features["RoG_km"], 0)
@@ -0,0 +1,117 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from config.constants import GPS
+from database.data_access_models import ChunkRegistry, PipelineSummaryValue, SummarizedDay
+from database.study_models import Study
+from database.tests.tests import create_participant, create_study
+from libs.gps_summaries import build_gps_summaries
+
+GPS_FILE = (
+    b"timestamp,UTC time,latitude,longitude,altitude,accuracy\n"
+    b"1577836800000,2020-01-01T00:00:00.000,42.0,-71.0,10,5\n"
+    b"1577840400000,2020-01-01T01:00:00.000,42.1,-71.0,10,5"
+)
+
+
+# the test data is from 2020.
+@patch("libs.gps_summaries.GPS_SUMMARY_LOOKBACK_DAYS", 0)
+class TestGpsSummaries(TestCase):
+
+    def setUp(self):
+        self.study = create_study(server_summaries=True)
+        self.participant = create_participant(self.study)
+        ChunkRegistry.objects.bulk_create([
+            ChunkRegistry(
+                is_chunkable=True,
+                chunk_path="CHUNKED_DATA/%s/patient1/gps/%s.csv" % (self.study.object_id, hour),
+                data_type=GPS,
+                time_bin=datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(hours=hour),
+                study=self.study,
+                participant=self.participant,
+            ) for hour in [0, 30]
+        ])
+
+    def values(self):
+        return sorted(PipelineSummaryValue.objects.values_list("date", "data_stream"))
+
+    @patch("libs.gps_summaries.s3_retrieve")
+    def test_days_are_summarized_once(self, s3_retrieve):
+        s3_retrieve.return_value = GPS_FILE
+        now = timezone.now() + timedelta(days=1)
+        build_gps_summaries(now)
+        self.assertEqual(s3_retrieve.call_count, 2)
+        self.assertEqual(
+            sorted(SummarizedDay.objects.values_list("date", flat=True)), [date(2020, 1, 1), date(2020, 1, 2)]
+        )
+        self.assertEqual(
+            [data_stream for day, data_stream in self.values() if day == date(2020, 1, 1)],
+            ["DistTravelled_km", "Hometime_hrs", "MaxDiam_km", "RoG_km"],
+        )
+
+        # unchanged days are not summarized again, changed days are.
+        build_gps_summaries(now)
+        self.assertEqual(s3_retrieve.call_count, 2)
+        ChunkRegistry.objects.filter(time_bin__gte=datetime(2020, 1, 2, tzinfo=timezone.utc)).update(
+            last_updated=timezone.now() + timedelta(seconds=1)
+        )
+        build_gps_summaries(now)
+        self.assertEqual(s3_retrieve.call_count, 3)
+
+    @patch("libs.gps_summaries.s3_retrieve")
+    def test_recently_updated_days_wait(self, s3_retrieve):
+        s3_retrieve.return_value = GPS_FILE
+        build_gps_summaries(timezone.now())
+        self.assertEqual(s3_retrieve.call_count, 0)
+        self.assertEqual(self.values(), [])
+
+    @patch("libs.gps_summaries.GPS_SUMMARY_DAYS_PER_RUN", 1)
+    @patch("libs.gps_summaries.s3_retrieve")
+    def test_runs_summarize_the_most_recent_days_first(self, s3_retrieve):
+        s3_retrieve.return_value = GPS_FILE
+        now = timezone.now() + timedelta(days=1)
+        build_gps_summaries(now)
+        self.assertEqual(list(SummarizedDay.objects.values_list("date", flat=True)), [date(2020, 1, 2)])
+        build_gps_summaries(now)
+        self.assertEqual(
+            sorted(SummarizedDay.objects.values_list("date", flat=True)), [date(2020, 1, 1), date(2020, 1, 2)]
+        )
+
+    @patch("libs.gps_summaries.s3_retrieve")
+    def test_days_before_the_lookback_are_not_summarized(self, s3_retrieve):
+        with patch("libs.gps_summaries.GPS_SUMMARY_LOOKBACK_DAYS", 30):
+            build_gps_summaries(timezone.now() + timedelta(days=1))
+        self.assertEqual(s3_retrieve.call_count, 0)
+
+    @patch("libs.gps_summaries.s3_retrieve")
+    def test_studies_without_server_summaries_are_not_summarized(self, s3_retrieve):
+        Study.objects.filter(pk=self.study.pk).update(server_summaries=False)
+        build_gps_summaries(timezone.now() + timedelta(days=1))
+        self.assertEqual(s3_retrieve.call_count, 0)
+
+    def test_pipeline_uploads_do_not_replace_gps_summaries(self):
+        PipelineSummaryValue.replace_day_values(
+            self.study.pk, self.participant.pk, date(2020, 1, 1), ["RoG_km"], {"RoG_km": 1.0}
+        )
+        PipelineSummaryValue.replace_values(
+            self.study.pk, self.participant.pk,
+            [{"day": "2020-01-01", "RoG_km": "5", "AvgFlightLen_km": "3"}],
+        )
+        self.assertEqual(
+            sorted(PipelineSummaryValue.objects.values_list("data_stream", "value")),
+            [("AvgFlightLen_km", 3.0), ("RoG_km", 1.0)],
+        )
+
+    def test_pipeline_uploads_replace_every_value_without_server_summaries(self):
+        Study.objects.filter(pk=self.study.pk).update(server_summaries=False)
+        PipelineSummaryValue.replace_values(
+            self.study.pk, self.participant.pk,
+            [{"day": "2020-01-01", "RoG_km": "5", "AvgFlightLen_km": "3"}],
+        )
+        self.assertEqual(
+            sorted(PipelineSummaryValue.objects.values_list("data_stream", "value")),
+            [("AvgFlightLen_km", 3.0), ("RoG_km", 5.0)],
+        )
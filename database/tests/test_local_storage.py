@@ -0,0 +1,83 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from libs.storage import LocalFileSystemStorageBackend, StorageBackend, StorageBackendError
+
+
+class TestLocalFileSystemStorageBackend(TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.backend = LocalFileSystemStorageBackend(self.root)
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def test_put_and_get(self):
+        self.backend.put("study/patient/accel/1.csv", b"some data")
+        self.assertEqual(self.backend.get("study/patient/accel/1.csv"), b"some data")
+        self.backend.put("study/patient/empty.csv", b"")
+        self.assertEqual(self.backend.get("study/patient/empty.csv"), b"")
+
+    def test_missing_key_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.backend.get("study/missing")
+        with self.assertRaises(FileNotFoundError):
+            self.backend.get_stream("study/missing")
+
+    def test_streams(self):
+        data = os.urandom(1000)
+        self.backend.put_stream("study/file", (data[i:i + 7] for i in range(0, len(data), 7)))
+        blocks = list(self.backend.get_stream("study/file", block_size=64))
+        self.assertEqual(b"".join(blocks), data)
+        self.assertEqual(max(len(block) for block in blocks), 64)
+
+    def test_stream_from_an_offset(self):
+        data = os.urandom(1000)
+        self.backend.put("study/file", data)
+        self.assertEqual(b"".join(self.backend.get_stream("study/file", block_size=64, start=437)), data[437:])
+        self.assertEqual(list(self.backend.get_stream("study/file", start=1000)), [])
+
+    def test_size(self):
+        self.backend.put("study/file", b"some data")
+        self.assertEqual(self.backend.size("study/file"), 9)
+        with self.assertRaises(FileNotFoundError):
+            self.backend.size("study/missing")
+
+    def test_failed_put_leaves_no_file(self):
+        def broken_blocks():
+            yield b"partial"
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            self.backend.put_stream("study/file", broken_blocks())
+        self.assertEqual(list(self.backend.list("study")), [])
+
+    def test_list_is_a_string_prefix_match(self):
+        for key in ["study/patient1/b", "study/patient1/a", "study/patient10/a", "other/patient1/a"]:
+            self.backend.put(key, b"x")
+        self.assertEqual(
+            list(self.backend.list("study/patient1")),
+            ["study/patient1/a", "study/patient1/b", "study/patient10/a"],
+        )
+        self.assertEqual(list(self.backend.list("study/patient1/")), ["study/patient1/a", "study/patient1/b"])
+        self.assertEqual(list(self.backend.list("nothing/here")), [])
+
+    def test_list_versions(self):
+        self.backend.put("study/key", b"x")
+        self.assertEqual(list(self.backend.list_versions("study/key")), [{'Key': "study/key", 'VersionId': "null"}])
+
+    def test_delete(self):
+        self.backend.put("study/key", b"x")
+        self.backend.delete("study/key")
+        self.assertEqual(list(self.backend.list("study")), [])
+
+    def test_keys_cannot_escape_the_root(self):
+        with self.assertRaises(StorageBackendError):
+            self.backend.put("../outside", b"x")
+
+    def test_backends_implement_the_interface(self):
+        with self.assertRaises(TypeError):
+            StorageBackend()
@@ -0,0 +1,47 @@
+from django.test import TestCase
+
+from database.study_models import StudyField
+from database.tests.tests import build_participant, create_study
+from database.user_models import Participant, ParticipantFieldValue
+from libs.participant_list import get_participant_page
+
+
+class TestParticipantList(TestCase):
+
+    def setUp(self):
+        self.study = create_study(name="a", object_id="a" * 24)
+        other_study = create_study(name="b", object_id="b" * 24)
+        Participant.objects.bulk_create([
+            build_participant(patient_id, self.study, device_id="device" if patient_id.startswith("ab") else "")
+            for patient_id in ["aaa11111", "abc11111", "abc22222", "b1111111", "zzzzzzzz"]
+        ] + [build_participant("abc33333", other_study)])
+        StudyField.objects.bulk_create([StudyField(study=self.study, field_name="site")])
+        ParticipantFieldValue.objects.bulk_create([
+            ParticipantFieldValue(participant=participant, field=StudyField.objects.get(), value="boston")
+            for participant in Participant.objects.filter(study=self.study)
+        ])
+
+    def patient_ids(self, rows):
+        return [row["patient_id"] for row in rows]
+
+    def test_page(self):
+        # the count, the page, and the page's field values (and their fields).
+        with self.assertNumQueries(4):
+            total, filtered, rows = get_participant_page(self.study.pk, start=1, length=2)
+        self.assertEqual((total, filtered), (5, 5))
+        self.assertEqual(self.patient_ids(rows), ["abc11111", "abc22222"])
+        self.assertEqual(rows[0]["fields"], {"site": "boston"})
+        self.assertTrue(rows[0]["phone_registered"])
+
+    def test_prefix_search(self):
+        total, filtered, rows = get_participant_page(self.study.pk, search="AB")
+        self.assertEqual((total, filtered), (5, 2))
+        self.assertEqual(self.patient_ids(rows), ["abc11111", "abc22222"])
+        self.assertEqual(self.patient_ids(get_participant_page(self.study.pk, search="zzzzzzzz")[2]), ["zzzzzzzz"])
+        self.assertEqual(get_participant_page(self.study.pk, search="a%")[1:], (0, []))
+
+    def test_sorting(self):
+        _, _, rows = get_participant_page(self.study.pk, sort_column="phone_registered", descending=True)
+        self.assertEqual(self.patient_ids(rows), ["abc11111", "abc22222", "aaa11111", "b1111111", "zzzzzzzz"])
+        _, _, rows = get_participant_page(self.study.pk, sort_column="fields")
+        self.assertEqual(self.patient_ids(rows)[0], "aaa11111")
@@ -0,0 +1,41 @@
+import json
+from datetime import date
+
+from django.test import TestCase
+
+from database.data_access_models import parse_pipeline_summary, PipelineSummaryValue
+from database.tests.tests import create_participant, create_study
+
+
+class TestPipelineSummaryValue(TestCase):
+
+    def setUp(self):
+        self.study = create_study()
+        self.participant = create_participant(self.study)
+
+    def values(self):
+        return sorted(PipelineSummaryValue.objects.values_list("data_stream", "date", "value"))
+
+    def test_parse_pipeline_summary(self):
+        processed_data = json.dumps([
+            {"day": "2020-01-01", "incoming_calls": "3", "reciprocity": "0.5", "outgoing_calls": "NA"},
+            # unknown data streams, non-numeric values and bad days are skipped.
+            {"day": "2020-01-02", "not_a_stream": "1", "incoming_calls": "many"},
+            {"day": "yesterday", "incoming_calls": "1"},
+            "not a day",
+        ])
+        self.assertEqual(
+            sorted(parse_pipeline_summary(processed_data)),
+            [("incoming_calls", date(2020, 1, 1), 3.0), ("reciprocity", date(2020, 1, 1), 0.5)],
+        )
+        self.assertEqual(list(parse_pipeline_summary("not json")), [])
+
+    def test_replace_values(self):
+        PipelineSummaryValue.replace_values(
+            self.study.pk, self.participant.pk, [{"day": "2020-01-01", "AvgFlightLen_km": "3"}]
+        )
+        PipelineSummaryValue.replace_values(
+            self.study.pk, self.participant.pk, [{"day": "2020-01-02", "AvgFlightLen_km": "4"}]
+        )
+        # the most recent upload replaces the participant's values.
+        self.assertEqual(self.values(), [("AvgFlightLen_km", date(2020, 1, 2), 4.0)])
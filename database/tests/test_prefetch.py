@@ -0,0 +1,65 @@
+from threading import Lock
+from time import sleep
+from unittest import TestCase
+
+from libs.prefetch import BudgetedPrefetcher
+
+
+class TestBudgetedPrefetcher(TestCase):
+
+    def run_prefetcher(self, sizes, byte_budget, max_concurrency, sort_window=1000):
+        lock = Lock()
+        state = {"running": 0, "peak": 0}
+
+        def fetch(size):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            sleep(0.005)
+            with lock:
+                state["running"] -= 1
+            return size
+
+        prefetcher = BudgetedPrefetcher(fetch, sizes, lambda size: size, byte_budget, max_concurrency,
+                                        sort_window=sort_window)
+        try:
+            results = list(prefetcher)
+        finally:
+            prefetcher.close()
+        return results, state["peak"], prefetcher
+
+    def test_small_files_use_all_threads(self):
+        results, peak, prefetcher = self.run_prefetcher([1] * 64, byte_budget=100, max_concurrency=8)
+        self.assertEqual(sorted(results), [1] * 64)
+        self.assertEqual(prefetcher.peak_concurrency, 8)
+        self.assertEqual(prefetcher.files, 64)
+        self.assertEqual(prefetcher.bytes, 64)
+
+    def test_large_files_are_limited_by_the_byte_budget(self):
+        results, peak, prefetcher = self.run_prefetcher([40] * 10, byte_budget=100, max_concurrency=8)
+        self.assertEqual(len(results), 10)
+        self.assertLessEqual(prefetcher.peak_concurrency, 2)
+        self.assertLessEqual(peak, 2)
+
+    def test_file_larger_than_the_budget_is_retrieved_alone(self):
+        results, peak, prefetcher = self.run_prefetcher([500, 1, 1], byte_budget=100, max_concurrency=8)
+        self.assertEqual(sorted(results), [1, 1, 500])
+
+    def test_items_are_sorted_a_window_at_a_time(self):
+        results, peak, prefetcher = self.run_prefetcher(
+            (size for size in range(100, 0, -1)), byte_budget=1000, max_concurrency=1, sort_window=10
+        )
+        self.assertEqual(sorted(results), list(range(1, 101)))
+        # the first item retrieved is the smallest of the first window, not of all the items.
+        self.assertEqual(results[:3], [91, 90, 89])
+
+    def test_errors_are_raised_to_the_consumer(self):
+        def fetch(item):
+            raise ValueError(item)
+
+        prefetcher = BudgetedPrefetcher(fetch, [1, 2], lambda size: size, 100, 2)
+        try:
+            with self.assertRaises(ValueError):
+                list(prefetcher)
+        finally:
+            prefetcher.close()
@@ -0,0 +1,289 @@
+import re
+from datetime import date, datetime, timedelta
+from string import ascii_lowercase
+from unittest.mock import patch
+
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from app import app
+from config.constants import GPS, ResearcherRole
+from database.data_access_models import (ChunkRegistry, DailyDataVolume, PipelineSummaryValue,
+    PipelineUpload, PipelineUploadTags)
+from database.study_models import Study, StudyField, Survey
+from database.user_models import Participant, ParticipantFieldValue, Researcher, StudyRelation
+from database.tests.tests import build_participant
+from libs.admin_authentication import EXPIRY_NAME, SESSION_NAME, SESSION_UUID
+
+# Renders the GET routes of every blueprint against a large fixture, as a site admin and as a study
+# admin, and fails if a route runs more queries than its budget, or runs more queries after the
+# fixture has grown.  The fixture has STUDIES studies of PARTICIPANTS participants (with custom
+# fields, chunks and dashboard data) and RESEARCHERS researchers on every study, growing it adds as
+# many again of each (and PARTICIPANTS more participants to every study), so a route that runs a
+# query per study, participant or researcher fails.
+
+STUDIES = 15
+# more than a page of the participant list.
+PARTICIPANTS = 30
+RESEARCHERS = 10
+DAYS = 3
+
+# the most queries each route may run.
+QUERY_BUDGETS = {
+    "/": 0,
+    "/admin": 0,
+    "/choose_study": 5,
+    "/manage_credentials": 4,
+    "/view_study/<string:study_id>": 12,
+    "/view_study/<string:study_id>/participants": 10,
+    "/view_study/<string:study_id>/patient_fields/<string:patient_id>": 12,
+    "/data-pipeline/<string:study_id>": 9,
+    "/manage_researchers": 7,
+    "/edit_researcher/<string:researcher_pk>": 13,
+    "/create_new_researcher": 5,
+    "/manage_studies": 6,
+    "/edit_study/<string:study_id>": 10,
+    "/study_fields/<string:study_id>": 11,
+    "/create_study": 5,
+    "/device_settings/<string:study_id>": 11,
+    "/edit_survey/<string:survey_id>": 12,
+    "/data_access_web_form": 5,
+    "/pipeline_access_web_form": 6,
+    "/downloads": 4,
+    "/export_study_settings_file/<string:study_id>": 8,
+    "/dashboard/<string:study_id>": 10,
+    "/dashboard/<string:study_id>/data_stream/<string:data_stream>": 14,
+    "/dashboard/<string:study_id>/data_stream/<string:data_stream>/grid": 12,
+    "/dashboard/<string:study_id>/data_stream/<string:data_stream>/samples": 12,
+    "/dashboard/<string:study_id>/patient/<string:patient_id>": 18,
+    "/dashboard/<string:study_id>/patient/<string:patient_id>/grid": 12,
+    "/get-studies/v1": 3,
+    "/get-users/v1": 5,
+    "/get-data-manifest/v1": 8,
+    "/get-data-coverage/v1": 8,
+}
+
+# routes that are not rendered, and why.
+UNBUDGETED_ROUTES = {
+    # state changing requests (some of them on GET).
+    "/reset_participant_password": "changes state",
+    "/reset_device": "changes state",
+    "/create_new_patient": "changes state",
+    "/create_many_patients/<string:study_id>": "changes state",
+    "/create_survey/<string:study_id>/<string:survey_type>": "changes state",
+    "/delete_survey/<string:survey_id>": "changes state",
+    "/update_survey/<string:survey_id>": "changes state",
+    "/add_researcher_to_study": "changes state",
+    "/remove_researcher_from_study": "changes state",
+    "/delete_researcher/<string:researcher_id>": "changes state",
+    "/set_researcher_password": "changes state",
+    "/rename_study/<string:study_id>": "changes state",
+    "/elevate_researcher": "changes state",
+    "/demote_researcher": "changes state",
+    "/delete_field/<string:study_id>": "changes state",
+    "/delete_study/<string:study_id>": "changes state",
+    "/import_study_settings_file/<string:study_id>": "changes state",
+    "/run-manual-code/<string:study_id>": "changes state",
+    "/reset_admin_password": "changes state",
+    "/reset_download_api_credentials": "changes state",
+    "/validate_login": "changes state",
+    "/logout": "changes state",
+    "/pipeline-upload/v1": "changes state",
+    "/pipeline-json-upload/v1": "changes state",
+    # redirects to files hosted elsewhere.
+    "/download": "redirect",
+    "/download_debug": "redirect",
+    "/download_beta": "redirect",
+    "/download_beta_debug": "redirect",
+    "/download_beta_release": "redirect",
+    "/privacy_policy": "redirect",
+    "/is_staging": "staging only, no queries",
+    # the mobile app's endpoints, authenticated per participant.
+    "/loaderio-8ed6e63e16e9e4d07d60a051c4ca6ecb/": "load testing token",
+    "/upload": "mobile app",
+    "/upload/ios/": "mobile app",
+    "/register_user": "mobile app",
+    "/register_user/ios/": "mobile app",
+    "/set_password": "mobile app",
+    "/set_password/ios/": "mobile app",
+    "/download_surveys": "mobile app",
+    "/download_surveys/ios/": "mobile app",
+    "/graph": "mobile app",
+    # file downloads, they read from s3 (see test_streaming_exports and test_chunk_queries).
+    "/get-data/v1": "reads files",
+    "/get-data-chunk/v1": "reads files",
+    "/get-data-batch/v1": "reads files",
+    "/get-pipeline/v1": "reads files",
+}
+
+
+def blueprint_rules():
+    # blueprint endpoints are "blueprint.function", app level routes (static files) are not tested.
+    return [rule for rule in app.url_map.iter_rules() if "." in rule.endpoint]
+
+
+def short_id(number):
+    # patient ids are lowercase letters and digits.
+    return ascii_lowercase[number // 26] + ascii_lowercase[number % 26]
+
+
+class TestQueryBudgets(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.site_admin = Researcher.create_with_password("site_admin", "password", site_admin=True)
+        cls.study_admin = Researcher.create_with_password("study_admin", "password")
+        cls.access_key, cls.secret_key = cls.study_admin.reset_access_credentials()
+        cls.grow_fixture(0)
+
+        cls.study = Study.objects.order_by("name").first()
+        cls.survey = Survey.create_with_settings(Survey.TRACKING_SURVEY, study=cls.study)
+        cls.participant = Participant.objects.filter(study=cls.study).order_by("patient_id").first()
+        cls.researcher = Researcher.objects.get(username="researcher000")
+
+    @classmethod
+    def grow_fixture(cls, batch):
+        """ Adds STUDIES studies, PARTICIPANTS participants (and their data) to every study, and
+        RESEARCHERS researchers on every study. """
+        old_study_ids = set(Study.objects.values_list("pk", flat=True))
+        old_researcher_ids = set(Researcher.objects.values_list("pk", flat=True))
+        last_participant_id = Participant.objects.aggregate(Max("pk"))["pk__max"] or 0
+
+        # studies are created one at a time, their device settings are created by a signal.
+        for i in range(STUDIES):
+            Study.create_with_object_id(name="study %03d" % (batch * STUDIES + i), encryption_key="a" * 32)
+        studies = list(Study.objects.order_by("name"))
+        new_studies = [study for study in studies if study.pk not in old_study_ids]
+
+        Participant.objects.bulk_create([
+            build_participant("p" + short_id(i) + short_id(batch * PARTICIPANTS + j), study)
+            for i, study in enumerate(studies) for j in range(PARTICIPANTS)
+        ])
+        participants = list(Participant.objects.filter(pk__gt=last_participant_id))
+
+        StudyField.objects.bulk_create([
+            StudyField(study=study, field_name=field_name) for study in new_studies for field_name in ["site", "arm"]
+        ])
+        fields = {study.pk: [] for study in studies}
+        for field in StudyField.objects.all():
+            fields[field.study_id].append(field)
+        ParticipantFieldValue.objects.bulk_create([
+            ParticipantFieldValue(participant=participant, field=field, value="value")
+            for participant in participants for field in fields[participant.study_id]
+        ])
+
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        ChunkRegistry.objects.bulk_create([
+            ChunkRegistry(
+                is_chunkable=True,
+                chunk_path="CHUNKED_DATA/%s/%s/gps/%s.csv" % (participant.study_id, participant.patient_id, hour),
+                data_type=GPS,
+                time_bin=start + timedelta(hours=hour),
+                study_id=participant.study_id,
+                participant=participant,
+            ) for participant in participants for hour in range(DAYS)
+        ])
+        DailyDataVolume.objects.bulk_create([
+            DailyDataVolume(study_id=participant.study_id, participant=participant, data_type=GPS,
+                            date=date(2020, 1, 1) + timedelta(days=day), bytes=100, chunk_count=1)
+            for participant in participants for day in range(DAYS)
+        ])
+        PipelineSummaryValue.objects.bulk_create([
+            PipelineSummaryValue(study_id=participant.study_id, participant=participant, data_stream="RoG_km",
+                                 date=date(2020, 1, 1) + timedelta(days=day), value=1.5)
+            for participant in participants for day in range(DAYS)
+        ])
+        PipelineUpload.objects.bulk_create([
+            PipelineUpload(object_id="%024d" % study.pk, study=study, file_name="file.csv",
+                           s3_path="path/file.csv", file_hash="hash")
+            for study in new_studies
+        ])
+        PipelineUploadTags.objects.bulk_create([
+            PipelineUploadTags(pipeline_upload=pipeline_upload, tag=tag)
+            for pipeline_upload in PipelineUpload.objects.filter(study__in=new_studies) for tag in ["tag1", "tag2"]
+        ])
+
+        for i in range(RESEARCHERS):
+            Researcher.create_with_password("researcher%03d" % (batch * RESEARCHERS + i), "password")
+        researchers = list(Researcher.objects.filter(username__startswith="researcher"))
+        StudyRelation.objects.bulk_create([
+            StudyRelation(study=study, researcher=cls.study_admin, relationship=ResearcherRole.study_admin)
+            for study in new_studies
+        ] + [
+            StudyRelation(study=study, researcher=researcher, relationship=ResearcherRole.researcher)
+            for study in studies for researcher in researchers
+            if study.pk not in old_study_ids or researcher.pk not in old_researcher_ids
+        ])
+
+    def setUp(self):
+        # the app closes the connection after each request (session_transaction included), which
+        # would end the test's transaction.
+        patcher = patch("app.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.clients = {}
+        for researcher in [self.site_admin, self.study_admin]:
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session[SESSION_UUID] = "session"
+                session[EXPIRY_NAME] = datetime.now() + timedelta(hours=1)
+                session[SESSION_NAME] = researcher.username
+            self.clients[researcher.username] = client
+
+    def url(self, rule):
+        arguments = {
+            "study_id": self.study.pk,
+            "survey_id": self.survey.pk,
+            "researcher_pk": self.researcher.pk,
+            "data_stream": GPS,
+            # the custom fields page takes the participant's primary key.
+            "patient_id": self.participant.pk if "patient_fields" in rule.rule else self.participant.patient_id,
+        }
+        return re.sub(r"<(?:\w+:)?(\w+)>", lambda match: str(arguments[match.group(1)]), rule.rule)
+
+    def query_string(self, rule):
+        if not rule.rule.startswith("/get-"):
+            return {}
+        return {"access_key": self.access_key, "secret_key": self.secret_key, "study_id": self.study.object_id}
+
+    def test_every_route_is_declared(self):
+        rules = {rule.rule for rule in blueprint_rules()}
+        self.assertEqual(rules - set(QUERY_BUDGETS) - set(UNBUDGETED_ROUTES), set())
+        self.assertEqual(set(QUERY_BUDGETS) - rules, set())
+
+    def test_query_budgets(self):
+        for (username, route), queries in self.render_routes().items():
+            with self.subTest(researcher=username, route=route):
+                self.assertLessEqual(len(queries), QUERY_BUDGETS[route], format_queries(queries))
+
+    def test_query_counts_do_not_grow_with_the_fixture(self):
+        query_counts = {key: len(queries) for key, queries in self.render_routes().items()}
+        self.grow_fixture(1)
+        for (username, route), queries in self.render_routes().items():
+            with self.subTest(researcher=username, route=route):
+                self.assertLessEqual(len(queries), query_counts[username, route], format_queries(queries))
+
+    def render_routes(self):
+        """ The queries of every budgeted route, by (researcher username, route). """
+        return {
+            (username, rule.rule): self.render(client, rule)
+            for username, client in self.clients.items() for rule in blueprint_rules() if rule.rule in QUERY_BUDGETS
+        }
+
+    def render(self, client, rule):
+        """ The queries of a GET request of the route (including those run while the response is
+        streamed). """
+        # (reads inside the test's transaction are not routed to the replica.)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(self.url(rule), query_string=self.query_string(rule))
+            response.get_data()
+        self.assertLess(response.status_code, 500, rule.rule)
+        return queries.captured_queries
+
+
+def format_queries(queries):
+    return "\n".join(query["sql"] for query in queries)
@@ -0,0 +1,55 @@
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from django.db import connections, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from database import routers
+from database.routers import read_database, read_replica
+from database.study_models import Study
+from database.tests.tests import create_study
+
+
+class TestReadReplicaRouter(TransactionTestCase):
+    # the test settings' "replica" is a mirror of the test database, reads are told apart by the
+    # connection they run on.  This is not a TestCase because reads inside a transaction are never
+    # routed to a replica.
+    multi_db = True
+
+    def setUp(self):
+        routers.clear_replica_lag_cache()
+        create_study()
+
+    def tearDown(self):
+        routers.clear_replica_lag_cache()
+
+    def read_studies(self):
+        """ Reads the study, returns the aliases of the databases that were queried. """
+        captures = {alias: CaptureQueriesContext(connections[alias]) for alias in ["default", "replica"]}
+        with ExitStack() as stack:
+            for capture in captures.values():
+                stack.enter_context(capture)
+            self.assertEqual(list(Study.objects.values_list("name", flat=True)), ["study"])
+        return {alias for alias, capture in captures.items() if capture.captured_queries}
+
+    def test_reads_go_to_the_primary_by_default(self):
+        self.assertEqual(self.read_studies(), {"default"})
+
+    def test_reads_inside_read_replica_go_to_the_replica(self):
+        with read_replica():
+            self.assertEqual(self.read_studies(), {"replica"})
+        self.assertEqual(read_database(), "replica")
+
+    @patch("database.routers.replica_lag_seconds", return_value=10**6)
+    def test_lagging_replica_falls_back_to_the_primary(self, _):
+        with read_replica():
+            self.assertEqual(self.read_studies(), {"default"})
+
+    @patch("database.routers.replica_lag_seconds", side_effect=Exception("replica is down"))
+    def test_unreachable_replica_falls_back_to_the_primary(self, _):
+        self.assertEqual(read_database(), "default")
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(read_database(), "default")
@@ -0,0 +1,58 @@
+import hashlib
+import zlib
+from base64 import b64encode
+from unittest import TestCase
+
+from libs.registry import (decode_registry, encode_registry, InvalidRegistryError, sorted_registry_items,
+    unregistered_chunks)
+
+
+def md5_hash(value):
+    return b64encode(hashlib.md5(value.encode()).digest()).decode()
+
+
+class TestBinaryRegistry(TestCase):
+
+    registry = {
+        "study/participant1/gps/2020-01-01T01:00:00.csv": md5_hash("a"),
+        "study/participant1/gps/2020-01-01T00:00:00.csv": md5_hash("b"),
+        "study/participant2/audio_recordings/survey/2020-01-01T00:00:00.mp4": "",
+        "study/participänt3/texts/2020-01-01T00:00:00.csv": "not an md5 hash",
+    }
+
+    def test_round_trip(self):
+        self.assertEqual(list(decode_registry(encode_registry(self.registry))), sorted(self.registry.items()))
+        self.assertEqual(list(decode_registry(encode_registry({}))), [])
+
+    def test_smaller_than_json(self):
+        registry = {"study/participant/accelerometer/%s.csv" % i: md5_hash(str(i)) for i in range(1000)}
+        self.assertLess(len(encode_registry(registry)), len(str(registry)) / 3)
+
+    def test_corrupt_registries_are_rejected(self):
+        encoded = encode_registry(self.registry)
+        truncated = encoded[:4] + zlib.compress(zlib.decompress(encoded[4:])[:-3])
+        for corrupt in [b"", b"{}", encoded[:-5], truncated]:
+            with self.assertRaises(InvalidRegistryError):
+                list(decode_registry(corrupt))
+
+
+class TestRegistryDiff(TestCase):
+
+    def test_unregistered_chunks(self):
+        registry = {"a/1": "hash1", "a/2": "hash2", "a/4": "hash4", "b/1": "hash5"}
+        chunks = [
+            {"chunk_path": "a/1", "chunk_hash": "hash1"},  # registered
+            {"chunk_path": "a/2", "chunk_hash": "changed"},  # hash changed
+            {"chunk_path": "a/3", "chunk_hash": "hash3"},  # new
+            {"chunk_path": "a/4", "chunk_hash": "hash4"},  # registered
+            {"chunk_path": "c/1", "chunk_hash": "hash6"},  # new, after the end of the registry
+        ]
+        for registry_items in [sorted_registry_items(registry), decode_registry(encode_registry(registry))]:
+            self.assertEqual(
+                [chunk["chunk_path"] for chunk in unregistered_chunks(chunks, registry_items)],
+                ["a/2", "a/3", "c/1"],
+            )
+
+    def test_empty_registry(self):
+        chunks = [{"chunk_path": "a/1", "chunk_hash": ""}]
+        self.assertEqual(list(unregistered_chunks(chunks, [])), chunks)
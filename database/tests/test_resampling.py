@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from libs.resampling import (AGGREGATE, DECIMATE, Resample, resample_csv, ResampleError,
+    validate_resample)
+
+
+def make_csv(rows):
+    return b"timestamp,UTC time,accuracy,x\n" + b"\n".join(
+        b"%d,2020-01-01T00:00:00.000,unknown,%s" % (timestamp, x) for timestamp, x in rows
+    )
+
+
+class TestResampling(TestCase):
+
+    def test_aggregate(self):
+        csv = make_csv([(1000, b"1"), (1500, b"3"), (1999, b""), (3000, b"-2")])
+        self.assertEqual(
+            resample_csv(csv, Resample(1000, AGGREGATE)).split(b"\n"),
+            [
+                b"timestamp,UTC time,count,accuracy_mean,accuracy_std,accuracy_min,accuracy_max,"
+                b"x_mean,x_std,x_min,x_max",
+                # empty values are not counted in the statistics, the non-numeric column is empty.
+                b"1000,1970-01-01T00:00:01.000,3,,,,,2,1,1,3",
+                b"3000,1970-01-01T00:00:03.000,1,,,,,-2,0,-2,-2",
+            ]
+        )
+
+    def test_decimate(self):
+        csv = make_csv([(1000, b"1"), (1500, b"3"), (2000, b"4"), (62000, b"5")])
+        self.assertEqual(resample_csv(csv, Resample(60000, DECIMATE)), make_csv([(1000, b"1"), (62000, b"5")]))
+
+    def test_no_rows(self):
+        self.assertEqual(resample_csv(b"timestamp,UTC time,x\n", Resample(1000, AGGREGATE)),
+                         b"timestamp,UTC time,count,x_mean,x_std,x_min,x_max")
+        self.assertEqual(resample_csv(b"timestamp,UTC time,x", Resample(1000, DECIMATE)), b"timestamp,UTC time,x")
+
+    def test_windows_divide_an_hour(self):
+        validate_resample(Resample(60000, AGGREGATE))
+        for resample in [Resample(7000, AGGREGATE), Resample(0, AGGREGATE), Resample(1000, "median")]:
+            with self.assertRaises(ResampleError):
+                validate_resample(resample)
@@ -0,0 +1,101 @@
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from libs import s3
+from libs.adaptive_concurrency import AdaptiveConcurrencyLimiter
+
+
+def make_client_error(code, status):
+    return ClientError(
+        {"Error": {"Code": code, "Message": ""}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        "GetObject",
+    )
+
+
+class TestS3ErrorClassification(TestCase):
+
+    def test_throttling(self):
+        self.assertEqual(s3.classify_s3_error(make_client_error("SlowDown", 503)), s3.S3_THROTTLED)
+
+    def test_server_error_is_retryable(self):
+        self.assertEqual(s3.classify_s3_error(make_client_error("InternalError", 500)), s3.S3_RETRYABLE)
+
+    def test_connection_error_is_retryable(self):
+        error = EndpointConnectionError(endpoint_url="https://s3.amazonaws.com")
+        self.assertEqual(s3.classify_s3_error(error), s3.S3_RETRYABLE)
+
+    def test_missing_key_is_permanent(self):
+        self.assertEqual(s3.classify_s3_error(make_client_error("NoSuchKey", 404)), s3.S3_PERMANENT)
+        self.assertEqual(s3.classify_s3_error(ValueError()), s3.S3_PERMANENT)
+
+
+class TestS3Retries(TestCase):
+
+    def test_backoff_is_capped(self):
+        for attempt in range(50):
+            self.assertLessEqual(s3.s3_retry_delay(attempt), s3.S3_RETRY_BACKOFF_MAX)
+
+    @patch("libs.s3.sleep")
+    def test_retries_then_succeeds(self, mock_sleep):
+        responses = [make_client_error("SlowDown", 503), make_client_error("InternalError", 500), "data"]
+
+        def flaky(**kwargs):
+            ret = responses.pop(0)
+            if isinstance(ret, Exception):
+                raise ret
+            return ret
+
+        self.assertEqual(s3._s3_call(flaky, "a/key", number_retries=3), "data")
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("libs.s3.sleep")
+    def test_permanent_errors_are_not_retried(self, mock_sleep):
+        def missing(**kwargs):
+            raise make_client_error("NoSuchKey", 404)
+
+        with self.assertRaises(ClientError):
+            s3._s3_call(missing, "a/key", number_retries=3)
+        mock_sleep.assert_not_called()
+
+
+class TestAdaptiveConcurrencyLimiter(TestCase):
+
+    def test_aimd(self):
+        limiter = AdaptiveConcurrencyLimiter(maximum=16)
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 8)
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 16)
+        for _ in range(10):
+            limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_limits_in_flight_operations(self):
+        limiter = AdaptiveConcurrencyLimiter(maximum=2)
+        peak = []
+
+        def work():
+            with limiter:
+                peak.append(limiter.in_flight)
+                sleep(0.01)
+
+        threads = [Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max(peak), 2)
+
+
+class TestMultipartParts(TestCase):
+
+    def test_iterate_parts(self):
+        blocks = [b"a" * 3, b"b" * 10, b"c" * 2]
+        parts = list(s3._iterate_parts(blocks, 4))
+        self.assertEqual([len(part) for part in parts], [4, 4, 4, 3])
+        self.assertEqual(b"".join(parts), b"".join(blocks))
@@ -0,0 +1,51 @@
+import tarfile
+from io import BytesIO
+from unittest import TestCase
+
+from libs.streaming_exports import CsvStream, TarStream
+
+
+class TestTarStream(TestCase):
+
+    def test_round_trip(self):
+        files = [
+            ("p/gps/2020-01-01 00_00_00.csv", b"timestamp,latitude\n1,2\n"),
+            ("p/texts/empty.csv", b""),
+            ("p/%s/long.csv" % ("x" * 200), b"a" * 512),
+        ]
+        tar = TarStream()
+        blocks = []
+        for file_name, contents in files:
+            blocks.extend(tar.add(file_name, contents))
+        blocks.append(tar.close())
+        data = b"".join(blocks)
+
+        self.assertEqual(len(data), tar.size)
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        with tarfile.open(fileobj=BytesIO(data)) as result:
+            self.assertEqual(
+                [(member.name, result.extractfile(member).read()) for member in result.getmembers()],
+                files,
+            )
+
+    def test_contents_are_not_copied(self):
+        contents = b"x" * 1000
+        self.assertIs(list(TarStream().add("file", contents))[1], contents)
+
+
+class TestCsvStream(TestCase):
+
+    def test_files_are_concatenated(self):
+        csv_stream = CsvStream()
+        output = b"".join([
+            csv_stream.add("p1", b"timestamp,x\n1,2\n3,4\n"),
+            csv_stream.add("p2", b"timestamp,x\n5,6"),
+            csv_stream.add("p2", b"timestamp,x\n"),
+            # different columns, the header is repeated.
+            csv_stream.add("p3", b"timestamp,x,accuracy\n7,8,9\n"),
+        ])
+        self.assertEqual(
+            output,
+            b"patient_id,timestamp,x\np1,1,2\np1,3,4\np2,5,6\n"
+            b"patient_id,timestamp,x,accuracy\np3,7,8,9\n"
+        )
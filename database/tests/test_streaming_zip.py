@@ -0,0 +1,78 @@
+from io import BytesIO
+from unittest import TestCase
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from libs.streaming_bytes_io import UnseekableStreamingBytesIO
+from libs.streaming_zip import prepare_zip_entry, SplicingZipFile, zip_info_to_json, ZipSpliceError
+
+
+def make_bundle(files):
+    """ Builds a bundle as build_export_bundle does, returns the bundle's bytes and zip entries. """
+    bundle_file = BytesIO()
+    zip_file = ZipFile(bundle_file, mode="w", compression=ZIP_STORED, allowZip64=True)
+    for file_name, contents in files:
+        zip_file.writestr(file_name, contents)
+    file_size = zip_file.start_dir
+    zip_entries = [zip_info_to_json(zip_info) for zip_info in zip_file.infolist()]
+    zip_file.close()
+    return bundle_file.getvalue()[:file_size], zip_entries
+
+
+class TestSplicingZipFile(TestCase):
+
+    def test_bundles_are_spliced_between_other_files(self):
+        bundle_bytes, zip_entries = make_bundle([("p/gps/1.csv", b"one"), ("p/gps/2.csv", b"two" * 1000)])
+        zip_output = UnseekableStreamingBytesIO()
+        zip_input = SplicingZipFile(zip_output, mode="w", compression=ZIP_STORED, allowZip64=True)
+        output = []
+
+        zip_input.writestr("p/texts/1.csv", b"before")
+        offset = zip_output.tell()
+        # the bundle is written in pieces, as it is streamed.
+        for i in range(0, len(bundle_bytes), 100):
+            zip_output.write(bundle_bytes[i:i + 100])
+            output.append(zip_output.getvalue())
+            zip_output.empty()
+        zip_input.add_spliced_entries(zip_entries, offset, len(bundle_bytes))
+        zip_input.writestr("p/texts/2.csv", b"after")
+        zip_input.close()
+        output.append(zip_output.getvalue())
+
+        with ZipFile(BytesIO(b"".join(output))) as result:
+            self.assertIsNone(result.testzip())
+            self.assertEqual(
+                {name: result.read(name) for name in result.namelist()},
+                {"p/texts/1.csv": b"before", "p/gps/1.csv": b"one", "p/gps/2.csv": b"two" * 1000,
+                 "p/texts/2.csv": b"after"},
+            )
+
+    def test_truncated_bundle_is_rejected(self):
+        bundle_bytes, zip_entries = make_bundle([("p/gps/1.csv", b"one")])
+        zip_output = UnseekableStreamingBytesIO()
+        zip_input = SplicingZipFile(zip_output, mode="w", compression=ZIP_STORED, allowZip64=True)
+        zip_output.write(bundle_bytes[:-1])
+        with self.assertRaises(ZipSpliceError):
+            zip_input.add_spliced_entries(zip_entries, 0, len(bundle_bytes))
+
+    def test_prepared_entries(self):
+        csv = b"timestamp,x,y,z\n" + b"".join(b"%d,0.01,0.02,9.81\n" % i for i in range(1000))
+        random_bytes = bytes(range(256)) * 4
+        zip_output = UnseekableStreamingBytesIO()
+        zip_input = SplicingZipFile(zip_output, mode="w", compression=ZIP_DEFLATED, allowZip64=True)
+        compressed = prepare_zip_entry("p/accelerometer/1.csv", csv, 6)
+        stored = prepare_zip_entry("p/audio/1.mp4", b"x", 6)
+        self.assertEqual(compressed.zip_info.compress_type, ZIP_DEFLATED)
+        self.assertLess(len(compressed.data), len(csv) / 5)
+        # compression would make this larger, so it is stored.
+        self.assertEqual(stored.zip_info.compress_type, ZIP_STORED)
+
+        zip_input.write_prepared_entry(compressed)
+        zip_input.writestr("p/texts/1.csv", random_bytes)
+        zip_input.write_prepared_entry(stored)
+        zip_input.close()
+
+        with ZipFile(BytesIO(zip_output.getvalue())) as result:
+            self.assertIsNone(result.testzip())
+            self.assertEqual(result.read("p/accelerometer/1.csv"), csv)
+            self.assertEqual(result.read("p/audio/1.mp4"), b"x")
+            self.assertEqual(result.read("p/texts/1.csv"), random_bytes)
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from database.data_access_models import SurveyAnswerFile, SurveyResultsCache
+from database.tests.tests import create_participant, create_study
+from libs.graph_data import get_participant_survey_results, grab_file_names
+
+
+class TestSurveyAnswerFiles(TestCase):
+
+    def setUp(self):
+        self.study = create_study()
+        self.participant = create_participant(self.study)
+        self.survey_id = "c" * 24
+
+    def upload(self, timestamp):
+        SurveyAnswerFile.register(
+            self.participant, "patient1/surveyAnswers/%s/%s.csv" % (self.survey_id, timestamp)
+        )
+
+    def test_register(self):
+        SurveyAnswerFile.register(self.participant, "patient1/gps/1580000000000.csv")
+        self.upload(1580000000000)
+        self.upload(1580000000000)
+        self.assertEqual(
+            list(SurveyAnswerFile.objects.values_list("survey_object_id", "file_path")),
+            [(self.survey_id, "patient1/surveyAnswers/%s/1580000000000.csv" % self.survey_id)],
+        )
+
+    def test_grab_file_names(self):
+        for timestamp in range(1580000000000, 1580000000010):
+            self.upload(timestamp)
+        with self.assertNumQueries(1):
+            file_names = grab_file_names(self.study.object_id, self.survey_id, "patient1", 7)
+        self.assertEqual(
+            file_names,
+            ["patient1/surveyAnswers/%s/%s.csv" % (self.survey_id, timestamp)
+             for timestamp in range(1580000000003, 1580000000010)],
+        )
+
+    @patch("libs.graph_data.s3_retrieve")
+    def test_results_are_cached_until_an_upload(self, s3_retrieve):
+        s3_retrieve.return_value = b"question id,question text,answer"
+        self.upload(1580000000000)
+        self.assertEqual(get_participant_survey_results(self.participant, [self.survey_id]), [[]])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_participant_survey_results(self.participant, [self.survey_id]), [[]])
+        self.assertEqual(s3_retrieve.call_count, 1)
+
+        self.upload(1580000000001)
+        self.assertEqual(SurveyResultsCache.objects.count(), 0)
+        get_participant_survey_results(self.participant, [self.survey_id])
+        self.assertEqual(s3_retrieve.call_count, 3)
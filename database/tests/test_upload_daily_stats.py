@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from config.constants import ACCELEROMETER, GPS
+from database.profiling_models import UploadDailyStats, UploadTracking
+from database.tests.tests import create_participant, create_study
+
+
+class TestUploadDailyStats(TestCase):
+
+    def setUp(self):
+        self.study = create_study()
+        self.participant = create_participant(self.study)
+
+    def stats(self):
+        return sorted(UploadDailyStats.objects.values_list("data_stream", "date", "count", "bytes"))
+
+    def test_uploads_are_counted(self):
+        UploadTracking.track("patient1/gps/1580000000000.csv", 10, self.participant)
+        UploadTracking.track("patient1/gps/1580000001000.csv", 5, self.participant)
+        UploadTracking.track("patient1/accel/1580000000000.csv", 100, self.participant)
+        today = timezone.now().date()
+        self.assertEqual(self.stats(), [(ACCELEROMETER, today, 1, 100), (GPS, today, 2, 15)])
+
+        weekly_stats = UploadTracking.weekly_stats(get_usernames=True)
+        self.assertEqual(weekly_stats[GPS]["count"], 2)
+        self.assertEqual(weekly_stats[GPS]["users"], {self.participant.pk})
+        self.assertEqual(weekly_stats["totals"]["total_count"], 3)
+        self.assertEqual(weekly_stats["totals"]["user_count"], 1)
+
+    @patch("database.profiling_models.UPLOAD_TRACKING_RETENTION_DAYS", 30)
+    def test_compact(self):
+        now = datetime(2020, 6, 1, 12, tzinfo=timezone.utc)
+        # uploads from before the daily stats existed.
+        UploadTracking.objects.bulk_create([
+            UploadTracking(file_path="patient1/gps/%s.csv" % days_ago, file_size=10,
+                           timestamp=now - timedelta(days=days_ago), participant=self.participant)
+            for days_ago in [1, 1, 40]
+        ])
+        UploadTracking.compact(now)
+        # every day is rolled up, the rows of the day 40 days ago are deleted.
+        self.assertEqual(self.stats(), [(GPS, date(2020, 4, 22), 1, 10), (GPS, date(2020, 5, 31), 2, 20)])
+        self.assertEqual(UploadTracking.objects.count(), 2)
+        UploadTracking.compact(now)
+        self.assertEqual(self.stats(), [(GPS, date(2020, 4, 22), 1, 10), (GPS, date(2020, 5, 31), 2, 20)])
@@ -14,6 +14,27 @@ class IsMongoID(Exception): pass
 class ReferenceRequired(Exception): pass
 
 
+def create_study(name="study", object_id="b" * 24, **kwargs) -> Study:
+    """ A Study, without the device settings and validation of Study.create_with_object_id. """
+    Study.objects.bulk_create([Study(name=name, encryption_key="a" * 32, object_id=object_id, **kwargs)])
+    return Study.objects.get(object_id=object_id)
+
+
+def build_participant(patient_id, study, **kwargs) -> Participant:
+    """ An unsaved Participant, for bulk_create. """
+    return Participant(patient_id=patient_id, password="a" * 44, salt="a" * 24, study=study, **kwargs)
+
+
+def create_participants(study, patient_ids) -> list:
+    """ Participants of the study, in patient id order. """
+    Participant.objects.bulk_create([build_participant(patient_id, study) for patient_id in patient_ids])
+    return list(Participant.objects.filter(patient_id__in=patient_ids).order_by("patient_id"))
+
+
+def create_participant(study, patient_id="patient1") -> Participant:
+    return create_participants(study, [patient_id])[0]
+
+
 class CommonTestCase(TestCase):
     
     # Researcher
@@ -85,6 +85,10 @@ class Participant(AbstractPasswordUser):
 
     study = models.ForeignKey('Study', on_delete=models.PROTECT, related_name='participants', null=False)
 
+    class Meta:
+        # a study's participant list is searched by patient id prefix, see libs.participant_list.
+        indexes = [models.Index(fields=["study", "patient_id"], name="participant_study_idx")]
+
     @classmethod
     def create_with_password(cls, **kwargs):
         """
@@ -1,6 +1,9 @@
 $(document).ready(function(){
-    // Set up the main list of patients using DataTables
-    $("#patients_list").DataTable();
+    // Set up the main list of patients using DataTables, the rows are read a page at a time
+    var patients_list = $("#patients_list");
+    if (patients_list.length) {
+        setup_patients_list(patients_list);
+    }
 
     $('#many-new-patients-loading-spinner').hide();
 
@@ -15,6 +18,57 @@ $(document).ready(function(){
     });
 });
 
+/* The patient table of a study page, a page of rows at a time (and searched by patient id prefix
+   and sorted) on the server. */
+function setup_patients_list(table) {
+    var study_id = table.data("study-id");
+    var columns = [
+        {data: "patient_id", render: function(patient_id) {
+            return "<b>" + escape_html(patient_id) + "</b>";
+        }},
+        {data: "phone_registered", render: function(phone_registered, type, patient) {
+            if (!phone_registered) {
+                return "No smartphone registered";
+            }
+            return patient_form("/reset_device", patient, study_id, "reset_device_button", "Un-Register Smartphone");
+        }},
+        {data: "os_type", render: function(os_type) {
+            return os_type ? escape_html(os_type) : "<i>unknown</i>";
+        }},
+        {data: null, orderable: false, render: function(data, type, patient) {
+            return patient_form("/reset_participant_password", patient, study_id, "reset_password_button", "Reset password");
+        }}
+    ];
+    table.find("th[data-field]").each(function() {
+        var field = $(this).data("field");
+        columns.push({data: "fields", orderable: false, className: "custom-field-value", render: function(fields, type, patient) {
+            var value = fields[field] === undefined ? "" : fields[field];
+            return '<a href="/view_study/' + study_id + '/patient_fields/' + patient.id + '" title="Edit this value">' +
+                '<span class="custom-field-edit-link glyphicon glyphicon-pencil"></span>' +
+                '<span class="non-link-text">' + escape_html(value) + '</span></a>';
+        }});
+    });
+    table.DataTable({
+        serverSide: true,
+        processing: true,
+        ajax: table.data("url"),
+        columns: columns,
+        language: {search: "Patient ID starts with:"}
+    });
+}
+
+function patient_form(action, patient, study_id, button_class, button_text) {
+    return '<form action="' + action + '" method="post"><div class="form-inline">' +
+        '<input type="hidden" name="patient_id" value="' + escape_html(patient.patient_id) + '">' +
+        '<input type="hidden" name="study_id" value="' + study_id + '">' +
+        '<button type="submit" class="btn btn-warning btn-sm ' + button_class + '">' + button_text + '</button>' +
+        '</div></form>';
+}
+
+function escape_html(text) {
+    return $("<div>").text(text).html();
+}
+
 function logout() {
     window.location.href="/logout";
 }
@@ -0,0 +1,60 @@
+from threading import Condition
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    An AIMD (additive increase, multiplicative decrease) limit on the number of simultaneous
+    network operations, shared by every thread in a process.
+
+    Each operation runs inside the limiter (`with limiter:`).  A successful operation nudges the
+    limit up by `increase` (spread over `limit` successes, so it grows by ~1 per "round" of
+    requests); a throttling response (e.g. S3 503 SlowDown) multiplies the limit by `decrease`.
+    The limit never leaves the range [minimum, maximum], maximum should be the size of the
+    connection pool so that threads never block inside boto.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, increase: float = 1.0, decrease: float = 0.5):
+        if minimum < 1 or maximum < minimum:
+            raise ValueError("invalid concurrency range %s-%s" % (minimum, maximum))
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self._limit = float(maximum)
+        self._in_flight = 0
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        with self._condition:
+            self._limit = min(float(self.maximum), self._limit + self.increase / max(self._limit, 1.0))
+            self._condition.notify()
+
+    def on_throttle(self):
+        with self._condition:
+            self._limit = max(float(self.minimum), self._limit * self.decrease)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
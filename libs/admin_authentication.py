@@ -189,15 +189,21 @@ def get_researcher_allowed_studies(as_json=True):
     """
     Return a list of studies which the currently logged-in researcher is authorized to view and edit.
     """
-    session_researcher = get_session_researcher()
-    kwargs = {}
-    if not session_researcher.site_admin:
-        kwargs = dict(study_relations__researcher=session_researcher)
-
-    study_set = [
-        study for study in
-        Study.get_all_studies_by_name().filter(**kwargs).values("name", "object_id", "id", "is_test")
-    ]
+    # pages call this more than once (e.g. for the navbar and the page), it is queried once per request.
+    try:
+        study_set = request._beiwe_allowed_studies
+    except AttributeError:
+        session_researcher = get_session_researcher()
+        kwargs = {}
+        if not session_researcher.site_admin:
+            kwargs = dict(study_relations__researcher=session_researcher)
+
+        study_set = [
+            study for study in
+            Study.get_all_studies_by_name().filter(**kwargs).values("name", "object_id", "id", "is_test")
+        ]
+        setattr(request, "_beiwe_allowed_studies", study_set)
+
     if as_json:
         return json.dumps(study_set)
     else:
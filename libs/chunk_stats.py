@@ -0,0 +1,26 @@
+from typing import List, Optional
+
+import numpy
+
+# Statistics of the samples (rows) of a chunked file, recorded in ChunkStats as files are chunked,
+# so that the coverage of a participant's data (how many samples arrived each hour, and where the
+# gaps are) is found without retrieving the files.
+
+
+def get_chunk_stats(rows: List[List[bytes]], sample_count: int) -> Optional[dict]:
+    """ The ChunkStats fields of a chunk's rows (lists of values, the first a unix millisecond
+    timestamp) sorted by timestamp.  Rows may repeat, sample_count is the number of distinct rows
+    in the file.  None if there are no rows. """
+    if not rows:
+        return None
+    timestamps = numpy.array([row[0] for row in rows]).astype(numpy.int64)
+    first_timestamp, last_timestamp = int(timestamps[0]), int(timestamps[-1])
+    span = last_timestamp - first_timestamp
+    return {
+        "sample_count": sample_count,
+        "first_timestamp": first_timestamp,
+        "last_timestamp": last_timestamp,
+        # samples per second between the first and last samples.
+        "sampling_rate": (sample_count - 1) * 1000 / span if span > 0 else None,
+        "max_gap": int(numpy.diff(timestamps).max()) if len(timestamps) > 1 else None,
+    }
@@ -0,0 +1,195 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, List
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Sum, When
+
+from config.constants import CALL_LOG, CALL_SUMMARY_STREAMS, TEXT_SUMMARY_STREAMS, TEXTS_LOG
+from database.data_access_models import (CommunicationContact, CommunicationContactDay,
+    PipelineSummaryValue)
+from database.user_models import Participant
+
+# The daily call and text features (CALL_SUMMARY_STREAMS and TEXT_SUMMARY_STREAMS) of each
+# participant of the studies with server_summaries turned on, computed on the server from the new rows of the call and text logs as they are
+# chunked (see libs.file_processing.upload_binified_data).  The running state is a CommunicationContactDay
+# per participant per contact per day, so the new rows update their days' contacts and the days'
+# features are recomputed from those days' contacts, without reading older data.  (Rebuild the
+# state from the chunked files with the backfill_communication_summaries management command.)
+#
+# Calls: the number and total duration (in seconds) of incoming and outgoing calls, and the number
+# of contacts who called (indegree) and were called (outdegree).  Missed calls are not counted.
+# Texts: likewise, with lengths in characters, plus reciprocity (the number of contacts who both
+# sent and received texts) and responsiveness (the mean minutes taken to reply to a contact's text,
+# replies are counted on the day they were sent).  Replies are matched to texts in time order, texts
+# older than the newest text already seen with a contact (e.g. from an old file uploaded late) are
+# counted but not matched.
+
+COMMUNICATION_DATA_TYPES = (CALL_LOG, TEXTS_LOG)
+
+CALL_COLUMNS = (b"hashed phone number", b"call type", b"duration in seconds")
+TEXT_COLUMNS = (b"hashed phone number", b"sent vs received", b"message length")
+
+
+def new_unique_rows(rows: List[List[bytes]], existing_rows: Iterable[List[bytes]] = ()) -> List[List[bytes]]:
+    """ The rows, without duplicates and without rows that are among the existing rows (files are
+    sometimes uploaded more than once). """
+    seen = set(b",".join(row) for row in existing_rows)
+    unique_rows = []
+    for row in rows:
+        line = b",".join(row)
+        if line not in seen:
+            seen.add(line)
+            unique_rows.append(row)
+    return unique_rows
+
+
+def summarize_chunked_communications(communications: list, uploaded_chunk_paths: set, error_handler):
+    """ Summarizes the new rows of call and text log chunks, (time_bin, chunk_path, patient_id,
+    data_type, header, rows) tuples, in time order, but only those of chunks that were uploaded and
+    of participants of studies with server_summaries turned on.  An error summarizing a
+    participant's rows is recorded by the error_handler. """
+    participant_communications = defaultdict(list)
+    for communication in sorted(communications, key=lambda c: c[0]):
+        if communication[1] in uploaded_chunk_paths:
+            participant_communications[communication[2]].append(communication)
+
+    for patient_id, communications in participant_communications.items():
+        with error_handler:
+            participant_id, study_id, server_summaries = Participant.objects.filter(
+                patient_id=patient_id).values_list("pk", "study_id", "study__server_summaries").get()
+            if not server_summaries:
+                continue
+            for _, _, _, data_type, header, rows in communications:
+                summarize_communications(study_id, participant_id, data_type, header, rows)
+
+
+def parse_communications(data_type: str, header: bytes, rows: List[List[bytes]]):
+    """ Yields (timestamp, contact, incoming, length) for the calls or texts of chunked rows (the
+    first column a unix millisecond timestamp), skipping missed calls and malformed rows. """
+    names = header.split(b",")
+    columns = CALL_COLUMNS if data_type == CALL_LOG else TEXT_COLUMNS
+    if not set(columns).issubset(names):
+        return
+    contact_column, direction_column, length_column = (names.index(name) for name in columns)
+    for row in rows:
+        if len(row) != len(names):
+            continue
+        direction = row[direction_column].lower()
+        if direction.startswith(b"incoming") or direction.startswith(b"received"):
+            incoming = True
+        elif direction.startswith(b"outgoing") or direction.startswith(b"sent"):
+            incoming = False
+        else:
+            continue
+        try:
+            timestamp = int(row[0])
+            length = int(row[length_column] or 0)
+        except ValueError:
+            continue
+        yield timestamp, row[contact_column].decode(errors="replace"), incoming, length
+
+
+def summarize_communications(study_id, participant_id, data_type: str, header: bytes, rows: List[List[bytes]]):
+    """ Adds new (unique) rows of a participant's call or text log to the running state and
+    recomputes the features of the days they are on. """
+    communications = sorted(parse_communications(data_type, header, rows))
+    if not communications:
+        return
+
+    counts = defaultdict(lambda: defaultdict(int))
+    with transaction.atomic():
+        if data_type == TEXTS_LOG:
+            # the unanswered texts are replied to in time order.
+            contacts = {
+                contact.contact: contact for contact in CommunicationContact.objects.select_for_update().filter(
+                    participant_id=participant_id, contact__in={contact for _, contact, _, _ in communications}
+                )
+            }
+        for timestamp, contact, incoming, length in communications:
+            day_counts = counts[utc_date(timestamp), contact]
+            direction = "incoming" if incoming else "outgoing"
+            day_counts[direction + "_count"] += 1
+            day_counts[direction + "_length"] += length
+            if data_type != TEXTS_LOG:
+                continue
+            if contact not in contacts:
+                contacts[contact] = CommunicationContact(participant_id=participant_id, contact=contact)
+            state = contacts[contact]
+            if state.last_seen is not None and timestamp < state.last_seen:
+                # a text that arrived late, see above.
+                continue
+            state.last_seen = timestamp
+            if incoming:
+                if state.unanswered_since is None:
+                    state.unanswered_since = timestamp
+            elif state.unanswered_since is not None and timestamp >= state.unanswered_since:
+                day_counts["response_count"] += 1
+                day_counts["response_seconds"] += (timestamp - state.unanswered_since) // 1000
+                state.unanswered_since = None
+
+        for (date, contact), day_counts in counts.items():
+            CommunicationContactDay.add(participant_id, data_type, date, contact, **day_counts)
+        if data_type == TEXTS_LOG:
+            for contact in contacts.values():
+                contact.save()
+
+        for date in {date for date, _ in counts}:
+            PipelineSummaryValue.replace_day_values(
+                study_id, participant_id, date, summary_streams(data_type),
+                compute_communication_features(participant_id, data_type, date),
+            )
+
+
+def summary_streams(data_type: str):
+    return CALL_SUMMARY_STREAMS if data_type == CALL_LOG else TEXT_SUMMARY_STREAMS
+
+
+def compute_communication_features(participant_id, data_type: str, date) -> dict:
+    """ The features of a participant's day of calls or texts, by data stream, from the day's
+    CommunicationContactDays. """
+    def contacts_where(**conditions):
+        return Sum(Case(When(then=1, **conditions), default=0, output_field=IntegerField()))
+
+    totals = CommunicationContactDay.objects.filter(
+        participant_id=participant_id, data_type=data_type, date=date
+    ).aggregate(
+        # (aliases named after the fields would be referred to by the conditions below.)
+        total_incoming=Sum("incoming_count"),
+        total_outgoing=Sum("outgoing_count"),
+        total_incoming_length=Sum("incoming_length"),
+        total_outgoing_length=Sum("outgoing_length"),
+        total_responses=Sum("response_count"),
+        total_response_seconds=Sum("response_seconds"),
+        indegree=contacts_where(incoming_count__gt=0),
+        outdegree=contacts_where(outgoing_count__gt=0),
+        reciprocal=contacts_where(incoming_count__gt=0, outgoing_count__gt=0),
+    )
+    if totals["total_incoming"] is None:
+        return {}
+
+    if data_type == CALL_LOG:
+        return {
+            "incoming_calls": totals["total_incoming"],
+            "outgoing_calls": totals["total_outgoing"],
+            "incoming_calllengths": totals["total_incoming_length"],
+            "outgoing_calllengths": totals["total_outgoing_length"],
+            "call_indegree": totals["indegree"],
+            "call_outdegree": totals["outdegree"],
+        }
+    features = {
+        "incoming_texts": totals["total_incoming"],
+        "outgoing_texts": totals["total_outgoing"],
+        "incoming_textlengths": totals["total_incoming_length"],
+        "outgoing_textlengths": totals["total_outgoing_length"],
+        "text_indegree": totals["indegree"],
+        "text_outdegree": totals["outdegree"],
+        "reciprocity": totals["reciprocal"],
+    }
+    if totals["total_responses"]:
+        features["responsiveness"] = totals["total_response_seconds"] / totals["total_responses"] / 60
+    return features
+
+
+def utc_date(timestamp: int):
+    return datetime.utcfromtimestamp(timestamp // 1000).date()
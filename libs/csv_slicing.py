@@ -0,0 +1,70 @@
+from collections import namedtuple
+from typing import List, Optional
+
+# Row and column selection inside csv files, for data downloads that only need part of each file.
+# The files of chunked data streams start with a header line, followed by rows sorted by their
+# first column, a unix millisecond timestamp.  Rows are found by binary searching the file's bytes
+# for row starts, so only the selected rows are ever parsed.
+
+# start and end are inclusive unix millisecond timestamps (or None), columns is a list of column
+# names as bytes (or None).
+CsvSlice = namedtuple("CsvSlice", ["start", "end", "columns"])
+
+
+def slice_csv(contents: bytes, csv_slice: CsvSlice) -> bytes:
+    """ Returns the header and the rows between csv_slice.start and csv_slice.end, with only the
+    columns in csv_slice.columns (in that order, empty if the file does not have that column). """
+    header_end = contents.find(b"\n")
+    if header_end == -1:
+        header, body_start = contents, len(contents)
+    else:
+        header, body_start = contents[:header_end], header_end + 1
+
+    first = body_start if csv_slice.start is None else _first_row_from(contents, body_start, csv_slice.start)
+    last = len(contents) if csv_slice.end is None else _first_row_from(contents, body_start, csv_slice.end + 1)
+    rows = contents[first:last].rstrip(b"\r\n") if first < last else b""
+
+    if csv_slice.columns:
+        header, rows = _project(header, rows, csv_slice.columns)
+    return header + b"\n" + rows if rows else header
+
+
+def _next_row(contents: bytes, body_start: int, position: int) -> int:
+    """ The start of the first row that starts at or after position. """
+    if position <= body_start:
+        return body_start
+    newline = contents.find(b"\n", position - 1)
+    return len(contents) if newline == -1 else newline + 1
+
+
+def _first_row_from(contents: bytes, body_start: int, timestamp: int) -> int:
+    """ The start of the first row with a timestamp of at least timestamp (the end of the file if
+    there is none).  Binary searches positions in the file, _next_row is monotonic in position. """
+    low, high = body_start, len(contents)
+    while low < high:
+        middle = (low + high) // 2
+        row = _next_row(contents, body_start, middle)
+        if row < len(contents) and _row_timestamp(contents, row) < timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    return _next_row(contents, body_start, low)
+
+
+def _row_timestamp(contents: bytes, row: int) -> int:
+    end = contents.find(b",", row)
+    return int(contents[row:end if end != -1 else len(contents)])
+
+
+def _project(header: bytes, rows: bytes, columns: List[bytes]) -> (bytes, bytes):
+    names = header.split(b",")
+    indexes = [names.index(column) if column in names else None for column in columns]
+
+    def value(values: List[bytes], index: Optional[int]) -> bytes:
+        return values[index] if index is not None and index < len(values) else b""
+
+    projected = [
+        b",".join([value(values, index) for index in indexes])
+        for values in (row.split(b",") for row in rows.split(b"\n"))
+    ] if rows else []
+    return b",".join(columns), b"\n".join(projected)
@@ -0,0 +1,31 @@
+from datetime import date
+from typing import List, Sequence, Tuple
+
+import numpy
+
+# Dashboard grids: a value per row (participant or data stream) per day, built from the rows of a
+# single query with numpy instead of scanning the query results once per cell.
+
+
+def build_grid(row_keys: Sequence, dates: List[date], cells: List[Tuple], dtype=numpy.int64) -> List[List]:
+    """ Returns a list (in row_keys order) of lists (in dates order) of the sums of the values of
+    the cells, (row_key, date, value) tuples, of each row and day.  Days without cells are None,
+    as are cells of rows or dates that are not in the grid.  dates must be consecutive days. """
+    grid = numpy.zeros((len(row_keys), len(dates)), dtype=dtype)
+    present = numpy.zeros(grid.shape, dtype=bool)
+    if cells and row_keys and dates:
+        cell_keys, cell_dates, values = (numpy.array(column) for column in zip(*cells))
+
+        # map each cell's row key to its row with a binary search of the sorted keys.
+        keys = numpy.array(row_keys)
+        order = numpy.argsort(keys, kind="stable")
+        positions = numpy.minimum(numpy.searchsorted(keys[order], cell_keys), len(keys) - 1)
+        rows = order[positions]
+        columns = (cell_dates.astype("datetime64[D]") - numpy.datetime64(dates[0], "D")).astype(numpy.int64)
+
+        in_grid = (keys[rows] == cell_keys) & (columns >= 0) & (columns < len(dates))
+        rows, columns, values = rows[in_grid], columns[in_grid], values[in_grid]
+        numpy.add.at(grid, (rows, columns), values.astype(dtype))
+        present[rows, columns] = True
+
+    return numpy.where(present, grid.astype(object), None).tolist()
@@ -0,0 +1,136 @@
+import os
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from weakref import WeakSet
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Django opens one database connection per thread, lazily, and (with CONN_MAX_AGE = None) keeps it
+# open for the life of that thread.  Code that runs ORM queries inside a ThreadPool therefore opens
+# a connection per worker thread that nothing ever closes; use DatabaseThreadPool instead.
+
+# Every database connection opened by this process.  Threads' connection wrappers drop out of the
+# WeakSet when their thread exits and the wrapper is garbage collected.
+_known_connections = WeakSet()
+_metrics_lock = Lock()
+_metrics = {"connections_opened": 0, "connections_closed": 0, "peak_open_connections": 0}
+
+
+def _count_open_connections():
+    return sum(1 for connection in list(_known_connections) if connection.connection is not None)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    with _metrics_lock:
+        _known_connections.add(connection)
+        _metrics["connections_opened"] += 1
+        _metrics["peak_open_connections"] = max(
+            _metrics["peak_open_connections"], _count_open_connections()
+        )
+
+
+def _count_closed():
+    with _metrics_lock:
+        _metrics["connections_closed"] += 1
+
+
+connection_created.connect(_on_connection_created, dispatch_uid="db_connection_metrics")
+
+
+def get_connection_metrics() -> dict:
+    """ Database connection counts for this process. """
+    with _metrics_lock:
+        return {
+            "pid": os.getpid(),
+            "open_connections": _count_open_connections(),
+            **_metrics,
+        }
+
+
+def format_connection_metrics() -> str:
+    return "pid %(pid)s: %(open_connections)s open db connections, %(peak_open_connections)s peak, " \
+           "%(connections_opened)s opened, %(connections_closed)s closed" % get_connection_metrics()
+
+
+def close_connections_after_each_task() -> bool:
+    """ With CONN_MAX_AGE = 0 (pgbouncer transaction pooling mode, see config/django_settings.py)
+    connections are returned to the pooler at the end of every task instead of being held for the
+    life of the worker thread. """
+    return all(connection.settings_dict["CONN_MAX_AGE"] == 0 for connection in connections.all())
+
+
+def _close_thread_connections():
+    """ Closes the calling thread's database connections. """
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.close()
+            _count_closed()
+
+
+class DatabaseThreadPool(ThreadPool):
+    """
+    A ThreadPool that cleans up the database connections its worker threads open.
+
+    After each task a worker's connections are closed if close_after_each_task is set (by default,
+    if the database is in pgbouncer mode) or the connection is broken or past its CONN_MAX_AGE,
+    otherwise they are kept open for the next task.  Every worker closes its own connections when
+    it exits, so terminate() does not wait for workers; join() the pool to wait until they have.
+    """
+
+    def __init__(self, *args, close_after_each_task: bool = None, **kwargs):
+        if close_after_each_task is None:
+            close_after_each_task = close_connections_after_each_task()
+        self.close_after_each_task = close_after_each_task
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def Process(*args, **kwargs):
+        # connections are not thread safe, so each worker thread closes its own on the way out.
+        worker = kwargs["target"]
+
+        def run_worker(*worker_args, **worker_kwargs):
+            try:
+                worker(*worker_args, **worker_kwargs)
+            finally:
+                _close_thread_connections()
+
+        kwargs["target"] = run_worker
+        return ThreadPool.Process(*args, **kwargs)
+
+    def _wrap(self, func):
+        def run_task(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._release_connections()
+        return run_task
+
+    def apply_async(self, func, *args, **kwargs):
+        return super().apply_async(self._wrap(func), *args, **kwargs)
+
+    def map(self, func, *args, **kwargs):
+        return super().map(self._wrap(func), *args, **kwargs)
+
+    def map_async(self, func, *args, **kwargs):
+        return super().map_async(self._wrap(func), *args, **kwargs)
+
+    def imap(self, func, *args, **kwargs):
+        return super().imap(self._wrap(func), *args, **kwargs)
+
+    def imap_unordered(self, func, *args, **kwargs):
+        return super().imap_unordered(self._wrap(func), *args, **kwargs)
+
+    def starmap(self, func, *args, **kwargs):
+        return super().starmap(self._wrap(func), *args, **kwargs)
+
+    def starmap_async(self, func, *args, **kwargs):
+        return super().starmap_async(self._wrap(func), *args, **kwargs)
+
+    def _release_connections(self):
+        """ Runs on the worker thread at the end of every task. """
+        if self.close_after_each_task:
+            _close_thread_connections()
+            return
+        for connection in connections.all():
+            connection.close_if_unusable_or_obsolete()
@@ -86,6 +86,27 @@ def decrypt_server(data: bytes, study_object_id: str) -> bytes:
     return AES.new(encryption_key, AES.MODE_CFB, segment_size=8, IV=iv).decrypt(data)
 
 
+def get_server_stream_encrypter(study_object_id) -> (bytes, AES.AESCipher):
+    """ Returns a new initialization vector and a cipher for encrypt_for_server-compatible
+    encryption of a file in sequential blocks.  (CFB mode with an 8 bit segment size is a stream
+    cipher, so successive encrypt calls on the same cipher object produce one contiguous file.)
+    The initialization vector must be written before the first encrypted block. """
+    encryption_key = Study.objects.filter(
+        object_id=study_object_id
+    ).values_list('encryption_key', flat=True).get().encode()
+    iv = urandom(16)
+    return iv, AES.new(encryption_key, AES.MODE_CFB, segment_size=8, IV=iv)
+
+
+def get_server_stream_decrypter(study_object_id, iv: bytes) -> AES.AESCipher:
+    """ Returns a cipher that decrypts a file encrypted by encrypt_for_server in sequential blocks,
+    the iv is the first 16 bytes of the file. """
+    encryption_key = Study.objects.filter(
+        object_id=study_object_id
+    ).values_list('encryption_key', flat=True).get().encode()
+    return AES.new(encryption_key, AES.MODE_CFB, segment_size=8, IV=iv)
+
+
 ########################### User/Device Decryption #############################
 
 
@@ -0,0 +1,305 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from tempfile import TemporaryFile
+from typing import Generator, Iterable
+from zipfile import ZipFile, ZIP_STORED
+
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDay, TruncMonth
+from django.utils import timezone
+
+from config.constants import (EXPORT_BUNDLE_DELAY_DAYS, EXPORT_BUNDLE_LOOKBACK_DAYS, EXPORT_BUNDLE_MIN_FILES,
+    EXPORT_BUNDLES_PER_RUN, IMAGE_FILE, S3_STREAM_BLOCK_SIZE, SURVEY_ANSWERS, SURVEY_TIMINGS, VOICE_RECORDING)
+from database.data_access_models import ChunkRegistry, ExportBundle
+from database.routers import read_database
+from libs.s3 import s3_retrieve, s3_upload_stream, storage_backend
+from libs.streaming_zip import zip_info_to_json
+
+# Export bundles are zips of one participant's files of one data stream for a whole month or day
+# (see ExportBundle), built in the background once the period is over.  A data download that
+# includes every file of a bundled period copies the bundle into its zip (one sequential read of
+# one object) instead of retrieving the files one by one.
+#
+# A bundle is stored as the zip's entries (local file headers and file contents) without the zip's
+# central directory.  The entries are recorded in ExportBundle.zip_entries, so that a download can
+# write the bundle's bytes verbatim and add the entries to its own central directory, see
+# libs.streaming_zip.SplicingZipFile.
+
+# The ChunkRegistry fields used to build bundles.
+BUNDLE_CHUNK_FIELDS = ["pk", "study_id", "chunk_path", "data_type", "time_bin", "last_updated",
+                       "participant__patient_id", "survey__object_id"]
+
+class ExportBundleError(Exception): pass
+
+
+def determine_file_name(chunk):
+    """ Generates the correct file name to provide the file with in the zip file.
+        (This also includes the folder location files in the zip.) """
+    extension = chunk["chunk_path"][-3:]  # get 3 letter file extension from the source.
+    if chunk["data_type"] == SURVEY_ANSWERS:
+        # add the survey_id from the file path.
+        return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
+                                   chunk["chunk_path"].rsplit("/", 2)[1], # this is the survey id
+                                   str(chunk["time_bin"]).replace(":", "_"), extension)
+
+    elif chunk["data_type"] == IMAGE_FILE:
+        # add the survey_id from the file path.
+        return "%s/%s/%s/%s/%s" % (
+            chunk["participant__patient_id"],
+            chunk["data_type"],
+            chunk["chunk_path"].rsplit("/", 3)[1],  # this is the survey id
+            chunk["chunk_path"].rsplit("/", 2)[1],  # this is the instance of the user taking a survey
+            chunk["chunk_path"].rsplit("/", 1)[1]
+        )
+
+    elif chunk["data_type"] == SURVEY_TIMINGS:
+        # add the survey_id from the database entry.
+        return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
+                                   chunk["survey__object_id"],  # this is the survey id
+                                   str(chunk["time_bin"]).replace(":", "_"), extension)
+
+    elif chunk["data_type"] == VOICE_RECORDING:
+        # Due to a bug that was not noticed until July 2016 audio surveys did not have the survey id
+        # that they were associated with.  Later versions of the app (legacy update 1 and Android 6)
+        # correct this.  We can identify those files by checking for the existence of the extra /.
+        # When we don't find it, we revert to original behavior.
+        if chunk["chunk_path"].count("/") == 4:  #
+            return "%s/%s/%s/%s.%s" % (chunk["participant__patient_id"], chunk["data_type"],
+                                       chunk["chunk_path"].rsplit("/", 2)[1],  # this is the survey id
+                                       str(chunk["time_bin"]).replace(":", "_"), extension)
+
+    # all other files have this form:
+    return "%s/%s/%s.%s" % (chunk['participant__patient_id'], chunk["data_type"],
+                            str(chunk["time_bin"]).replace(":", "_"), extension)
+
+
+#########################################################################################
+
+def get_period_start(time: datetime, period: str) -> datetime:
+    """ The start of the (UTC) day or month containing time. """
+    day = time.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.replace(day=1) if period == ExportBundle.MONTH else day
+
+
+def get_period_end(period_start: datetime, period: str) -> datetime:
+    if period == ExportBundle.DAY:
+        return period_start + timedelta(days=1)
+    return (period_start + timedelta(days=32)).replace(day=1)
+
+
+def query_export_bundles(study_id, user_ids=None, data_types=None, start=None, end=None) -> dict:
+    """ The bundles that could be spliced into a data download of the study's data with these
+    parameters (those of ChunkRegistry.get_chunks_time_range), keyed by (participant_id, data_type,
+    period, period_start). """
+    query = {"study_id": study_id, "deleted": False}
+    if user_ids:
+        query["participant__patient_id__in"] = user_ids
+    if data_types:
+        query["data_type__in"] = data_types
+    if start:
+        # a month bundle that starts before the time range can still cover the download's chunks.
+        query["period_start__gte"] = get_period_start(start, ExportBundle.MONTH)
+    if end:
+        query["period_start__lte"] = end
+    return {
+        (bundle.participant_id, bundle.data_type, bundle.period, bundle.period_start): bundle
+        for bundle in ExportBundle.objects.using(read_database()).filter(**query)
+            .select_related("study").defer("zip_entries")
+    }
+
+
+class BundleSplicer:
+    """ Splits the chunks of a data download (dictionaries of ChunkRegistry fields, including pk,
+    participant_id, data_type, time_bin and last_updated) into up to date bundles that contain whole
+    periods of them, each with its chunks, and the chunks that are not in such a bundle.  Month
+    bundles are used where possible, then day bundles.
+
+    Only the chunks of periods that have a bundle are held back, until every chunk has been seen
+    (a bundle is only used if it contains exactly the download's chunks of its period), the other
+    chunks are passed on as they arrive. """
+
+    def __init__(self, bundles: dict):
+        self.bundles = bundles
+        self.spliced = []  # (bundle, chunks) pairs, complete once filter's generator is exhausted.
+
+    def get_bundle(self, participant_id, data_type, period, period_start) -> ExportBundle:
+        return self.bundles.get((participant_id, data_type, period, period_start))
+
+    def filter(self, chunks: Iterable[dict]) -> Generator[dict, None, None]:
+        """ Yields the chunks that are not in a bundle, and records the bundles to splice. """
+        months = defaultdict(list)
+        for chunk in chunks:
+            month = get_period_start(chunk["time_bin"], ExportBundle.MONTH)
+            day = get_period_start(chunk["time_bin"], ExportBundle.DAY)
+            if (self.get_bundle(chunk["participant_id"], chunk["data_type"], ExportBundle.MONTH, month)
+                    or self.get_bundle(chunk["participant_id"], chunk["data_type"], ExportBundle.DAY, day)):
+                months[(chunk["participant_id"], chunk["data_type"], month)].append(chunk)
+            else:
+                yield chunk
+
+        for (participant_id, data_type, month), month_chunks in months.items():
+            bundle = self.get_bundle(participant_id, data_type, ExportBundle.MONTH, month)
+            if bundle is not None and bundle.covers(month_chunks):
+                self.spliced.append((bundle, month_chunks))
+                continue
+
+            days = defaultdict(list)
+            for chunk in month_chunks:
+                days[get_period_start(chunk["time_bin"], ExportBundle.DAY)].append(chunk)
+            for day, day_chunks in days.items():
+                bundle = self.get_bundle(participant_id, data_type, ExportBundle.DAY, day)
+                if bundle is not None and bundle.covers(day_chunks):
+                    self.spliced.append((bundle, day_chunks))
+                else:
+                    yield from day_chunks
+
+
+#########################################################################################
+
+def build_export_bundles(now: datetime = None):
+    """ Builds (or rebuilds, if they are stale) the bundles of the periods of the last
+    EXPORT_BUNDLE_LOOKBACK_DAYS that have been over for EXPORT_BUNDLE_DELAY_DAYS: whole months, and
+    the days of the month that is not over yet.  At most EXPORT_BUNDLES_PER_RUN bundles are built,
+    the rest are built by the next run.  Run daily. """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=EXPORT_BUNDLE_DELAY_DAYS)
+    month_cutoff = get_period_start(cutoff, ExportBundle.MONTH)
+    day_cutoff = get_period_start(cutoff, ExportBundle.DAY)
+
+    months_chunks = ChunkRegistry.objects.filter(time_bin__lt=month_cutoff)
+    if EXPORT_BUNDLE_LOOKBACK_DAYS:
+        lookback = get_period_start(now - timedelta(days=EXPORT_BUNDLE_LOOKBACK_DAYS), ExportBundle.MONTH)
+        months_chunks = months_chunks.filter(time_bin__gte=lookback)
+
+    # the days of the current month are the most recent.
+    days = build_stale_bundles(
+        ExportBundle.DAY, TruncDay,
+        ChunkRegistry.objects.filter(time_bin__gte=month_cutoff, time_bin__lt=day_cutoff),
+        EXPORT_BUNDLES_PER_RUN,
+    )
+    months = build_stale_bundles(ExportBundle.MONTH, TruncMonth, months_chunks, EXPORT_BUNDLES_PER_RUN - days)
+    print("built %s month and %s day export bundles." % (months, days))
+
+
+def build_stale_bundles(period: str, truncate, chunks, budget: int) -> int:
+    """ Builds the bundles of the periods of these chunks that have no bundle or a stale one, most
+    recent first, at most budget of them. """
+    if budget <= 0:
+        return 0
+
+    periods = chunks.annotate(period_start=truncate("time_bin", tzinfo=timezone.utc)).values(
+        "study__object_id", "participant_id", "participant__patient_id", "data_type", "period_start"
+    ).annotate(
+        chunk_count=Count("id"), chunks_last_updated=Max("last_updated")
+    ).filter(chunk_count__gte=EXPORT_BUNDLE_MIN_FILES).order_by("-period_start")
+
+    current = {
+        (participant_id, data_type, period_start): (chunk_count, chunks_last_updated)
+        for participant_id, data_type, period_start, chunk_count, chunks_last_updated in
+        ExportBundle.objects.filter(period=period).values_list(
+            "participant_id", "data_type", "period_start", "chunk_count", "chunks_last_updated"
+        )
+    }
+
+    built = 0
+    for row in periods.iterator():
+        if built >= budget:
+            print("built %s %s export bundles, the rest are left for the next run." % (built, period))
+            break
+        bundle = current.get((row["participant_id"], row["data_type"], row["period_start"]))
+        if bundle is not None and bundle[0] == row["chunk_count"] and bundle[1] >= row["chunks_last_updated"]:
+            continue
+        build_export_bundle(row["study__object_id"], row["participant_id"], row["participant__patient_id"],
+                            row["data_type"], period, row["period_start"])
+        built += 1
+    return built
+
+
+def build_export_bundle(study_object_id: str, participant_id: int, patient_id: str, data_type: str,
+                        period: str, period_start: datetime):
+    """ Builds and stores the bundle of one participant's files of one data stream in one period,
+    replacing any existing bundle. """
+    period_start = get_period_start(period_start, period)
+    chunks = list(ChunkRegistry.objects.filter(
+        participant_id=participant_id,
+        data_type=data_type,
+        time_bin__gte=period_start,
+        time_bin__lt=get_period_end(period_start, period),
+    ).order_by("time_bin", "chunk_path").values(*BUNDLE_CHUNK_FIELDS))
+    if not chunks:
+        return
+
+    bundle_path = "EXPORT_BUNDLES/%s/%s/%s/%s_%s_%s.zip" % (
+        study_object_id, patient_id, data_type, period, period_start.strftime("%Y-%m-%d"),
+        timezone.now().strftime("%Y%m%d%H%M%S%f")
+    )
+
+    with TemporaryFile() as bundle_file:
+        zip_file = ZipFile(bundle_file, mode="w", compression=ZIP_STORED, allowZip64=True)
+        file_names = set()
+        for chunk in chunks:
+            file_name = determine_file_name(chunk)
+            # as in data downloads, only the first file with a name is included.
+            if file_name in file_names:
+                continue
+            file_names.add(file_name)
+            zip_file.writestr(file_name, s3_retrieve(chunk["chunk_path"], study_object_id, raw_path=True))
+
+        # the bundle is everything before the central directory.
+        file_size = zip_file.start_dir
+        zip_entries = [zip_info_to_json(zip_info) for zip_info in zip_file.infolist()]
+        zip_file.close()
+
+        bundle_file.seek(0)
+        s3_upload_stream(bundle_path, read_blocks(bundle_file, file_size), study_object_id, raw_path=True)
+
+    old_bundle_path = ExportBundle.objects.filter(
+        participant_id=participant_id, data_type=data_type, period=period, period_start=period_start
+    ).values_list("bundle_path", flat=True).first()
+
+    ExportBundle.objects.update_or_create(
+        participant_id=participant_id,
+        data_type=data_type,
+        period=period,
+        period_start=period_start,
+        defaults=dict(
+            study_id=chunks[0]["study_id"],
+            bundle_path=bundle_path,
+            file_size=file_size,
+            chunk_count=len(chunks),
+            chunks_last_updated=max(chunk["last_updated"] for chunk in chunks),
+            chunk_ids=json.dumps([chunk["pk"] for chunk in chunks]),
+            zip_entries=json.dumps(zip_entries),
+            deleted=False,
+        ),
+    )
+    # bundles are derived data, the replaced one is deleted.
+    if old_bundle_path is not None:
+        storage_backend.delete(old_bundle_path)
+
+    # day bundles are superseded by the month bundle.
+    if period == ExportBundle.MONTH:
+        delete_export_bundles(ExportBundle.objects.filter(
+            participant_id=participant_id,
+            data_type=data_type,
+            period=ExportBundle.DAY,
+            period_start__gte=period_start,
+            period_start__lt=get_period_end(period_start, period),
+        ))
+
+
+def delete_export_bundles(bundles):
+    for bundle_path in list(bundles.values_list("bundle_path", flat=True)):
+        storage_backend.delete(bundle_path)
+    bundles.delete()
+
+
+def read_blocks(file, size: int):
+    """ Yields the first size bytes of file in blocks. """
+    while size > 0:
+        block = file.read(min(size, S3_STREAM_BLOCK_SIZE))
+        if not block:
+            raise ExportBundleError("unexpected end of export bundle file")
+        size -= len(block)
+        yield block
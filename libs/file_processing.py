@@ -4,7 +4,6 @@ import sys
 import traceback
 from collections import defaultdict, deque
 from datetime import datetime
-from multiprocessing.pool import ThreadPool
 from pprint import pprint
 from typing import DefaultDict, Generator, List, Tuple
 
@@ -18,10 +17,14 @@ from config.constants import (ACCELEROMETER, ANDROID_LOG_FILE, API_TIME_FORMAT,
     CHUNK_TIMESLICE_QUANTUM, CHUNKABLE_FILES, CHUNKS_FOLDER, CONCURRENT_NETWORK_OPS,
     DATA_PROCESSING_NO_ERROR_STRING, FILE_PROCESS_PAGE_SIZE, IDENTIFIERS, IOS_LOG_FILE,
     SURVEY_DATA_FILES, SURVEY_TIMINGS, UPLOAD_FILE_TYPE_MAPPING, WIFI)
-from database.data_access_models import ChunkRegistry, FileProcessLock, FileToProcess
+from database.data_access_models import ChunkRegistry, ChunkStats, FileProcessLock, FileToProcess
 from database.study_models import Survey
 from database.user_models import Participant
-from libs.s3 import s3_retrieve, s3_upload
+from libs.chunk_stats import get_chunk_stats
+from libs.communication_summaries import (COMMUNICATION_DATA_TYPES, new_unique_rows,
+    summarize_chunked_communications)
+from libs.db_connections import DatabaseThreadPool
+from libs.s3 import s3_retrieve, s3_upload_stream
 
 
 class EverythingWentFine(Exception): pass
@@ -106,7 +109,7 @@ def do_process_user_file_chunks(count: int, error_handler: ErrorHandler, skip_co
     ftps_to_remove = set()
     # The ThreadPool enables downloading multiple files simultaneously from the network, and continuing
     # to download files as other files are being processed, making the code as a whole run faster.
-    pool = ThreadPool(CONCURRENT_NETWORK_OPS)
+    pool = DatabaseThreadPool(CONCURRENT_NETWORK_OPS)
     survey_id_dict = {}
 
     # A Django query with a slice (e.g. .all()[x:y]) makes a LIMIT query, so it
@@ -199,6 +202,8 @@ def upload_binified_data(binified_data, error_handler, survey_id_dict):
     failed_ftps = set([])
     ftps_to_retire = set([])
     upload_these = []
+    # the new rows of call and text logs, summarized once they are uploaded.
+    communications = []
     for data_bin, (data_rows_deque, ftp_deque) in binified_data.items():
         with error_handler:
             try:
@@ -236,18 +241,30 @@ def upload_binified_data(binified_data, error_handler, survey_id_dict):
                                                       (old_header, updated_header, chunk_path) )
 
                     old_rows = [_ for _ in old_rows]
+                    if data_type in COMMUNICATION_DATA_TYPES:
+                        communications.append((time_bin, chunk_path, user_id, data_type, updated_header,
+                                               new_unique_rows(rows, old_rows)))
                     # This is O(1), which is why we use a deque (double-ended queue)
                     old_rows.extend(rows)
                     del rows
                     ensure_sorted_by_timestamp(old_rows)
                     new_contents = construct_csv_string(updated_header, old_rows)
+                    # duplicate rows are dropped from the file, its rows are counted by line.
+                    chunk_stats = get_chunk_stats(old_rows, new_contents.count(b"\n"))
                     del old_rows
 
-                    upload_these.append((chunk, chunk_path, codecs.encode(new_contents, "zip"), study_id))
+                    upload_these.append(
+                        (chunk, chunk_path, codecs.encode(new_contents, "zip"), study_id, chunk_stats)
+                    )
                     del new_contents
                 else:
                     ensure_sorted_by_timestamp(rows)
+                    if data_type in COMMUNICATION_DATA_TYPES:
+                        communications.append(
+                            (time_bin, chunk_path, user_id, data_type, updated_header, new_unique_rows(rows))
+                        )
                     new_contents = construct_csv_string(updated_header, rows)
+                    chunk_stats = get_chunk_stats(rows, new_contents.count(b"\n"))
                     if data_type in SURVEY_DATA_FILES:
                         # We need to keep a mapping of files to survey ids, that is handled here.
                         survey_id_hash = study_id, user_id, data_type, original_header
@@ -263,7 +280,9 @@ def upload_binified_data(binified_data, error_handler, survey_id_dict):
                         "survey_id": survey_id
                     }
 
-                    upload_these.append((chunk_params, chunk_path, codecs.encode(new_contents, "zip"), study_id))
+                    upload_these.append(
+                        (chunk_params, chunk_path, codecs.encode(new_contents, "zip"), study_id, chunk_stats)
+                    )
             except Exception as e:
                 # Here we catch any exceptions that may have arisen, as well as the ones that we raised
                 # ourselves (e.g. HeaderMismatchException). Whichever FTP we were processing when the
@@ -279,8 +298,13 @@ def upload_binified_data(binified_data, error_handler, survey_id_dict):
                 # retireable (i.e. completed) FTPs.
                 ftps_to_retire.update(ftp_deque)
 
-    pool = ThreadPool(CONCURRENT_NETWORK_OPS)
+    pool = DatabaseThreadPool(CONCURRENT_NETWORK_OPS)
     errors = pool.map(batch_upload, upload_these, chunksize=1)
+    summarize_chunked_communications(
+        communications,
+        {upload[1] for upload, err_ret in zip(upload_these, errors) if not err_ret['exception']},
+        error_handler,
+    )
     for err_ret in errors:
         if err_ret['exception']:
             print(err_ret['traceback'])
@@ -631,26 +655,33 @@ def batch_retrieve_for_processing(ftp_as_object: FileToProcess) -> dict:
     return ret
 
 
-def batch_upload(upload: Tuple[dict, str, bytes, str]):
+def batch_upload(upload: Tuple[dict, str, bytes, str, dict]):
     """ Used for mapping an s3_upload function.  the tuple is unpacked, can only have one parameter. """
     ret = {'exception': None, 'traceback': None}
     try:
-        if len(upload) != 4:
-            # upload should have length 4; this is for debugging if it doesn't
-            print("upload length not equal to 4: ",upload)
-        chunk, chunk_path, new_contents, study_object_id = upload
+        if len(upload) != 5:
+            # upload should have length 5; this is for debugging if it doesn't
+            print("upload length not equal to 5: ",upload)
+        chunk, chunk_path, new_contents, study_object_id, chunk_stats = upload
         del upload
 
         if "b'" in chunk_path:
             raise Exception(chunk_path)
 
-        s3_upload(chunk_path, codecs.decode(new_contents, "zip"), study_object_id, raw_path=True)
+        # large chunks (e.g. accelerometer) are uploaded as parallel multipart uploads.
+        plaintext = codecs.decode(new_contents, "zip")
+        # the size of the file as it is downloaded.
+        plaintext_size = len(plaintext)
+        s3_upload_stream(chunk_path, plaintext, study_object_id, raw_path=True)
+        del plaintext
         # print("data uploaded!", chunk_path)
 
         if isinstance(chunk, ChunkRegistry):
             # If the contents are being appended to an existing ChunkRegistry object
             chunk.file_size = len(new_contents)
+            chunk.plaintext_size = plaintext_size
             chunk.update_chunk_hash(new_contents)
+            ChunkStats.record(chunk.pk, chunk_stats)
 
         else:
             # If a new ChunkRegistry object is being created
@@ -661,7 +692,7 @@ def batch_upload(upload: Tuple[dict, str, bytes, str]):
             else:
                 survey_pk = None
 
-            ChunkRegistry.register_chunked_data(
+            chunk_registry = ChunkRegistry.register_chunked_data(
                 chunk['data_type'],
                 chunk['time_bin'],
                 chunk['chunk_path'],
@@ -669,7 +700,9 @@ def batch_upload(upload: Tuple[dict, str, bytes, str]):
                 study_pk,
                 participant_pk,
                 survey_pk,
+                plaintext_size=plaintext_size,
             )
+            ChunkStats.record(chunk_registry.pk, chunk_stats)
 
     # it broke. print stacktrace for debugging
     except Exception as e:
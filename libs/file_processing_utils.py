@@ -1,13 +1,13 @@
 from datetime import datetime
-from multiprocessing.pool import ThreadPool
 
 from config.constants import (
     CONCURRENT_NETWORK_OPS, CHUNKS_FOLDER, CHUNKABLE_FILES,
     PROCESSABLE_FILE_EXTENSIONS, data_stream_to_s3_file_name_string,
 )
+from libs.db_connections import DatabaseThreadPool
 from libs.file_processing import process_file_chunks
 from libs.s3 import s3_list_files, s3_delete, s3_upload
-from database.data_access_models import ChunkRegistry, FileProcessLock, FileToProcess
+from database.data_access_models import ChunkRegistry, DailyDataVolume, FileProcessLock, FileToProcess
 from database.study_models import Study
 from database.user_models import Participant
 
@@ -25,8 +25,9 @@ def reindex_all_files_to_process():
     FileToProcess.objects.all().delete()
     print('{!s} purging ChunkRegistry: {:d}'.format(datetime.now(), ChunkRegistry.objects.count()))
     ChunkRegistry.objects.all().delete()
+    DailyDataVolume.objects.all().delete()
     
-    pool = ThreadPool(CONCURRENT_NETWORK_OPS * 2)
+    pool = DatabaseThreadPool(CONCURRENT_NETWORK_OPS * 2)
     
     # Delete all preexisting chunked data files
     CHUNKED_DATA = s3_list_files(CHUNKS_FOLDER)
@@ -74,8 +75,9 @@ def reindex_specific_data_type(data_type):
     # Delete the old ChunkRegistry objects
     print("purging old data...")
     relevant_chunks.delete()
+    DailyDataVolume.objects.filter(data_type=data_type).delete()
 
-    pool = ThreadPool(20)
+    pool = DatabaseThreadPool(20)
     pool.map(s3_delete, relevant_indexed_files)
 
     print("pulling files to process...")
@@ -187,7 +189,8 @@ def completely_purge_study(study_id, actually_delete=False):
     else:
         device_settings.delete()
         surveys.delete()
-        participants.delete()
         chunks.delete()
+        study.daily_data_volumes.all().delete()
+        participants.delete()
         files_to_process.delete()
         study.delete()
@@ -0,0 +1,91 @@
+from typing import Optional, Tuple
+
+import numpy
+
+from libs.resampling import parse_column, parse_table, split_rows
+
+# Daily mobility features of GPS data, computed with numpy (see libs.gps_summaries):
+#   DistTravelled_km: the distance between consecutive points, in total.
+#   RoG_km: the radius of gyration, the root mean square distance of the points from their centroid.
+#   MaxDiam_km: the largest distance between any two points.
+#   Hometime_hrs: the time spent within HOME_RADIUS_KM of home, the place where the most time was
+#       spent that day.  The time spent at a point is the time until the next point, at most
+#       MAX_DWELL_SECONDS (phones record GPS in bursts).
+
+EARTH_RADIUS_KM = 6371.0088
+# points less accurate than this are dropped.
+MAX_ACCURACY_METERS = 100
+MAX_DWELL_SECONDS = 60 * 60
+# places are clustered into cells of this many degrees of latitude and longitude (about 200
+# meters), home is the cell where the most time was spent.
+HOME_CELL_DEGREES = 0.002
+HOME_RADIUS_KM = 0.2
+# points are merged into cells of this many degrees (about 100 meters) to find the diameter.
+DIAMETER_CELL_DEGREES = 0.001
+
+
+def parse_gps_points(contents: bytes) -> Optional[Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]]:
+    """ The timestamps (in seconds), latitudes and longitudes of the accurate points of a chunked
+    GPS file, None if there are none. """
+    header, rows = split_rows(contents)
+    names = header.split(b",")
+    if not {b"timestamp", b"latitude", b"longitude"}.issubset(names):
+        return None
+    table = parse_table(rows, len(names))
+    if table is None:
+        return None
+
+    timestamps, latitudes, longitudes = (
+        parse_column(table[:, names.index(name)]) for name in (b"timestamp", b"latitude", b"longitude")
+    )
+    if timestamps is None or latitudes is None or longitudes is None:
+        return None
+    keep = ~(numpy.isnan(timestamps) | numpy.isnan(latitudes) | numpy.isnan(longitudes))
+    if b"accuracy" in names:
+        accuracies = parse_column(table[:, names.index(b"accuracy")])
+        if accuracies is not None:
+            keep &= ~(accuracies > MAX_ACCURACY_METERS)
+    if not keep.any():
+        return None
+    return timestamps[keep] / 1000, latitudes[keep], longitudes[keep]
+
+
+def haversine_km(latitudes_1, longitudes_1, latitudes_2, longitudes_2) -> numpy.ndarray:
+    latitudes_1, longitudes_1, latitudes_2, longitudes_2 = (
+        numpy.radians(degrees) for degrees in (latitudes_1, longitudes_1, latitudes_2, longitudes_2)
+    )
+    a = (numpy.sin((latitudes_2 - latitudes_1) / 2) ** 2 +
+         numpy.cos(latitudes_1) * numpy.cos(latitudes_2) * numpy.sin((longitudes_2 - longitudes_1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+
+def compute_gps_features(timestamps: numpy.ndarray, latitudes: numpy.ndarray, longitudes: numpy.ndarray) -> dict:
+    """ The daily mobility features of a day's points, by data stream. """
+    order = numpy.argsort(timestamps, kind="stable")
+    timestamps, latitudes, longitudes = timestamps[order], latitudes[order], longitudes[order]
+
+    distance = haversine_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]).sum()
+    from_centroid = haversine_km(latitudes, longitudes, latitudes.mean(), longitudes.mean())
+    radius_of_gyration = numpy.sqrt(numpy.mean(from_centroid ** 2))
+
+    # every pair of cells is compared, a day has a few thousand at most.
+    cells = numpy.unique(
+        numpy.round(numpy.column_stack((latitudes, longitudes)) / DIAMETER_CELL_DEGREES), axis=0
+    ) * DIAMETER_CELL_DEGREES
+    diameter = max(haversine_km(latitude, longitude, cells[:, 0], cells[:, 1]).max() for latitude, longitude in cells)
+
+    dwell = numpy.append(numpy.minimum(numpy.diff(timestamps), MAX_DWELL_SECONDS), 0)
+    _, cell_of_point = numpy.unique(
+        numpy.round(numpy.column_stack((latitudes, longitudes)) / HOME_CELL_DEGREES), axis=0, return_inverse=True
+    )
+    cell_of_point = cell_of_point.reshape(-1)
+    at_home_cell = cell_of_point == numpy.argmax(numpy.bincount(cell_of_point, weights=dwell))
+    from_home = haversine_km(latitudes, longitudes, latitudes[at_home_cell].mean(), longitudes[at_home_cell].mean())
+    home_time = dwell[from_home <= HOME_RADIUS_KM].sum() / 3600
+
+    return {
+        "Hometime_hrs": float(home_time),
+        "DistTravelled_km": float(distance),
+        "RoG_km": float(radius_of_gyration),
+        "MaxDiam_km": float(diameter),
+    }
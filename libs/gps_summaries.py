@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import numpy
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from config.constants import GPS, GPS_SUMMARY_DAYS_PER_RUN, GPS_SUMMARY_LOOKBACK_DAYS, GPS_SUMMARY_STREAMS
+from database.data_access_models import ChunkRegistry, PipelineSummaryValue, SummarizedDay
+from database.user_models import Participant
+from libs.gps_features import compute_gps_features, parse_gps_points
+from libs.s3 import s3_retrieve
+
+# The daily GPS mobility features (GPS_SUMMARY_STREAMS, see libs.gps_features) of each participant
+# of the studies with server_summaries turned on, computed on the server from the chunked GPS files and stored as PipelineSummaryValues.  A day is
+# summarized once it is over and its files have not changed for GPS_SUMMARY_DELAY, and again
+# whenever its files change (e.g. when a phone uploads old data), see SummarizedDay.  Only the
+# changed days' files are retrieved.
+
+GPS_SUMMARY_DELAY = timedelta(hours=6)
+
+
+def day_start(date) -> datetime:
+    return timezone.make_aware(datetime.combine(date, datetime.min.time()), timezone.utc)
+
+
+def build_gps_summaries(now: datetime = None):
+    """ Summarizes the new and changed days of GPS data of the last
+    GPS_SUMMARY_LOOKBACK_DAYS of the participants of studies with server_summaries turned on.  At
+    most GPS_SUMMARY_DAYS_PER_RUN days are summarized, most recent
+    first, the rest are summarized by the next run.  Run daily. """
+    now = now or timezone.now()
+    cutoff = now - GPS_SUMMARY_DELAY
+    since = (now - timedelta(days=GPS_SUMMARY_LOOKBACK_DAYS)).date() if GPS_SUMMARY_LOOKBACK_DAYS else None
+
+    days = []
+    participants = Participant.objects.filter(study__server_summaries=True).values_list(
+        "pk", "study_id", "study__object_id"
+    )
+    for participant_id, study_id, study_object_id in participants:
+        for date, chunks_last_updated in get_unsummarized_days(participant_id, study_id, cutoff, since):
+            days.append((date, participant_id, study_id, study_object_id, chunks_last_updated))
+    days.sort(key=lambda day: day[0], reverse=True)
+
+    for date, participant_id, study_id, study_object_id, chunks_last_updated in days[:GPS_SUMMARY_DAYS_PER_RUN]:
+        summarize_gps_day(participant_id, study_id, study_object_id, date, chunks_last_updated)
+    print("summarized %s of %s days of GPS data." % (min(len(days), GPS_SUMMARY_DAYS_PER_RUN), len(days)))
+
+
+def get_unsummarized_days(participant_id, study_id, cutoff: datetime, since=None):
+    """ The days (and the most recent last_updated of their chunks) of a participant's GPS data that
+    have not been summarized since their chunks were last updated, of the days that were over, and
+    whose chunks had not been updated, at the cutoff (and, if there is one, from the date since). """
+    chunks = ChunkRegistry.objects.filter(
+        study_id=study_id, participant_id=participant_id, data_type=GPS, time_bin__lt=day_start(cutoff.date())
+    )
+    if since is not None:
+        chunks = chunks.filter(time_bin__gte=day_start(since))
+    days = chunks.annotate(date=TruncDate("time_bin")).values("date").annotate(
+        chunks_last_updated=Max("last_updated")
+    ).order_by().values_list("date", "chunks_last_updated")
+    summarized_days = dict(
+        SummarizedDay.objects.filter(participant_id=participant_id, data_type=GPS)
+            .values_list("date", "chunks_last_updated")
+    )
+    return sorted(
+        (date, chunks_last_updated) for date, chunks_last_updated in days
+        if chunks_last_updated <= cutoff and (
+            date not in summarized_days or summarized_days[date] < chunks_last_updated
+        )
+    )
+
+
+def summarize_gps_day(participant_id, study_id, study_object_id, date, chunks_last_updated: datetime):
+    """ Computes the GPS features of a participant's day, replacing the day's values. """
+    chunk_paths = ChunkRegistry.objects.filter(
+        study_id=study_id,
+        participant_id=participant_id,
+        data_type=GPS,
+        time_bin__gte=day_start(date),
+        time_bin__lt=day_start(date + timedelta(days=1)),
+    ).values_list("chunk_path", flat=True)
+
+    points = [parse_gps_points(s3_retrieve(chunk_path, study_object_id, raw_path=True)) for chunk_path in chunk_paths]
+    points = [chunk_points for chunk_points in points if chunk_points is not None]
+    if points:
+        values = compute_gps_features(*(numpy.concatenate(column) for column in zip(*points)))
+    else:
+        values = {}
+
+    PipelineSummaryValue.replace_day_values(study_id, participant_id, date, GPS_SUMMARY_STREAMS, values)
+    SummarizedDay.objects.update_or_create(
+        participant_id=participant_id,
+        data_type=GPS,
+        date=date,
+        defaults={"chunks_last_updated": chunks_last_updated},
+    )
@@ -1,5 +1,7 @@
 from flask import json
-from libs.s3 import s3_list_files, s3_retrieve
+
+from database.data_access_models import SurveyAnswerFile, SurveyResultsCache
+from libs.s3 import s3_retrieve
 
 
 ################################ CSV HANDLER ###################################
@@ -25,7 +27,8 @@ def csv_to_dict(csv_string):
 ################################################################################
 
 def grab_file_names(study_id, survey_id, user_id, number_points):
-    """ Takes a list, returns a list of those most recent files."""
+    """ Returns the paths (without the study folder) of the most recent survey answers files of a
+    participant, see SurveyAnswerFile. """
     # this is correct - we want to convert these values to strings, not coerce them, that causes them
     # to be converted to strings with a preceeding b and in single quotes.
 
@@ -34,8 +37,11 @@ def grab_file_names(study_id, survey_id, user_id, number_points):
     user_id = user_id if not isinstance(user_id, bytes) else user_id.decode()
     number_points = number_points if not isinstance(number_points, bytes) else number_points.decode()
 
-    all_files = s3_list_files("%s/%s/surveyAnswers/%s" % (str(study_id), str(user_id), str(survey_id)))
-    return sorted(all_files[-number_points:])
+    # the most recent files sort last, as they do in a listing of the files on S3.
+    most_recent_files = SurveyAnswerFile.objects.filter(
+        participant__patient_id=str(user_id), survey_object_id=str(survey_id)
+    ).order_by("-file_path").values_list("file_path", flat=True)[:int(number_points)]
+    return sorted(most_recent_files)
 
 
 def compile_question_data(surveys):
@@ -73,9 +79,7 @@ def get_survey_results(study_id, user_id, survey_id, number_points=7):
     # Get files from s3 for user answers, convert each csv_file to a list of dicts,
     # pull the questions and corresponding answers.
     files = grab_file_names(study_id, survey_id, user_id, number_points)
-    # note: we need to remove the prepended study id from file name strings,
-    # that string is always 24 characters + the slash.
-    surveys = [csv_to_dict(s3_retrieve(file_name[25:], study_id)) for file_name in files]
+    surveys = [csv_to_dict(s3_retrieve(file_name, study_id)) for file_name in files]
     all_questions = compile_question_data(surveys)
     all_answers = pull_answers(surveys, all_questions)
     # all answers may be identical to all questions at this point.
@@ -88,6 +92,31 @@ def get_survey_results(study_id, user_id, survey_id, number_points=7):
     return jsonify_survey_results(result)
 
 
+def get_participant_survey_results(participant, survey_object_ids, number_points=7):
+    """ The results of get_survey_results for each of the surveys, from the participant's
+    SurveyResultsCaches where there are any (they are cleared when new answers are uploaded). """
+    cached_results = dict(
+        SurveyResultsCache.objects.filter(participant=participant, number_points=number_points)
+            .values_list("survey_object_id", "results")
+    )
+    data = []
+    for survey_object_id in survey_object_ids:
+        if survey_object_id in cached_results:
+            data.append(json.loads(cached_results[survey_object_id]))
+            continue
+        results = get_survey_results(
+            participant.study.object_id, participant.patient_id, survey_object_id, number_points
+        )
+        SurveyResultsCache.objects.update_or_create(
+            participant=participant,
+            survey_object_id=survey_object_id,
+            number_points=number_points,
+            defaults={"results": json.dumps(results)},
+        )
+        data.append(results)
+    return data
+
+
 def jsonify_survey_results(results):
     """ Transforms output of get_survey_results into a list that javascript can actually handle. """
     return_data = []
@@ -0,0 +1,61 @@
+import re
+
+from database.user_models import Participant
+
+# The participant list of the study page, read a page at a time (by the table on the page, see
+# admin.js) instead of rendering every participant of large studies into the page.
+
+# the sortable columns of the list, and the fields they are sorted by.
+SORT_COLUMNS = {
+    "patient_id": "patient_id",
+    # unregistered participants have an empty device id, they sort first.
+    "phone_registered": "device_id",
+    "os_type": "os_type",
+}
+MAX_PAGE_LENGTH = 100
+
+PATIENT_ID_PREFIX = re.compile("^[1-9a-z]*$")
+
+
+def get_participant_page(study_id, search: str = "", sort_column: str = "patient_id",
+                         descending: bool = False, start: int = 0, length: int = 25):
+    """ Returns the number of participants in the study, the number of them whose patient ids
+    start with search, and a list of (up to length) of those participants' rows, starting at
+    start, see participant_row. """
+    participants = Participant.objects.filter(study_id=study_id)
+    total = participants.count()
+
+    search = search.strip().lower()
+    if not PATIENT_ID_PREFIX.match(search):
+        # patient ids only contain 1-9 and a-z.
+        return total, 0, []
+    if search:
+        # a range of the (study, patient_id) index, where a LIKE prefix query could not use it.
+        max_length = Participant._meta.get_field("patient_id").max_length
+        participants = participants.filter(
+            patient_id__gte=search, patient_id__lte=search + "z" * (max_length - len(search))
+        )
+    filtered = participants.count() if search else total
+
+    order = SORT_COLUMNS.get(sort_column, "patient_id")
+    ordering = [("-" if descending else "") + order]
+    if order != "patient_id":
+        ordering.append("patient_id")
+    start = max(start, 0)
+    # (DataTables asks for a length of -1 for all the rows.)
+    length = MAX_PAGE_LENGTH if length <= 0 else min(length, MAX_PAGE_LENGTH)
+    page = participants.order_by(*ordering).prefetch_related("field_values__field")[start:start + length]
+    return total, filtered, [participant_row(participant) for participant in page]
+
+
+def participant_row(participant: Participant) -> dict:
+    return {
+        "id": participant.pk,
+        "patient_id": participant.patient_id,
+        "phone_registered": bool(participant.device_id),
+        "os_type": participant.os_type,
+        "fields": {
+            field_value.field.field_name: field_value.value for field_value in participant.field_values.all()
+        },
+    }
+
@@ -0,0 +1,88 @@
+import heapq
+from itertools import count
+from queue import Queue
+from time import perf_counter
+from typing import Callable, Iterable
+
+from libs.db_connections import DatabaseThreadPool
+
+
+class BudgetedPrefetcher:
+    """
+    Retrieves items on a thread pool ahead of the consumer, keeping at most byte_budget bytes
+    (according to size_of) retrieved-or-being-retrieved and not yet consumed.
+
+    Items are retrieved smallest first (of the next sort_window items, so that items can be a lazily
+    paged query), so a download of many small files runs with up to max_concurrency retrievals at
+    once (latency bound) while large files are retrieved a few at a time (memory bound).  An item larger than the whole budget is retrieved on its own.  Results are
+    yielded in completion order, an item's bytes are released when the consumer asks for the next
+    result.
+    """
+
+    def __init__(self, fetch: Callable, items: Iterable, size_of: Callable[..., int],
+                 byte_budget: int, max_concurrency: int, sort_window: int = 1000):
+        self.fetch = fetch
+        self.size_of = size_of
+        self.byte_budget = byte_budget
+        self.max_concurrency = max_concurrency
+        self.items = iter(items)
+        self.sort_window = sort_window
+        self.window = []  # a heap of (size, sequence number, item), the sequence number breaks ties.
+        self.sequence = count()
+        self.pool = DatabaseThreadPool(max_concurrency)
+
+        self.files = 0
+        self.bytes = 0
+        self.peak_concurrency = 0
+        self.start_time = None
+        self.end_time = None
+
+    def __iter__(self):
+        results = Queue()
+        in_flight = 0
+        in_flight_bytes = 0
+        self.start_time = perf_counter()
+
+        self.fill_window()
+        while self.window or in_flight:
+            while self.window and in_flight < self.max_concurrency and (
+                    in_flight == 0 or in_flight_bytes + self.window[0][0] <= self.byte_budget):
+                size, _, item = heapq.heappop(self.window)
+                self.fill_window()
+                in_flight += 1
+                in_flight_bytes += size
+                self.pool.apply_async(
+                    self.fetch, (item,),
+                    callback=lambda result, size=size: results.put((size, result, None)),
+                    error_callback=lambda error, size=size: results.put((size, None, error)),
+                )
+            self.peak_concurrency = max(self.peak_concurrency, in_flight)
+
+            size, result, error = results.get()
+            if error is not None:
+                raise error
+            yield result
+            in_flight -= 1
+            in_flight_bytes -= size
+            self.files += 1
+            self.bytes += size
+
+        self.end_time = perf_counter()
+
+    def fill_window(self):
+        for item in self.items:
+            heapq.heappush(self.window, (self.size_of(item), next(self.sequence), item))
+            if len(self.window) >= self.sort_window:
+                return
+
+    def close(self):
+        self.pool.close()
+        self.pool.terminate()
+
+    @property
+    def throughput_report(self) -> str:
+        duration = (self.end_time or perf_counter()) - (self.start_time or perf_counter())
+        megabytes = self.bytes / 1024 / 1024
+        return "retrieved %s files, %.1fMB in %.1f seconds (%.2fMB/s), peak concurrency %s" % (
+            self.files, megabytes, duration, megabytes / duration if duration else 0, self.peak_concurrency
+        )
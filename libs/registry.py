@@ -0,0 +1,186 @@
+import struct
+import sys
+import zlib
+from array import array
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from os.path import commonprefix
+from typing import Dict, Iterable, Iterator, Tuple
+
+# A data download registry is the set of (chunk_path, chunk_hash) pairs of the files a client already
+# has, the server only sends files that are not in it (or whose hash has changed).
+#
+# Registries come in two formats, JSON (a dictionary of chunk_path: chunk_hash, as returned in the
+# "registry" file of a /get-data/v1 zip), and a compact binary format.  The binary format is the
+# pairs sorted by chunk_path with each path stored as the length of the prefix it shares with the
+# previous path plus the rest of the path, and hashes stored as raw md5 digests.  Chunk paths share
+# long prefixes (study/participant/data stream/) so this is much smaller, and it decodes directly to
+# sorted pairs.  The fields are stored in columns, so that the lengths can be read as arrays:
+#   b"BRG1", then zlib compressed:
+#   uint32 number of entries
+#   uint16 shared prefix length, for each entry
+#   uint16 path suffix length, for each entry
+#   uint8 hash type, for each entry: 1 for an md5 digest, 0 for any other hash (stored as text)
+#   the path suffixes (utf-8)
+#   the md5 digests, 16 bytes each, of entries with hash type 1
+#   uint16 text hash length, for each entry with hash type 0
+#   the text hashes
+# All integers are little endian.
+#
+# Both formats are diffed against the database by merging against the chunks ordered by chunk_path,
+# which avoids sending the registry to the database in enormous IN clauses.
+
+BINARY_REGISTRY_MAGIC = b"BRG1"
+_TEXT_HASH = 0
+_MD5_HASH = 1
+
+
+class InvalidRegistryError(Exception): pass
+
+
+def _uint16_array(values=()) -> array:
+    return array("H", values)
+
+
+def _little_endian(uint16s: array) -> bytes:
+    if sys.byteorder == "big":
+        uint16s = array("H", uint16s)
+        uint16s.byteswap()
+    return uint16s.tobytes()
+
+
+def _read_uint16s(data: bytes, position: int, count: int) -> Tuple[array, int]:
+    end = position + 2 * count
+    if end > len(data):
+        raise InvalidRegistryError("truncated registry")
+    uint16s = array("H")
+    uint16s.frombytes(data[position:end])
+    if sys.byteorder == "big":
+        uint16s.byteswap()
+    return uint16s, end
+
+
+def encode_registry(registry: Dict[str, str]) -> bytes:
+    """ Encodes a registry dictionary in the binary format. """
+    shared_lengths, suffix_lengths, text_hash_lengths = _uint16_array(), _uint16_array(), _uint16_array()
+    hash_types, suffixes, digests, text_hashes = bytearray(), bytearray(), bytearray(), bytearray()
+
+    previous_path = b""
+    items = sorted((path.encode(), chunk_hash) for path, chunk_hash in registry.items())
+    for path, chunk_hash in items:
+        shared = len(commonprefix([previous_path, path]))
+        shared_lengths.append(shared)
+        suffix_lengths.append(len(path) - shared)
+        suffixes += path[shared:]
+        previous_path = path
+
+        digest = _md5_digest(chunk_hash)
+        if digest is not None:
+            hash_types.append(_MD5_HASH)
+            digests += digest
+        else:
+            encoded_hash = chunk_hash.encode()
+            hash_types.append(_TEXT_HASH)
+            text_hash_lengths.append(len(encoded_hash))
+            text_hashes += encoded_hash
+
+    body = b"".join([
+        struct.pack("<I", len(items)),
+        _little_endian(shared_lengths),
+        _little_endian(suffix_lengths),
+        hash_types,
+        suffixes,
+        digests,
+        _little_endian(text_hash_lengths),
+        text_hashes,
+    ])
+    return BINARY_REGISTRY_MAGIC + zlib.compress(body, 6)
+
+
+def _md5_digest(chunk_hash: str):
+    """ Chunk hashes are base64 encoded md5 digests, those are stored as the 16 byte digest. """
+    if len(chunk_hash) != 24:
+        return None
+    try:
+        digest = b64decode(chunk_hash, validate=True)
+    except (BinasciiError, ValueError):
+        return None
+    # only if it round trips exactly.
+    return digest if len(digest) == 16 and b64encode(digest).decode() == chunk_hash else None
+
+
+def decode_registry(data: bytes) -> Iterator[Tuple[str, str]]:
+    """ Returns an iterator of the (chunk_path, chunk_hash) pairs of a binary registry, in
+    chunk_path order.  Raises InvalidRegistryError if the registry is corrupt. """
+    if not data.startswith(BINARY_REGISTRY_MAGIC):
+        raise InvalidRegistryError("not a binary registry")
+    try:
+        data = zlib.decompress(data[len(BINARY_REGISTRY_MAGIC):])
+    except zlib.error as e:
+        raise InvalidRegistryError(str(e))
+    if len(data) < 4:
+        raise InvalidRegistryError("truncated registry")
+
+    count, = struct.unpack_from("<I", data)
+    shared_lengths, position = _read_uint16s(data, 4, count)
+    suffix_lengths, position = _read_uint16s(data, position, count)
+    hash_types = data[position:position + count]
+    position += count
+    suffixes = data[position:position + sum(suffix_lengths)]
+    position += len(suffixes)
+    md5_count = hash_types.count(_MD5_HASH)
+    digests = data[position:position + 16 * md5_count]
+    position += len(digests)
+    text_hash_lengths, position = _read_uint16s(data, position, count - md5_count)
+    text_hashes = data[position:]
+
+    if (len(hash_types) != count or len(suffixes) != sum(suffix_lengths) or
+            len(digests) != 16 * md5_count or len(text_hashes) != sum(text_hash_lengths)):
+        raise InvalidRegistryError("truncated registry")
+    return _decode_entries(shared_lengths, suffix_lengths, hash_types, suffixes, digests,
+                           text_hash_lengths, text_hashes)
+
+
+def _decode_entries(shared_lengths, suffix_lengths, hash_types, suffixes, digests, text_hash_lengths,
+                    text_hashes) -> Iterator[Tuple[str, str]]:
+    previous_path = b""
+    suffix_position = digest_position = text_hash_index = text_hash_position = 0
+    for shared, suffix_length, hash_type in zip(shared_lengths, suffix_lengths, hash_types):
+        path = previous_path[:shared] + suffixes[suffix_position:suffix_position + suffix_length]
+        suffix_position += suffix_length
+        previous_path = path
+
+        if hash_type == _MD5_HASH:
+            chunk_hash = b64encode(digests[digest_position:digest_position + 16])
+            digest_position += 16
+        else:
+            length = text_hash_lengths[text_hash_index]
+            chunk_hash = text_hashes[text_hash_position:text_hash_position + length]
+            text_hash_index += 1
+            text_hash_position += length
+
+        try:
+            entry = path.decode(), chunk_hash.decode()
+        except UnicodeDecodeError as e:
+            raise InvalidRegistryError(str(e))
+        yield entry
+
+
+def sorted_registry_items(registry: Dict[str, str]) -> Iterator[Tuple[str, str]]:
+    """ The (chunk_path, chunk_hash) pairs of a JSON registry, in chunk_path order. """
+    return iter(sorted(registry.items()))
+
+
+def unregistered_chunks(chunks: Iterable[dict], registry_items: Iterable[Tuple[str, str]]) -> Iterator[dict]:
+    """ Yields the chunks that are not in the registry or have a different hash.  Both the chunks
+    and the registry items must be in chunk_path order (in code point order, see
+    ChunkRegistry.order_by_chunk_path). """
+    registry_items = iter(registry_items)
+    registered = next(registry_items, None)
+    for chunk in chunks:
+        chunk_path = chunk["chunk_path"]
+        while registered is not None and registered[0] < chunk_path:
+            registered = next(registry_items, None)
+        if registered is not None and registered[0] == chunk_path and registered[1] == chunk["chunk_hash"]:
+            continue
+        yield chunk
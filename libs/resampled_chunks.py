@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from config.constants import (RESAMPLABLE_FILES, RESAMPLE_CACHE_LOOKBACK_DAYS, RESAMPLE_CACHED_WINDOWS,
+    RESAMPLED_CHUNKS_PER_RUN)
+from database.data_access_models import ChunkRegistry, ResampledChunk
+from database.routers import read_database
+from libs.resampling import AGGREGATE, Resample, resample_csv
+from libs.s3 import s3_retrieve, s3_upload
+
+# Cached resamplings of the files of high frequency data streams (see ResampledChunk), so that
+# data downloads with the common resample windows (RESAMPLE_CACHED_WINDOWS) retrieve a small file
+# instead of retrieving and resampling a large one.  Only aggregate resamplings are cached,
+# decimating a file is not much more work than retrieving it.
+
+# chunks are cached once they have not been updated for this long, chunks of the current day are
+# still being uploaded.
+RESAMPLE_CACHE_DELAY = timedelta(days=1)
+
+
+def cached_resamples():
+    return [Resample(window, AGGREGATE) for window in RESAMPLE_CACHED_WINDOWS]
+
+
+def get_resampled_path(chunk_path: str, resample: Resample) -> str:
+    # chunk paths start with the chunks folder, which is replaced.
+    return "RESAMPLED_DATA/%s/%s_%s.csv" % (chunk_path.split("/", 1)[1], resample.method, resample.window)
+
+
+def retrieve_resampled(chunk: dict, study_object_id: str, resample: Resample) -> bytes:
+    """ The resampled file of a chunk (a dictionary of ChunkRegistry fields, including pk,
+    chunk_path and last_updated), from the cache if there is an up to date cached resampling. """
+    if resample in cached_resamples():
+        resampled_path = ResampledChunk.objects.using(read_database()).filter(
+            chunk_id=chunk["pk"],
+            window=resample.window,
+            method=resample.method,
+            chunk_last_updated__gte=chunk["last_updated"],
+            deleted=False,
+        ).values_list("resampled_path", flat=True).first()
+        if resampled_path is not None:
+            return s3_retrieve(resampled_path, study_object_id, raw_path=True)
+    return resample_csv(s3_retrieve(chunk["chunk_path"], study_object_id, raw_path=True), resample)
+
+
+def build_resampled_chunks(now: datetime = None):
+    """ Builds (or rebuilds, if they are stale) the cached resamplings of the files of the last
+    RESAMPLE_CACHE_LOOKBACK_DAYS of high frequency data streams.  At most RESAMPLED_CHUNKS_PER_RUN
+    files are resampled, most recent first, the rest are resampled by the next run.  Run daily. """
+    resamples = cached_resamples()
+    if not resamples:
+        return
+
+    now = now or timezone.now()
+    chunks = ChunkRegistry.objects.filter(data_type__in=RESAMPLABLE_FILES, last_updated__lt=now - RESAMPLE_CACHE_DELAY)
+    if RESAMPLE_CACHE_LOOKBACK_DAYS:
+        chunks = chunks.filter(time_bin__gte=now - timedelta(days=RESAMPLE_CACHE_LOOKBACK_DAYS))
+    stale = Q()
+    for i, resample in enumerate(resamples):
+        chunks = chunks.annotate(**{"cached_%s" % i: Exists(ResampledChunk.objects.filter(
+            chunk_id=OuterRef("pk"),
+            window=resample.window,
+            method=resample.method,
+            chunk_last_updated__gte=OuterRef("last_updated"),
+        ))})
+        stale |= Q(**{"cached_%s" % i: False})
+
+    built = 0
+    chunks = chunks.filter(stale).order_by("-time_bin").values("pk", "chunk_path", "last_updated", "study__object_id")
+    for chunk in chunks[:RESAMPLED_CHUNKS_PER_RUN].iterator():
+        build_resampled_chunk(chunk, resamples)
+        built += 1
+    print("built resampled files for %s chunks." % built)
+
+
+def build_resampled_chunk(chunk: dict, resamples):
+    """ Resamples one chunk's file at every resample window, replacing the cached resamplings. """
+    study_object_id = chunk["study__object_id"]
+    contents = s3_retrieve(chunk["chunk_path"], study_object_id, raw_path=True)
+    for resample in resamples:
+        resampled_path = get_resampled_path(chunk["chunk_path"], resample)
+        s3_upload(resampled_path, resample_csv(contents, resample), study_object_id, raw_path=True)
+        ResampledChunk.objects.update_or_create(
+            chunk_id=chunk["pk"],
+            window=resample.window,
+            method=resample.method,
+            defaults=dict(
+                resampled_path=resampled_path,
+                chunk_last_updated=chunk["last_updated"],
+                deleted=False,
+            ),
+        )
@@ -0,0 +1,156 @@
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy
+
+from config.constants import CHUNK_TIMESLICE_QUANTUM
+
+# Resampling of the csv files of high frequency data streams (accelerometer, gyro, etc.) into
+# fixed windows of time.  Windows evenly divide the hour covered by a chunk, so each chunk is
+# resampled on its own and files can be resampled one at a time as they are downloaded.
+#
+# Rows are parsed into numpy arrays, and either aggregated (the count of rows, and the mean,
+# standard deviation, minimum and maximum of every numeric column, per window) or decimated (the
+# first row of each window, unchanged).
+
+AGGREGATE = "aggregate"
+DECIMATE = "decimate"
+RESAMPLE_METHODS = (AGGREGATE, DECIMATE)
+
+# window is the length of the windows in milliseconds, method is AGGREGATE or DECIMATE.
+Resample = namedtuple("Resample", ["window", "method"])
+
+AGGREGATE_STATISTICS = (b"mean", b"std", b"min", b"max")
+# the columns that are not aggregated, the window start is written in their place.
+TIME_COLUMNS = (b"timestamp", b"UTC time")
+
+class ResampleError(Exception): pass
+
+
+def validate_resample(resample: Resample):
+    """ Raises a ResampleError if the window does not evenly divide an hour. """
+    if resample.method not in RESAMPLE_METHODS:
+        raise ResampleError("unknown resample method: %s" % resample.method)
+    if resample.window <= 0 or (CHUNK_TIMESLICE_QUANTUM * 1000) % resample.window != 0:
+        raise ResampleError("resample windows must evenly divide an hour, not %s ms" % resample.window)
+
+
+def resample_csv(contents: bytes, resample: Resample) -> bytes:
+    """ Resamples a csv file (a header line followed by rows sorted by their first column, a unix
+    millisecond timestamp).  The result's first two columns are the start of each window (as a
+    timestamp and as a UTC time). """
+    header, rows = split_rows(contents)
+    if resample.method == DECIMATE:
+        if not rows:
+            return header
+        starts, _ = window_starts(parse_timestamps(rows), resample.window)
+        return header + b"\n" + b"\n".join([rows[i] for i in starts])
+
+    names = header.split(b",")
+    value_columns = [i for i, name in enumerate(names) if name not in TIME_COLUMNS and i != 0]
+    aggregate_header = b",".join(
+        [b"timestamp", b"UTC time", b"count"] +
+        [names[i] + b"_" + statistic for i in value_columns for statistic in AGGREGATE_STATISTICS]
+    )
+    table = parse_table(rows, len(names))
+    if table is None:
+        return aggregate_header
+
+    windows, counts, statistics = aggregate(table, value_columns, resample.window)
+    lines = [aggregate_header]
+    for window, utc_time, count, values in zip(
+            windows, utc_time_strings(windows), counts, zip(*statistics) if statistics else [()] * len(windows)
+    ):
+        lines.append(b",".join([b"%d" % window, utc_time, b"%d" % count] + [format_value(value) for value in values]))
+    return b"\n".join(lines)
+
+
+def resample_files(files: Iterable[bytes], resample: Resample) -> Iterator[bytes]:
+    """ Resamples files one at a time, for processing a participant's chunks in time order without
+    holding more than one of them in memory. """
+    validate_resample(resample)
+    for contents in files:
+        yield resample_csv(contents, resample)
+
+
+#########################################################################################
+
+def split_rows(contents: bytes) -> Tuple[bytes, List[bytes]]:
+    header, _, body = contents.partition(b"\n")
+    body = body.rstrip(b"\r\n")
+    return header.rstrip(b"\r"), body.split(b"\n") if body else []
+
+
+def parse_timestamps(rows: List[bytes]) -> numpy.ndarray:
+    return numpy.array([row[:row.find(b",")] if b"," in row else row for row in rows]).astype(numpy.int64)
+
+
+def parse_table(rows: List[bytes], column_count: int):
+    """ A 2 dimensional array of the rows' values (as bytes), without rows that do not have one
+    value per column.  None if there are no such rows. """
+    if not rows:
+        return None
+    # the common case, every row is well formed, is split in one pass.
+    if all(row.count(b",") == column_count - 1 for row in rows):
+        return numpy.array(b",".join(rows).split(b",")).reshape(len(rows), column_count)
+    split = [values for values in (row.split(b",") for row in rows) if len(values) == column_count]
+    return numpy.array(split) if split else None
+
+
+def parse_column(column: numpy.ndarray):
+    """ The values of a column as floats (empty values are nan), or None if the column is not
+    numeric. """
+    try:
+        return numpy.where(column == b"", b"nan", column).astype(numpy.float64)
+    except ValueError:
+        return None
+
+
+def window_starts(timestamps: numpy.ndarray, window: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """ The indexes of the first row of each window, and the start of each window.  Timestamps
+    must be sorted. """
+    windows = timestamps - timestamps % window
+    starts = numpy.flatnonzero(numpy.concatenate(([True], windows[1:] != windows[:-1])))
+    return starts, windows[starts]
+
+
+def aggregate(table: numpy.ndarray, value_columns: List[int], window: int):
+    """ Returns the start of each window, its count of rows, and a list of the statistics of each
+    column (mean, std, min and max arrays, in that order, for each column). """
+    timestamps = table[:, 0].astype(numpy.int64)
+    # files are sorted by timestamp, but a stable sort is cheap insurance.
+    if numpy.any(timestamps[1:] < timestamps[:-1]):
+        order = numpy.argsort(timestamps, kind="stable")
+        table, timestamps = table[order], timestamps[order]
+
+    starts, windows = window_starts(timestamps, window)
+    counts = numpy.diff(numpy.append(starts, len(timestamps)))
+    statistics = []
+    for i in value_columns:
+        values = parse_column(table[:, i])
+        if values is None:
+            # non-numeric columns (e.g. an accuracy of "unknown") cannot be aggregated.
+            statistics.extend([numpy.full(len(starts), numpy.nan)] * 4)
+            continue
+        present = ~numpy.isnan(values)
+        value_counts = numpy.add.reduceat(present, starts)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mean = numpy.add.reduceat(numpy.where(present, values, 0), starts) / value_counts
+            deviations = numpy.where(present, values - numpy.repeat(mean, counts), 0)
+            std = numpy.sqrt(numpy.add.reduceat(deviations * deviations, starts) / value_counts)
+        statistics.extend([
+            mean, std, numpy.fmin.reduceat(values, starts), numpy.fmax.reduceat(values, starts)
+        ])
+    return windows, counts, statistics
+
+
+def utc_time_strings(timestamps: numpy.ndarray) -> List[bytes]:
+    """ Formatted as the UTC time column of chunked files, e.g. 2020-01-01T00:00:00.000 """
+    return [
+        time_string.encode()
+        for time_string in numpy.datetime_as_string(timestamps.astype("datetime64[ms]"), unit="ms")
+    ]
+
+
+def format_value(value: float) -> bytes:
+    return b"" if numpy.isnan(value) else (b"%.7g" % value)
@@ -1,25 +1,233 @@
+import random
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore
+from time import sleep
+from typing import Dict, Generator, Iterable, Union
+
 import boto3
 import Crypto
-
-from config.constants import DEFAULT_S3_RETRIES
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError, IncompleteReadError
+from urllib3.exceptions import ProtocolError
+
+from config.constants import (CONCURRENT_DOWNLOAD_OPS, CONCURRENT_NETWORK_OPS, DEFAULT_S3_RETRIES,
+    MAX_CONCURRENT_DOWNLOAD_OPS, S3_MAX_POOL_CONNECTIONS, S3_MULTIPART_CONCURRENCY,
+    S3_MULTIPART_PART_SIZE, S3_MULTIPART_THRESHOLD, S3_RETRY_BACKOFF_BASE, S3_RETRY_BACKOFF_MAX,
+    S3_STREAM_BLOCK_SIZE)
 from config.settings import (BEIWE_SERVER_AWS_ACCESS_KEY_ID, BEIWE_SERVER_AWS_SECRET_ACCESS_KEY,
-    S3_BUCKET, S3_REGION_NAME)
+    LOCAL_STORAGE_ROOT, S3_BUCKET, S3_REGION_NAME, STORAGE_BACKEND)
 from libs import encryption
+from libs.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from libs.storage import LocalFileSystemStorageBackend, StorageBackend
 
 
 class S3VersionException(Exception): pass
 
-conn = boto3.client('s3',
-                    aws_access_key_id=BEIWE_SERVER_AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=BEIWE_SERVER_AWS_SECRET_ACCESS_KEY,
-                    region_name=S3_REGION_NAME)
+
+# error classifications, see classify_s3_error
+S3_THROTTLED = "throttled"
+S3_RETRYABLE = "retryable"
+S3_PERMANENT = "permanent"
+
+S3_THROTTLING_ERROR_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded", "RequestThrottled",
+    "TooManyRequestsException",
+}
+S3_RETRYABLE_ERROR_CODES = {
+    "InternalError", "ServiceUnavailable", "RequestTimeout", "RequestTimeoutException",
+    "OperationAborted",
+}
+
+
+def get_s3_pool_size() -> int:
+    """ The connection pool must be at least as large as the number of threads that can talk to S3
+    at once, otherwise threads block inside boto waiting for a connection. """
+    return S3_MAX_POOL_CONNECTIONS or (
+        CONCURRENT_NETWORK_OPS + max(CONCURRENT_DOWNLOAD_OPS, MAX_CONCURRENT_DOWNLOAD_OPS)
+    )
+
+
+def create_s3_client(max_pool_connections: int = None, region_name: str = S3_REGION_NAME):
+    """ Creates a boto3 s3 client.  Boto's internal retries are disabled, retries are handled by
+    _s3_call so that throttling can be fed back into the concurrency limiter. """
+    return boto3.client(
+        's3',
+        aws_access_key_id=BEIWE_SERVER_AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=BEIWE_SERVER_AWS_SECRET_ACCESS_KEY,
+        region_name=region_name,
+        config=Config(
+            max_pool_connections=max_pool_connections or get_s3_pool_size(),
+            retries={'max_attempts': 0},
+        ),
+    )
+
+
+conn = create_s3_client()
+
+# shared by every thread in the process, bounds the number of simultaneous S3 requests.
+s3_concurrency_limiter = AdaptiveConcurrencyLimiter(maximum=get_s3_pool_size())
+
+
+def classify_s3_error(error: Exception) -> str:
+    """ Sorts an exception raised by boto into throttled, retryable, or permanent. """
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if code in S3_THROTTLING_ERROR_CODES or status in (429, 503):
+            return S3_THROTTLED
+        if code in S3_RETRYABLE_ERROR_CODES or status >= 500:
+            return S3_RETRYABLE
+        # everything else (NoSuchKey, AccessDenied, NoSuchBucket, InvalidObjectState...)
+        return S3_PERMANENT
+
+    # network level problems: timeouts, dropped connections, dns failures, truncated bodies.
+    if isinstance(error, (ConnectionError, HTTPClientError, IncompleteReadError, ProtocolError)):
+        return S3_RETRYABLE
+
+    return S3_PERMANENT
+
+
+def s3_retry_delay(attempt: int) -> float:
+    """ Exponential backoff with "full jitter", attempt is 0-indexed. """
+    return random.uniform(0, min(S3_RETRY_BACKOFF_MAX, S3_RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def _s3_call(func, key_path, number_retries=DEFAULT_S3_RETRIES, **kwargs):
+    """ Runs an S3 operation inside the concurrency limiter, retrying retryable errors with backoff.
+    func receives kwargs; key_path is only used in log messages. """
+    attempt = 0
+    while True:
+        try:
+            with s3_concurrency_limiter:
+                ret = func(**kwargs)
+        except Exception as e:
+            classification = classify_s3_error(e)
+            if classification == S3_THROTTLED:
+                s3_concurrency_limiter.on_throttle()
+            if classification == S3_PERMANENT or attempt >= number_retries:
+                raise
+            delay = s3_retry_delay(attempt)
+            print("s3 operation failed (%s), retrying on %s in %.2f seconds" % (classification, key_path, delay))
+            sleep(delay)
+            attempt += 1
+        else:
+            s3_concurrency_limiter.on_success()
+            return ret
+
+
+class S3StorageBackend(StorageBackend):
+    """ The default storage backend, an S3 bucket.  All requests are retried with backoff and
+    run inside the process-wide concurrency limiter. """
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    def get(self, key_path: str, number_retries: int = DEFAULT_S3_RETRIES) -> bytes:
+        return _do_retrieve(self.bucket_name, key_path, number_retries=number_retries)
+
+    def get_stream(self, key_path: str, number_retries: int = DEFAULT_S3_RETRIES,
+                   block_size: int = S3_STREAM_BLOCK_SIZE, start: int = 0) -> Generator[bytes, None, None]:
+        """ The request is made immediately (so it can be issued from a worker thread), the body is
+        read as the generator is consumed.  If the connection drops the download resumes from
+        the last byte received. """
+        range_kwargs = {"Range": "bytes=%s-" % start} if start else {}
+        body = _s3_call(conn.get_object, key_path, number_retries=number_retries,
+                        Bucket=self.bucket_name, Key=key_path, **range_kwargs)['Body']
+        return _do_retrieve_stream(self.bucket_name, key_path, body, number_retries, block_size, start)
+
+    def size(self, key_path: str) -> int:
+        return _s3_call(conn.head_object, key_path, Bucket=self.bucket_name, Key=key_path)['ContentLength']
+
+    def put(self, key_path: str, data: bytes) -> None:
+        _s3_call(conn.put_object, key_path, Body=data, Bucket=self.bucket_name, Key=key_path)
+
+    def put_stream(self, key_path: str, blocks: Iterable[bytes]) -> None:
+        """ Objects larger than S3_MULTIPART_THRESHOLD are uploaded as a multipart upload with parts
+        uploaded in parallel; a failed part is retried on its own instead of restarting the
+        whole upload. """
+        parts = _iterate_parts(blocks, S3_MULTIPART_PART_SIZE)
+
+        # buffer parts until we know whether the object is big enough for a multipart upload.
+        buffered_parts = []
+        buffered_size = 0
+        for part in parts:
+            buffered_parts.append(part)
+            buffered_size += len(part)
+            if buffered_size > S3_MULTIPART_THRESHOLD:
+                break
+        else:
+            self.put(key_path, b"".join(buffered_parts))
+            return
+
+        _do_multipart_upload(self.bucket_name, key_path, chain(buffered_parts, parts))
+
+    def list(self, prefix: str) -> Generator[str, None, None]:
+        page_iterator = _do_paginate(
+            conn.list_objects_v2,
+            {'ContinuationToken': 'NextContinuationToken'},
+            Bucket=self.bucket_name, Prefix=prefix,
+        )
+        for page in page_iterator:
+            if 'Contents' not in page:
+                continue
+            for item in page['Contents']:
+                yield item['Key'].strip("/")
+
+    def list_versions(self, prefix: str) -> Generator[Dict[str, str], None, None]:
+        """
+        Page structure - each page is a dictionary with these keys:
+         Name, ResponseMetadata, Versions, MaxKeys, Prefix, KeyMarker, IsTruncated, VersionIdMarker
+        We only care about 'Versions', which is a list of all object versions matching that prefix.
+        Versions is a list of dictionaries with these keys:
+         LastModified, VersionId, ETag, StorageClass, Key, Owner, IsLatest, Size
+        """
+        page_iterator = _do_paginate(
+            conn.list_object_versions,
+            {'KeyMarker': 'NextKeyMarker', 'VersionIdMarker': 'NextVersionIdMarker'},
+            Bucket=self.bucket_name, Prefix=prefix,
+        )
+        for page in page_iterator:
+            # versions are not guaranteed, usually this means the file was deleted and only has deletion markers.
+            if 'Versions' not in page:
+                continue
+            for s3_version in page['Versions']:
+                yield {'VersionId': s3_version["VersionId"], 'Key': s3_version['Key']}
+
+    def delete(self, key_path: str) -> None:
+        _s3_call(conn.delete_object, key_path, Bucket=self.bucket_name, Key=key_path)
+
+
+def get_storage_backend() -> StorageBackend:
+    """ Storage backend selection, see STORAGE_BACKEND in config/settings.py """
+    if STORAGE_BACKEND == "local":
+        return LocalFileSystemStorageBackend(LOCAL_STORAGE_ROOT)
+    return S3StorageBackend(S3_BUCKET)
+
+
+storage_backend = get_storage_backend()
 
 
 def s3_upload(key_path: str, data_string: bytes, study_object_id: str, raw_path=False) -> None:
     if not raw_path:
         key_path = study_object_id + "/" + key_path
     data = encryption.encrypt_for_server(data_string, study_object_id)
-    conn.put_object(Body=data, Bucket=S3_BUCKET, Key=key_path)#, ContentType='string')
+    storage_backend.put(key_path, data)
+
+
+def s3_upload_stream(key_path: str, data: Union[bytes, Iterable[bytes]], study_object_id: str,
+                     raw_path=False) -> None:
+    """ As s3_upload, but data may also be an iterable of blocks of bytes, which are encrypted as
+    they are consumed.  On S3 large objects are uploaded as parallel multipart uploads. """
+    if not raw_path:
+        key_path = study_object_id + "/" + key_path
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [data]
+
+    iv, encrypter = encryption.get_server_stream_encrypter(study_object_id)
+    storage_backend.put_stream(
+        key_path, chain([iv], (encrypter.encrypt(bytes(block)) for block in data))
+    )
 
 
 def s3_retrieve(key_path, study_object_id, raw_path=False, number_retries=DEFAULT_S3_RETRIES) -> bytes:
@@ -28,81 +236,163 @@ def s3_retrieve(key_path, study_object_id, raw_path=False, number_retries=DEFAUL
     appropriate study_id folder. """
     if not raw_path:
         key_path = study_object_id + "/" + key_path
-    encrypted_data = _do_retrieve(S3_BUCKET, key_path, number_retries=number_retries)['Body'].read()
+    encrypted_data = storage_backend.get(key_path, number_retries=number_retries)
     return encryption.decrypt_server(encrypted_data, study_object_id)
 
 
-def _do_retrieve(bucket_name, key_path, number_retries=DEFAULT_S3_RETRIES):
-    """ Run-logic to do a data retrieval for a file in an S3 bucket."""
-    try:
-        return conn.get_object(Bucket=bucket_name, Key=key_path, ResponseContentType='string')
-    except Exception:
-        if number_retries > 0:
-            print("s3_retrieve failed, retrying on %s" % key_path)
-            return _do_retrieve(bucket_name, key_path, number_retries=number_retries - 1)
-        
-        raise
+def s3_retrieve_stream(key_path, study_object_id, raw_path=False, number_retries=DEFAULT_S3_RETRIES,
+                       block_size=S3_STREAM_BLOCK_SIZE, start=0) -> Generator[bytes, None, None]:
+    """ As s3_retrieve, but returns a generator of decrypted blocks of the file instead of the whole
+    file.  The request is made immediately, the file is read as the generator is consumed.
+
+    Decryption can start at any byte of the (decrypted) file: in CFB mode with 8 bit segments
+    decrypted byte n depends only on the 16 encrypted bytes before it, which (because the file
+    starts with the 16 byte iv) are encrypted bytes n to n+16.  So we retrieve from byte n and use
+    the first 16 bytes as the iv. """
+    if not raw_path:
+        key_path = study_object_id + "/" + key_path
+    encrypted_blocks = storage_backend.get_stream(
+        key_path, number_retries=number_retries, block_size=block_size, start=start
+    )
+    return _decrypt_stream(encrypted_blocks, study_object_id)
+
+
+def s3_retrieve_size(key_path, study_object_id, raw_path=False) -> int:
+    """ The size of the decrypted file, without retrieving it: the encrypted file is the 16 byte iv
+    followed by ciphertext of the same length as the decrypted file. """
+    if not raw_path:
+        key_path = study_object_id + "/" + key_path
+    return storage_backend.size(key_path) - 16
+
+
+def _decrypt_stream(encrypted_blocks: Iterable[bytes], study_object_id) -> Generator[bytes, None, None]:
+    decrypter = None
+    iv = b""
+    for block in encrypted_blocks:
+        if decrypter is None:
+            # the first 16 bytes of the file are the initialization vector.
+            iv += block
+            if len(iv) < 16:
+                continue
+            iv, block = iv[:16], iv[16:]
+            decrypter = encryption.get_server_stream_decrypter(study_object_id, iv)
+        if block:
+            yield decrypter.decrypt(block)
 
 
 def s3_list_files(prefix, as_generator=False):
     """ Method fetches a list of filenames with prefix.
         note: entering the empty string into this search without later calling
         the object results in a truncated/paginated view."""
-    return _do_list_files(S3_BUCKET, prefix, as_generator=as_generator)
+    if as_generator:
+        return storage_backend.list(prefix)
+    return list(storage_backend.list(prefix))
 
 
 def s3_list_versions(prefix, allow_multiple_matches=False):
     """
-    Page structure - each page is a dictionary with these keys:
-     Name, ResponseMetadata, Versions, MaxKeys, Prefix, KeyMarker, IsTruncated, VersionIdMarker
-    We only care about 'Versions', which is a list of all object versions matching that prefix.
-    Versions is a list of dictionaries with these keys:
-     LastModified, VersionId, ETag, StorageClass, Key, Owner, IsLatest, Size
-
-    returns a list of dictionaries.
-    If allow_multiple_matches is False the keys are LastModified, VersionId, IsLatest.
-    If allow_multiple_matches is True the key 'Key' is added, containing the s3 file path.
+    returns a list of dictionaries with the keys 'Key' and 'VersionId'.
+    If allow_multiple_matches is False an S3VersionException is raised if any file matching the
+    prefix is not an exact match.
     """
-
-    paginator = conn.get_paginator('list_object_versions')
-    page_iterator = paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix)
-
     versions = []
-    for page in page_iterator:
-        # versions are not guaranteed, usually this means the file was deleted and only has deletion markers.
-        if 'Versions' not in page:
-            continue
-
-        for s3_version in page['Versions']:
-            if not allow_multiple_matches and s3_version['Key'] != prefix:
-                raise S3VersionException("the prefix '%s' was not an exact match" % prefix)
-            versions.append({
-                'VersionId': s3_version["VersionId"],
-                'Key': s3_version['Key'],
-            })
+    for version in storage_backend.list_versions(prefix):
+        if not allow_multiple_matches and version['Key'] != prefix:
+            raise S3VersionException("the prefix '%s' was not an exact match" % prefix)
+        versions.append(version)
     return versions
 
 
-def _do_list_files(bucket_name, prefix, as_generator=False):
-    paginator = conn.get_paginator('list_objects_v2')
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-    if as_generator:
-        return _do_list_files_generator(page_iterator)
-    else:
-        items = []
-        for page in page_iterator:
-            if 'Contents' in page:
-                for item in page['Contents']:
-                    items.append(item['Key'].strip("/"))
-        return items
+"""############################### S3 Internals ###############################"""
+
+
+def _do_retrieve(bucket_name, key_path, number_retries=DEFAULT_S3_RETRIES) -> bytes:
+    """ Run-logic to do a data retrieval for a file in an S3 bucket.  The body is read inside the
+    retried operation so that a connection dropped mid-read is also retried. """
+    def get_and_read(**kwargs):
+        return conn.get_object(**kwargs)['Body'].read()
 
+    return _s3_call(get_and_read, key_path, number_retries=number_retries,
+                    Bucket=bucket_name, Key=key_path, ResponseContentType='string')
 
-def _do_list_files_generator(page_iterator):
-    for page in page_iterator:
-        if 'Contents' not in page:
+
+def _do_retrieve_stream(bucket_name, key_path, body, number_retries, block_size, start=0):
+    position = start
+    attempt = 0
+    while True:
+        try:
+            for block in body.iter_chunks(chunk_size=block_size):
+                position += len(block)
+                yield block
+            return
+        except Exception as e:
+            if classify_s3_error(e) == S3_PERMANENT or attempt >= number_retries:
+                raise
+            delay = s3_retry_delay(attempt)
+            print("s3 stream interrupted at byte %s of %s, resuming in %.2f seconds" % (position, key_path, delay))
+            sleep(delay)
+            attempt += 1
+            body = _s3_call(conn.get_object, key_path, number_retries=number_retries,
+                            Bucket=bucket_name, Key=key_path, Range="bytes=%s-" % position)['Body']
+
+
+def _do_paginate(func, next_page_parameters, **kwargs):
+    """ A paginator where each page request is retried individually (boto paginators cannot resume
+    after an error).  next_page_parameters maps request parameters to the response keys that
+    provide their values for the next page. """
+    while True:
+        page = _s3_call(func, kwargs.get("Prefix", ""), **kwargs)
+        yield page
+        if not page.get("IsTruncated"):
             return
-        for item in page['Contents']:
-            yield item['Key'].strip("/")
+        for parameter, response_key in next_page_parameters.items():
+            kwargs[parameter] = page[response_key]
+
+
+def _iterate_parts(blocks: Iterable[bytes], part_size: int) -> Generator[bytes, None, None]:
+    """ Regroups blocks of arbitrary size into parts of exactly part_size bytes (except the last). """
+    buffer = bytearray()
+    for block in blocks:
+        buffer.extend(block)
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _do_multipart_upload(bucket_name, key_path, parts: Iterable[bytes]):
+    upload_id = _s3_call(conn.create_multipart_upload, key_path, Bucket=bucket_name, Key=key_path)['UploadId']
+
+    def upload_part(part_number_and_part):
+        part_number, part = part_number_and_part
+        response = _s3_call(conn.upload_part, key_path, Bucket=bucket_name, Key=key_path,
+                            UploadId=upload_id, PartNumber=part_number, Body=part)
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    # bounds the number of parts held in memory at once.
+    slots = BoundedSemaphore(S3_MULTIPART_CONCURRENCY * 2)
+    release_slot = lambda _: slots.release()
+    pool = ThreadPool(S3_MULTIPART_CONCURRENCY)
+    try:
+        results = []
+        for part_number, part in enumerate(parts, start=1):
+            slots.acquire()
+            results.append(pool.apply_async(
+                upload_part, ((part_number, part),), callback=release_slot, error_callback=release_slot
+            ))
+            del part
+        # .get() re-raises any error from the upload thread.
+        completed_parts = [result.get() for result in results]
+        _s3_call(conn.complete_multipart_upload, key_path, Bucket=bucket_name, Key=key_path,
+                 UploadId=upload_id, MultipartUpload={'Parts': completed_parts})
+    except Exception:
+        # uploaded parts of an incomplete multipart upload are stored (and billed) until aborted.
+        conn.abort_multipart_upload(Bucket=bucket_name, Key=key_path, UploadId=upload_id)
+        raise
+    finally:
+        pool.close()
+        pool.terminate()
 
 
 def s3_delete(key_path):
@@ -2,10 +2,11 @@ from collections import Counter
 from datetime import timedelta
 from time import sleep
 
+from django.db.models import Sum
 from django.utils.timezone import localtime
 
 from database.data_access_models import FileToProcess
-from database.profiling_models import UploadTracking
+from database.profiling_models import UploadDailyStats, UploadTracking
 from database.user_models import Participant
 
 
@@ -86,7 +87,8 @@ def watch_uploads():
 
 def get_and_summarize(patient_id: str):
     p = Participant.objects.get(patient_id=patient_id)
-    byte_sum = sum(UploadTracking.objects.filter(participant=p).values_list("file_size", flat=True))
+    # old UploadTracking rows are deleted, the daily totals are kept.
+    byte_sum = UploadDailyStats.objects.filter(participant=p).aggregate(total=Sum("bytes"))["total"] or 0
     print(f"Total Data Uploaded: {byte_sum/1024/1024}MB")
 
     counter = Counter(
@@ -0,0 +1,138 @@
+import mmap
+import os
+from abc import ABC, abstractmethod
+from os.path import abspath, dirname, exists, isdir, join, relpath
+from tempfile import NamedTemporaryFile
+from typing import Dict, Generator, Iterable
+
+
+class StorageBackendError(Exception): pass
+
+
+class StorageBackend(ABC):
+    """
+    The interface to the object store that holds all uploaded, chunked, and pipeline data.
+
+    Backends store and return bytes exactly as provided (encryption is handled in libs.s3).
+    Keys are S3-style paths: "/" separated, and prefixes in list operations are string
+    prefixes, not directories.  Listing returns keys in ascending order, as S3 does.
+    """
+
+    @abstractmethod
+    def get(self, key_path: str, number_retries: int = None) -> bytes:
+        pass
+
+    @abstractmethod
+    def get_stream(self, key_path: str, number_retries: int = None, block_size: int = 1024*1024,
+                   start: int = 0) -> Generator[bytes, None, None]:
+        """ Yields the object in blocks, starting from byte number start. """
+
+    @abstractmethod
+    def size(self, key_path: str) -> int:
+        """ The size of the object in bytes, without retrieving it. """
+
+    @abstractmethod
+    def put(self, key_path: str, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def put_stream(self, key_path: str, blocks: Iterable[bytes]) -> None:
+        pass
+
+    @abstractmethod
+    def list(self, prefix: str) -> Generator[str, None, None]:
+        pass
+
+    @abstractmethod
+    def list_versions(self, prefix: str) -> Generator[Dict[str, str], None, None]:
+        """ Yields dictionaries with the keys 'Key' and 'VersionId'. """
+
+    @abstractmethod
+    def delete(self, key_path: str) -> None:
+        pass
+
+
+class LocalFileSystemStorageBackend(StorageBackend):
+    """
+    Stores objects as files under a root folder, e.g. on a local NVMe volume.
+
+    Streamed reads are memory mapped, writes go to a temporary file that is renamed into place so that a
+    reader never sees a partial file.  The local filesystem has no versioning, every object has a
+    single version with the id "null" (which is what S3 reports for unversioned objects).
+    """
+
+    def __init__(self, root: str):
+        self.root = abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key_path: str) -> str:
+        path = abspath(join(self.root, key_path.strip("/")))
+        if not path.startswith(self.root + os.sep):
+            raise StorageBackendError("invalid key path: '%s'" % key_path)
+        return path
+
+    def get(self, key_path: str, number_retries: int = None) -> bytes:
+        with open(self._path(key_path), "rb") as f:
+            return f.read()
+
+    def get_stream(self, key_path: str, number_retries: int = None, block_size: int = 1024*1024,
+                   start: int = 0) -> Generator[bytes, None, None]:
+        # open the file now so that a missing file raises immediately, as with S3.
+        f = open(self._path(key_path), "rb")
+        return self._do_get_stream(f, block_size, start)
+
+    @staticmethod
+    def _do_get_stream(f, block_size, start):
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= start:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for i in range(start, size, block_size):
+                    yield mapped[i:i + block_size]
+
+    def size(self, key_path: str) -> int:
+        return os.path.getsize(self._path(key_path))
+
+    def put(self, key_path: str, data: bytes) -> None:
+        self.put_stream(key_path, [data])
+
+    def put_stream(self, key_path: str, blocks: Iterable[bytes]) -> None:
+        path = self._path(key_path)
+        os.makedirs(dirname(path), exist_ok=True)
+        with NamedTemporaryFile(dir=dirname(path), prefix=".tmp", delete=False) as f:
+            try:
+                for block in blocks:
+                    f.write(block)
+            except Exception:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    def list(self, prefix: str) -> Generator[str, None, None]:
+        # prefixes are string prefixes, so start walking from the last complete folder name.
+        folder = self.root
+        if "/" in prefix:
+            folder = self._path(prefix.rsplit("/", 1)[0])
+        if not isdir(folder):
+            return
+
+        keys = []
+        for directory, _, file_names in os.walk(folder):
+            for file_name in file_names:
+                if file_name.startswith(".tmp"):
+                    continue
+                key = relpath(join(directory, file_name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        yield from sorted(keys)
+
+    def list_versions(self, prefix: str) -> Generator[Dict[str, str], None, None]:
+        for key in self.list(prefix):
+            yield {'Key': key, 'VersionId': "null"}
+
+    def delete(self, key_path: str) -> None:
+        path = self._path(key_path)
+        if exists(path):
+            os.remove(path)
@@ -1,4 +1,4 @@
-from io import BytesIO, StringIO
+from io import BytesIO, StringIO, UnsupportedOperation
 
 
 class StreamingBytesIO(BytesIO):
@@ -55,3 +55,20 @@ class StreamingStringsIO(StringIO):
         """ Sets the position explicitly, required for compatibility with Python 3 Zipfile """
         self._position = args[0]
         return super(StreamingStringsIO, self).seek(0)
+
+
+class UnseekableStreamingBytesIO(StreamingBytesIO):
+    """
+    A StreamingBytesIO that refuses to seek.
+
+    When a ZipFile finishes an entry on a seekable stream it seeks back to rewrite that entry's
+    header, which only works if the whole entry is still in the buffer.  On an unseekable stream
+    ZipFile instead writes a data descriptor after the entry, which allows a single large entry
+    to be written (and yielded, and emptied) in pieces.
+    """
+
+    def seekable(self):
+        return False
+
+    def seek(self, *args, **kwargs):
+        raise UnsupportedOperation("seek")
@@ -0,0 +1,64 @@
+import time
+from tarfile import BLOCKSIZE, PAX_FORMAT, RECORDSIZE, TarInfo
+from typing import Iterator
+
+# Data download formats other than zip.  A zip file ends with a central directory of all of its
+# entries, so ZipFile keeps a record of every entry in memory until the zip is closed.  These
+# formats keep nothing per entry: a tar file has no central directory, and a csv stream is just
+# rows.  File contents are yielded as they are, without copying them into a buffer first.
+
+
+class TarStream:
+    """ Writes a tar file as a sequence of bytes objects.  Each entry's header includes its size,
+    so files are added whole. """
+
+    def __init__(self):
+        self.size = 0
+
+    def add(self, file_name: str, contents: bytes, mtime: int = None) -> Iterator[bytes]:
+        """ Yields the header, contents, and padding of an entry. """
+        tar_info = TarInfo(file_name)
+        tar_info.size = len(contents)
+        tar_info.mtime = int(time.time()) if mtime is None else mtime
+        tar_info.mode = 0o600
+        # the pax format allows file names of any length.
+        header = tar_info.tobuf(format=PAX_FORMAT)
+        padding = -len(contents) % BLOCKSIZE
+        self.size += len(header) + len(contents) + padding
+
+        yield header
+        if contents:
+            yield contents
+        if padding:
+            yield bytes(padding)
+
+    def close(self) -> bytes:
+        """ The end of archive marker (two empty blocks), padded to a whole record as tar does. """
+        end = 2 * BLOCKSIZE
+        end += -(self.size + end) % RECORDSIZE
+        self.size += end
+        return bytes(end)
+
+
+class CsvStream:
+    """ Concatenates csv files of one data stream into one csv, with an additional first column
+    identifying the participant of each row.  The header is written again whenever a file has
+    different columns than the previous file (which happens when participants use different
+    phones), a file's rows always follow the header that applies to them. """
+
+    def __init__(self, first_column_name: str = "patient_id"):
+        self.first_column_name = first_column_name.encode()
+        self.header = None
+
+    def add(self, first_column: str, contents: bytes) -> bytes:
+        """ Returns the csv rows of a file (which starts with a header line). """
+        header, _, rows = contents.partition(b"\n")
+        rows = rows.rstrip(b"\r\n")
+        ret = []
+        if header != self.header:
+            ret.append(self.first_column_name + b"," + header + b"\n")
+            self.header = header
+        if rows:
+            prefix = first_column.encode() + b","
+            ret.append(prefix + rows.replace(b"\n", b"\n" + prefix) + b"\n")
+        return b"".join(ret)
@@ -0,0 +1,80 @@
+import time
+import zlib
+from collections import namedtuple
+from typing import List
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+# Zip entries are normally written by ZipFile on the thread that writes the zip.  SplicingZipFile
+# can also take entries that were prepared elsewhere: entries compressed on other threads (see
+# prepare_zip_entry), and the already written entries of export bundles (see libs.export_bundles).
+
+# The ZipInfo attributes needed to write a zip entry's central directory record.
+ZIP_INFO_FIELDS = ["filename", "date_time", "compress_type", "CRC", "compress_size", "file_size",
+                   "header_offset", "flag_bits", "create_system", "create_version",
+                   "extract_version", "external_attr"]
+
+# a zip entry's ZipInfo (with its CRC and sizes) and its compressed data.
+PreparedZipEntry = namedtuple("PreparedZipEntry", ["zip_info", "data"])
+
+
+class ZipSpliceError(Exception): pass
+
+
+def zip_info_to_json(zip_info: ZipInfo) -> dict:
+    return {field: getattr(zip_info, field) for field in ZIP_INFO_FIELDS}
+
+
+def zip_info_from_json(entry: dict, offset: int) -> ZipInfo:
+    """ Recreates a ZipInfo from zip_info_to_json, with the entry moved offset bytes further into
+    the file. """
+    zip_info = ZipInfo(entry["filename"], tuple(entry["date_time"]))
+    for field in ZIP_INFO_FIELDS[2:]:
+        setattr(zip_info, field, entry[field])
+    zip_info.header_offset += offset
+    return zip_info
+
+
+def prepare_zip_entry(file_name: str, contents: bytes, compression_level: int) -> PreparedZipEntry:
+    """ DEFLATE compresses a file for SplicingZipFile.write_prepared_entry.  zlib releases the GIL,
+    so this can run on other threads.  Files that do not get smaller (e.g. audio) are stored. """
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+    data = compressor.compress(contents) + compressor.flush()
+
+    zip_info = ZipInfo(file_name, time.localtime(time.time())[:6])
+    zip_info.external_attr = 0o600 << 16  # as ZipFile.writestr
+    zip_info.file_size = len(contents)
+    zip_info.CRC = zlib.crc32(contents)
+    if len(data) < len(contents):
+        zip_info.compress_type = ZIP_DEFLATED
+    else:
+        zip_info.compress_type = ZIP_STORED
+        data = contents
+    zip_info.compress_size = len(data)
+    return PreparedZipEntry(zip_info, data)
+
+
+class SplicingZipFile(ZipFile):
+    """ A ZipFile (for writing) that can also write entries prepared elsewhere. """
+
+    def write_prepared_entry(self, entry: PreparedZipEntry):
+        with self._lock:
+            entry.zip_info.header_offset = self.fp.tell()
+            self.fp.write(entry.zip_info.FileHeader())
+            self.fp.write(entry.data)
+            self._add_zip_info(entry.zip_info)
+
+    def add_spliced_entries(self, zip_entries: List[dict], offset: int, size: int):
+        """ Adds entries (from zip_info_to_json, with offsets relative to the first entry) to the
+        zip, after their bytes (size bytes) have been written to the underlying file starting at
+        offset. """
+        written = self.fp.tell() - offset
+        if written != size:
+            raise ZipSpliceError("spliced %s bytes, expected %s" % (written, size))
+        with self._lock:
+            for entry in zip_entries:
+                self._add_zip_info(zip_info_from_json(entry, offset))
+
+    def _add_zip_info(self, zip_info: ZipInfo):
+        self.filelist.append(zip_info)
+        self.NameToInfo[zip_info.filename] = zip_info
+        self.start_dir = self.fp.tell()
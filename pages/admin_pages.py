@@ -39,16 +39,13 @@ def view_study(study_id=None):
     tracking_survey_ids = study.get_survey_ids_and_object_ids_for_study('tracking_survey')
     audio_survey_ids = study.get_survey_ids_and_object_ids_for_study('audio_survey')
     image_survey_ids = study.get_survey_ids_and_object_ids_for_study('image_survey')
-    participants = study.participants.all()
-
-    study_fields = list(study.fields.all().values_list('field_name', flat=True))
-    for p in participants:
-        p.values_dict = {tag.field.field_name: tag.value for tag in p.field_values.all()}
+    # the participants are read a page at a time by the page's participant table, see
+    # participant_administration.participant_list_page.
+    study_fields = list(study.fields.values_list('field_name', flat=True))
 
     return render_template(
         'view_study.html',
         study=study,
-        patients=participants,
         audio_survey_ids=audio_survey_ids,
         image_survey_ids=image_survey_ids,
         tracking_survey_ids=tracking_survey_ids,
@@ -81,7 +78,7 @@ def patient_fields(study_id, patient_id=None):
     except Participant.DoesNotExist:
         return abort(404)
 
-    patient.values_dict = {tag.field.field_name: tag.value for tag in patient.field_values.all()}
+    patient.values_dict = {tag.field.field_name: tag.value for tag in patient.field_values.select_related('field')}
     study = patient.study
     if request.method == 'GET':
         return render_template(
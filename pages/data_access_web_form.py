@@ -1,13 +1,13 @@
 import json
+from collections import defaultdict
 
-from flask import Blueprint, flash, Markup, render_template, session
+from flask import Blueprint, flash, Markup, render_template
 
 from config.constants import ALL_DATA_STREAMS
 from database.data_access_models import PipelineUploadTags
-from database.user_models import Participant, Researcher
+from database.user_models import Participant
 from libs.admin_authentication import (authenticate_researcher_login,
-    get_researcher_allowed_studies, get_researcher_allowed_studies_as_query_set,
-    researcher_is_an_admin, SESSION_NAME)
+    get_researcher_allowed_studies, get_session_researcher, researcher_is_an_admin)
 
 data_access_web_form = Blueprint('data_access_web_form', __name__)
 
@@ -15,14 +15,12 @@ data_access_web_form = Blueprint('data_access_web_form', __name__)
 @data_access_web_form.route("/data_access_web_form", methods=['GET'])
 @authenticate_researcher_login
 def data_api_web_form_page():
-    researcher = Researcher.objects.get(username=session[SESSION_NAME])
-    warn_researcher_if_hasnt_yet_generated_access_key(researcher)
-    allowed_studies = get_researcher_allowed_studies_as_query_set()
-    # dict of {study ids : list of user ids}
-    users_by_study = {
-        study.pk: [user.patient_id for user in study.participants.all()]
-        for study in allowed_studies
-    }
+    warn_researcher_if_hasnt_yet_generated_access_key(get_session_researcher())
+    study_ids = [study['id'] for study in get_researcher_allowed_studies(as_json=False)]
+    # dict of {study ids : list of patient ids}, from one query for all the studies.
+    users_by_study = {study_id: [] for study_id in study_ids}
+    for study_id, patient_id in Participant.objects.filter(study_id__in=study_ids).values_list("study_id", "patient_id"):
+        users_by_study[study_id].append(patient_id)
     return render_template(
         "data_api_web_form.html",
         allowed_studies=get_researcher_allowed_studies(),
@@ -43,23 +41,21 @@ def warn_researcher_if_hasnt_yet_generated_access_key(researcher):
 @data_access_web_form.route("/pipeline_access_web_form", methods=['GET'])
 @authenticate_researcher_login
 def pipeline_download_page():
-    researcher = Researcher.objects.get(username=session[SESSION_NAME])
-    warn_researcher_if_hasnt_yet_generated_access_key(researcher)
-    iteratable_studies = get_researcher_allowed_studies(as_json=False)
-    # dict of {study ids : list of user ids}
+    warn_researcher_if_hasnt_yet_generated_access_key(get_session_researcher())
+    study_ids = [study['id'] for study in get_researcher_allowed_studies(as_json=False)]
 
-    users_by_study = {str(study['id']):
-                      [user.id for user in Participant.objects.filter(study__id=study['id'])]
-                      for study in iteratable_studies}
+    # dict of {study ids : list of participant ids}, and dict of {study ids : list of distinct
+    # pipeline upload tags}, each from one query for all the studies.
+    users_by_study = {str(study_id): [] for study_id in study_ids}
+    for study_id, participant_id in Participant.objects.filter(study_id__in=study_ids).values_list("study_id", "id"):
+        users_by_study[str(study_id)].append(participant_id)
 
-    # it is a bit obnoxious to get this data, we need to deduplcate it and then turn it back into a list
-
-    tags_by_study = {
-        study['id']: list(set([tag for tag in PipelineUploadTags.objects.filter(
-            pipeline_upload__study__id=study['id']
-        ).values_list("tag", flat=True)]))
-        for study in iteratable_studies
-    }
+    tags_by_study = defaultdict(list)
+    for study_id, tag in PipelineUploadTags.objects.filter(
+            pipeline_upload__study_id__in=study_ids
+    ).values_list("pipeline_upload__study_id", "tag").order_by().distinct():
+        tags_by_study[study_id].append(tag)
+    tags_by_study = {study_id: tags_by_study[study_id] for study_id in study_ids}
 
     return render_template(
             "data_pipeline_web_form.html",
@@ -2,7 +2,7 @@ from flask import request
 from flask.blueprints import Blueprint
 from flask.templating import render_template
 from libs.user_authentication import authenticate_user
-from libs.graph_data import get_survey_results
+from libs.graph_data import get_participant_survey_results
 from database.user_models import Participant
 
 mobile_pages = Blueprint('mobile_pages', __name__)
@@ -14,13 +14,10 @@ def fetch_graph():
     """ Fetches the patient's answers to the most recent survey, marked by survey ID. The results
     are dumped into a jinja template and pushed to the device. """
     patient_id = request.values['patient_id']
-    participant = Participant.objects.get(patient_id=patient_id)
+    participant = Participant.objects.select_related('study').get(patient_id=patient_id)
     # See docs in config manipulations for details
-    study_object_id = participant.study.object_id
     survey_object_id_set = participant.study.surveys.values_list('object_id', flat=True)
-    data = []
-    for survey_id in survey_object_id_set:
-        data.append(get_survey_results(study_object_id, patient_id, survey_id, 7))
+    data = get_participant_survey_results(participant, survey_object_id_set, 7)
     return render_template("phone_graphs.html", data=data)
 
 
@@ -72,13 +72,18 @@ def manage_researchers():
     # get the study names that each user has access to, but only those that the current admin  also
     # has access to.
     session_ids = get_session_researcher_study_ids()
-    researcher_list = []
-    for researcher in get_administerable_researchers():
-        allowed_studies = Study.get_all_studies_by_name().filter(
-            study_relations__researcher=researcher,
-            study_relations__study__in=session_ids,
-        ).values_list('name', flat=True)
-        researcher_list.append((researcher.as_native_python(), list(allowed_studies)))
+    researchers = list(get_administerable_researchers())
+    # the study names of all the researchers, in one query.
+    studies_by_researcher = defaultdict(list)
+    for researcher_id, study_name in Study.get_all_studies_by_name().filter(
+        study_relations__researcher__in=[researcher.pk for researcher in researchers],
+        study_relations__study__in=session_ids,
+    ).values_list('study_relations__researcher_id', 'name'):
+        studies_by_researcher[researcher_id].append(study_name)
+
+    researcher_list = [
+        (researcher.as_native_python(), studies_by_researcher[researcher.pk]) for researcher in researchers
+    ]
 
     return render_template(
         'manage_researchers.html',
@@ -345,6 +350,21 @@ def delete_study(study_id=None):
         return "success"
 
 
+@system_admin_pages.route('/server_summaries/<string:study_id>', methods=['POST'])
+@authenticate_admin
+def set_server_summaries(study_id=None):
+    """ Turns computing a study's dashboard GPS, call and text summaries on the server on or off. """
+    assert_admin(study_id)
+    study = Study.objects.get(pk=study_id)
+    study.server_summaries = request.form.get('server_summaries') == 'true'
+    study.save()
+    if study.server_summaries:
+        flash("The GPS, call and text summaries of '%s' are now computed on the server." % study.name, 'success')
+    else:
+        flash("The GPS, call and text summaries of '%s' are now those of pipeline uploads." % study.name, 'success')
+    return redirect('/edit_study/{:s}'.format(study_id))
+
+
 @system_admin_pages.route('/device_settings/<string:study_id>', methods=['GET', 'POST'])
 @authenticate_researcher_study_access
 def device_settings(study_id=None):
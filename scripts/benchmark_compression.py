@@ -0,0 +1,70 @@
+# add the root of the project into the path to allow cd-ing into this folder and running the script.
+from sys import path, argv
+from os.path import abspath
+path.insert(0, abspath(__file__).rsplit('/', 2)[0])
+
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from libs.streaming_zip import prepare_zip_entry
+
+# Benchmarks the CPU cost of compressing data downloads against the bytes saved, for each zlib
+# compression level, on one thread and on a thread pool (zlib releases the GIL).
+# usage: python scripts/benchmark_compression.py [number of threads, default: number of cpus]
+
+THREADS = int(argv[1]) if len(argv) > 1 else os.cpu_count()
+FILES = 48
+
+
+def accelerometer_chunk(seed):
+    """ An hour of accelerometer data at 10Hz, in the format the app uploads. """
+    random.seed(seed)
+    timestamp = 1577836800000
+    x, y, z = 0.0, 0.0, 9.81
+    lines = ["timestamp,UTC time,accuracy,x,y,z"]
+    for _ in range(36000):
+        timestamp += random.randint(95, 105)
+        x, y, z = (x + random.gauss(0, 0.05), y + random.gauss(0, 0.05), z + random.gauss(0, 0.05))
+        lines.append("%d,2020-01-01T00:00:00.000,unknown,%.6f,%.6f,%.6f" % (timestamp, x, y, z))
+    return "\n".join(lines).encode()
+
+
+def gps_chunk(seed):
+    """ An hour of gps data, one fix every 10 seconds. """
+    random.seed(seed)
+    timestamp = 1577836800000
+    lines = ["timestamp,UTC time,latitude,longitude,altitude,accuracy"]
+    for _ in range(360):
+        timestamp += 10000
+        lines.append("%d,2020-01-01T00:00:00.000,%.7f,%.7f,%.1f,%.1f" % (
+            timestamp, 42.36 + random.gauss(0, 0.001), -71.06 + random.gauss(0, 0.001),
+            random.uniform(0, 50), random.uniform(3, 30)))
+    return "\n".join(lines).encode()
+
+
+def compress_all(files, level, threads):
+    if threads == 1:
+        return [prepare_zip_entry("file", contents, level) for contents in files]
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(lambda contents: prepare_zip_entry("file", contents, level), files))
+
+
+def main():
+    files = [accelerometer_chunk(i) if i % 4 else gps_chunk(i) for i in range(FILES)]
+    total = sum(len(contents) for contents in files)
+    print("%s files, %.1fMB, %s threads" % (FILES, total / 1024 / 1024, THREADS))
+    print("%-6s %10s %14s %14s" % ("level", "ratio", "1 thread MB/s", "%s threads MB/s" % THREADS))
+    for level in [1, 3, 6, 9]:
+        rates = []
+        for threads in [1, THREADS]:
+            start = perf_counter()
+            entries = compress_all(files, level, threads)
+            rates.append(total / 1024 / 1024 / (perf_counter() - start))
+        compressed = sum(len(entry.data) for entry in entries)
+        print("%-6s %9.1fx %14.1f %14.1f" % (level, total / compressed, rates[0], rates[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# add the root of the project into the path to allow cd-ing into this folder and running the script.
+from sys import path, argv
+from os.path import abspath
+path.insert(0, abspath(__file__).rsplit('/', 2)[0])
+
+import tracemalloc
+from time import perf_counter
+from zipfile import ZipFile, ZIP_STORED
+
+from libs.streaming_bytes_io import UnseekableStreamingBytesIO
+from libs.streaming_exports import TarStream
+
+# Compares the peak memory of constructing a data download as a zip (as zip_generator does) and as
+# a tar (as tar_generator does) as the number of files grows.  Files are generated one at a time and
+# the output is discarded, so the peak is what the download itself keeps in memory.
+# usage: python scripts/benchmark_download_memory.py [largest number of files, default 200,000]
+
+MAX_FILES = int(argv[1]) if len(argv) > 1 else 200000
+FILE_SIZE = 2048
+
+
+def file_names(count):
+    for i in range(count):
+        yield "p%04d/accelerometer/2020-01-01 %06d.csv" % (i % 1000, i)
+
+
+def zip_download(count):
+    zip_output = UnseekableStreamingBytesIO()
+    zip_input = ZipFile(zip_output, mode="w", compression=ZIP_STORED, allowZip64=True)
+    for file_name in file_names(count):
+        zip_input.writestr(file_name, b"x" * FILE_SIZE)
+        zip_output.getvalue()
+        zip_output.empty()
+    zip_input.close()
+    zip_output.getvalue()
+
+
+def tar_download(count):
+    tar = TarStream()
+    for file_name in file_names(count):
+        for _ in tar.add(file_name, b"x" * FILE_SIZE, mtime=0):
+            pass
+    tar.close()
+
+
+def measure(func, count):
+    """ Returns the peak memory and the duration, which is measured separately because tracing
+    memory allocations slows python down a lot. """
+    tracemalloc.start()
+    func(count)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = perf_counter()
+    func(count)
+    return peak, perf_counter() - start
+
+
+def main():
+    print("%-10s %14s %14s %12s %12s" % ("files", "zip peak MB", "tar peak MB", "zip seconds", "tar seconds"))
+    counts = [count for count in [1000, 10000, 100000, 1000000] if count < MAX_FILES] + [MAX_FILES]
+    for count in counts:
+        zip_peak, zip_duration = measure(zip_download, count)
+        tar_peak, tar_duration = measure(tar_download, count)
+        print("%-10s %14.2f %14.2f %12.2f %12.2f" % (
+            "{:,}".format(count), zip_peak / 1024 / 1024, tar_peak / 1024 / 1024, zip_duration, tar_duration
+        ))
+
+
+if __name__ == "__main__":
+    main()
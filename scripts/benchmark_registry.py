@@ -0,0 +1,85 @@
+# add the root of the project into the path to allow cd-ing into this folder and running the script.
+from sys import path, argv
+from os.path import abspath
+path.insert(0, abspath(__file__).rsplit('/', 2)[0])
+
+import gc
+import hashlib
+import json
+import random
+from base64 import b64encode
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from libs.registry import decode_registry, encode_registry, sorted_registry_items, unregistered_chunks
+
+# Benchmarks the json and binary data download registry formats, and the registry diff.
+# usage: python scripts/benchmark_registry.py [number of entries, default 1,000,000]
+
+ENTRIES = int(argv[1]) if len(argv) > 1 else 1000000
+DATA_STREAMS = ["accelerometer", "gps", "gyro", "power_state", "wifi", "bluetooth", "calls", "texts"]
+
+
+def make_registry(size):
+    """ A registry of realistic chunk paths, hourly chunks for 8 data streams for some participants. """
+    random.seed(0)
+    study = "5873fe38644ad7557b168e43"
+    start = datetime(2019, 1, 1)
+    registry = {}
+    participant = 0
+    while len(registry) < size:
+        participant += 1
+        for hour in range(24 * 90):
+            time_bin = (start + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M:%S")
+            for data_stream in DATA_STREAMS:
+                chunk_path = "CHUNKED_DATA/%s/p%07d/%s/%s.csv" % (study, participant, data_stream, time_bin)
+                registry[chunk_path] = b64encode(hashlib.md5(chunk_path.encode()).digest()).decode()
+                if len(registry) == size:
+                    return registry
+    return registry
+
+
+def timed(label, func, *args, repeat=1):
+    """ Prints the best time of repeat runs, with garbage collection disabled (it makes the timing of
+    code that creates millions of objects very noisy). """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        start = perf_counter()
+        ret = func(*args)
+        duration = perf_counter() - start
+        gc.enable()
+        best = duration if best is None else min(best, duration)
+    print("%-45s %8.2f seconds" % (label, best))
+    return ret
+
+
+def main():
+    registry = timed("generating %s entries" % "{:,}".format(ENTRIES), make_registry, ENTRIES)
+
+    json_registry = timed("json encode", json.dumps, registry)
+    binary_registry = timed("binary encode", encode_registry, registry)
+    print("%-45s %8.1f MB" % ("json size", len(json_registry) / 1024 / 1024))
+    print("%-45s %8.1f MB" % ("binary size", len(binary_registry) / 1024 / 1024))
+
+    json_items = timed("json decode and sort", lambda: list(sorted_registry_items(json.loads(json_registry))), repeat=3)
+    binary_items = timed("binary decode", lambda: list(decode_registry(binary_registry)), repeat=3)
+    assert json_items == binary_items
+
+    # the database side of the diff: every registered chunk, 1% of them updated, plus 1% new chunks.
+    chunks = [{"chunk_path": chunk_path, "chunk_hash": chunk_hash} for chunk_path, chunk_hash in binary_items]
+    for chunk in random.sample(chunks, len(chunks) // 100):
+        chunk["chunk_hash"] = "updated"
+    chunks.extend({"chunk_path": chunk["chunk_path"] + ".new", "chunk_hash": ""}
+                  for chunk in random.sample(chunks, len(chunks) // 100))
+    chunks.sort(key=lambda chunk: chunk["chunk_path"])
+
+    unregistered = timed("merge diff (binary registry, streamed)",
+                         lambda: sum(1 for _ in unregistered_chunks(chunks, decode_registry(binary_registry))),
+                         repeat=3)
+    print("%-45s %8s" % ("unregistered chunks", "{:,}".format(unregistered)))
+
+
+if __name__ == "__main__":
+    main()
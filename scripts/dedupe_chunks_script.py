@@ -10,7 +10,7 @@ from collections import Counter
 from datetime import datetime, timedelta
 
 from config.constants import API_TIME_FORMAT, CHUNKABLE_FILES, REVERSE_UPLOAD_FILE_TYPE_MAPPING
-from database.data_access_models import ChunkRegistry, FileToProcess
+from database.data_access_models import ChunkRegistry, DailyDataVolume, FileToProcess
 from libs.s3 import s3_list_files
 
 print("""
@@ -103,7 +103,8 @@ def fix_duplicates(duplicate_chunks):
 
 
 def remove_all_but_one_chunk(chunk_path: str):
-    chunk_ids = list(ChunkRegistry.objects.filter(chunk_path=chunk_path).values_list("id", flat=True))
+    chunks = list(ChunkRegistry.objects.filter(chunk_path=chunk_path).values_list("id", "participant_id"))
+    chunk_ids = [chunk_id for chunk_id, _ in chunks]
 
     if len(chunk_ids) in [0, 1]:
         raise Exception("This s not possible, are you running multiple instances of this script?")
@@ -116,6 +117,9 @@ def remove_all_but_one_chunk(chunk_path: str):
     print(f"Deleting {len(chunk_ids)} duplicate instance(s) for {chunk_path}.")
     if not DEBUG:
         ChunkRegistry.objects.filter(id__in=chunk_ids).delete()
+        # a queryset delete does not update the dashboards' daily data volumes.
+        for participant_id in {participant_id for _, participant_id in chunks}:
+            DailyDataVolume.rebuild(participant_id)
 
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ _path.insert(1, _one_folder_up)
 from config import load_django
 from datetime import datetime
 
-from database.data_access_models import ChunkRegistry
+from database.data_access_models import ChunkRegistry, DailyDataVolume
 from libs.s3 import conn, S3_BUCKET
 
 print("start:", datetime.now())
@@ -19,13 +19,27 @@ if study_object_ids:
     filters["study__object_id__in"] = study_object_ids
 
 # this could be a huge query, use the iterator
-query = ChunkRegistry.objects.filter(**filters).values_list("pk", "chunk_path").iterator()
+query = ChunkRegistry.objects.filter(**filters).values_list("pk", "chunk_path", "participant_id").iterator()
 
+# a queryset update does not update the dashboards' daily data volumes, the participants whose
+# chunks changed are rebuilt every 1000 chunks (so that stopping the script loses little).
+changed_participant_ids = set()
 
-for i, (pk, path) in enumerate(query):
+
+def rebuild_daily_data_volumes():
+    for participant_id in changed_participant_ids:
+        DailyDataVolume.rebuild(participant_id)
+    changed_participant_ids.clear()
+
+
+for i, (pk, path, participant_id) in enumerate(query):
     if i % 1000 == 0:
         print(i)
+        rebuild_daily_data_volumes()
     size = conn.head_object(Bucket=S3_BUCKET, Key=path)["ContentLength"]
     ChunkRegistry.objects.filter(pk=pk).update(file_size=size)
+    changed_participant_ids.add(participant_id)
+
+rebuild_daily_data_volumes()
 
 print("end:", datetime.now())
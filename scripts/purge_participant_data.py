@@ -18,9 +18,10 @@ _imp.load_source("__init__", _current_folder_init)
 # noinspection PyUnresolvedReferences
 from config import load_django
 from config.settings import S3_BUCKET
-from config.constants import CHUNKS_FOLDER, API_TIME_FORMAT
+from config.constants import CHUNKS_FOLDER, API_TIME_FORMAT, SERVER_SUMMARY_STREAMS
 from database.user_models import Participant
-from database.data_access_models import ChunkRegistry
+from database.data_access_models import (ChunkRegistry, DailyDataVolume, PipelineSummaryValue,
+    SummarizedDay, SurveyAnswerFile)
 from libs.file_processing import unix_time_to_string
 from libs.s3 import s3_list_files, s3_list_versions, conn as s3_conn
 
@@ -117,6 +118,14 @@ def delete_chunk_registries(sorted_data):
         date = convert_date(date)
         participant = Participant.objects.filter(patient_id=patient_id)
         ChunkRegistry.objects.filter(participant=participant, time_bin__gte=date).delete()
+        for participant_id in participant.values_list("pk", flat=True):
+            DailyDataVolume.rebuild(participant_id)
+        # the summaries computed on the server from the deleted data.
+        SummarizedDay.objects.filter(participant=participant, date__gte=date.date()).delete()
+        PipelineSummaryValue.objects.filter(
+            participant=participant, participant__study__server_summaries=True, date__gte=date.date(),
+            data_stream__in=SERVER_SUMMARY_STREAMS,
+        ).delete()
 
 
 def assemble_deletable_files(sorted_data):
@@ -206,3 +215,8 @@ deletable_files = assemble_deletable_files(setup_data)
 
 delete_versions(deletable_files)
 
+# the deleted survey answers files (paths start with the study folder) are no longer shown in the app.
+SurveyAnswerFile.forget(
+    [file_path.split("/", 1)[1] for file_path in deletable_files if "/surveyAnswers/" in file_path]
+)
+
@@ -50,6 +50,7 @@ from datetime import datetime, timedelta
 
 from config.constants import FILE_PROCESS_PAGE_SIZE
 from database.user_models import Participant
+from libs.db_connections import format_connection_metrics
 from libs.file_processing import do_process_user_file_chunks
 from libs.sentry import make_error_sentry
 
@@ -159,6 +160,7 @@ def celery_process_file_chunks(participant_id):
             starting_length = participant.files_to_process.exclude(deleted=True).count()
 
             print("%s processing %s, %s files remaining" % (datetime.now(), participant.patient_id, starting_length))
+            print(format_connection_metrics())
             number_bad_files += do_process_user_file_chunks(
                     count=FILE_PROCESS_PAGE_SIZE,
                     error_handler=error_sentry,
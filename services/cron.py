@@ -7,6 +7,10 @@ path.insert(0, abspath(__file__).rsplit('/', 2)[0])
 from sys import argv
 from cronutils import run_tasks
 from services.celery_data_processing import create_file_processing_tasks
+from database.profiling_models import UploadTracking
+from libs.export_bundles import build_export_bundles
+from libs.gps_summaries import build_gps_summaries
+from libs.resampled_chunks import build_resampled_chunks
 from pipeline import index
 
 FIVE_MINUTES = "five_minutes"
@@ -15,15 +19,24 @@ FOUR_HOURLY = "four_hourly"
 DAILY = "daily"
 WEEKLY = "weekly"
 MONTHLY = "monthly"
-VALID_ARGS = [FIVE_MINUTES, HOURLY, FOUR_HOURLY, DAILY, WEEKLY, MONTHLY]
+# derived data that is built in the background, each in its own run so that one of them falling
+# behind does not hold up the others or the daily tasks.
+EXPORT_BUNDLES = "export_bundles"
+RESAMPLED_CHUNKS = "resampled_chunks"
+GPS_SUMMARIES = "gps_summaries"
+VALID_ARGS = [FIVE_MINUTES, HOURLY, FOUR_HOURLY, DAILY, WEEKLY, MONTHLY, EXPORT_BUNDLES, RESAMPLED_CHUNKS,
+              GPS_SUMMARIES]
 
 TASKS = {
     FIVE_MINUTES: [create_file_processing_tasks],
     HOURLY: [index.hourly],
     FOUR_HOURLY: [],
-    DAILY: [index.daily],
+    DAILY: [index.daily, UploadTracking.compact],
     WEEKLY: [index.weekly],
     MONTHLY: [index.monthly],
+    EXPORT_BUNDLES: [build_export_bundles],
+    RESAMPLED_CHUNKS: [build_resampled_chunks],
+    GPS_SUMMARIES: [build_gps_summaries],
 }
 
 TIME_LIMITS = {
@@ -32,6 +45,10 @@ TIME_LIMITS = {
     FOUR_HOURLY: 10*60*60*24*365,  # 10 years (never kill)
     DAILY: 10*60*60*24*365,        # 10 years (never kill)
     WEEKLY: 10*60*60*24*365,       # 10 years (never kill)
+    # these run daily and build a limited amount per run, see their *_PER_RUN settings.
+    EXPORT_BUNDLES: 60*60*20,      # 20 hours
+    RESAMPLED_CHUNKS: 60*60*20,    # 20 hours
+    GPS_SUMMARIES: 60*60*20,       # 20 hours
 }
 
 KILL_TIMES = TIME_LIMITS